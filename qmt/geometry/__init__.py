@@ -3,8 +3,16 @@
 
 """Geometry generation and handling."""
 
-from .property_map import PropertyMap, MaterialPropertyMap
-from .geo_2d_data import Geo2DData
+from .property_map import (
+    PropertyMap,
+    MaterialPropertyMap,
+    MultiMaterialPropertyMap,
+    PartIndexer,
+)
+from .geo_2d_data import Geo2DData, Geo2DPartMap
 from .geo_3d_data import Geo3DData
-from .builder_3d import build_3d_geometry
+from .voxel_map import VoxelPartMap, voxelize_parts
+from .geo_cache import GeometryCache
+from .builder_3d import build_3d_geometry, build_3d_geometry_sweep
 from .builder_2d import build_2d_geometry
+from .layout_import import read_gds, layout_to_geo2d, geo2d_to_sketches
@@ -2,11 +2,15 @@
 The Geo3DBuilder class, which is used to build 3D geometries
 """
 
-from typing import Dict, List, Optional
-from qmt.infrastructure import serialize_file
+import itertools
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from qmt.infrastructure import SerialBlob, as_serial_blob, serialize_file
 import FreeCAD
 from .part_3d import Geo3DPart
 from .geo_3d_data import Geo3DData
+from .geo_cache import GeometryCache, geometry_key
+from qmt.geometry.freecad.buildCache import PartBuildCache
 from qmt.geometry.freecad.objectConstruction import build
 
 
@@ -14,8 +18,14 @@ def build_3d_geometry(
     input_parts: List[Geo3DPart],
     input_file: Optional[str] = None,
     xsec_dict: Dict[str, Dict] = None,
-    serialized_input_file: Optional[bytes] = None,
+    serialized_input_file: Optional[Union[SerialBlob, bytes, str]] = None,
     params: Optional[Dict] = None,
+    cache: Optional[GeometryCache] = None,
+    build_cache: Optional[PartBuildCache] = None,
+    litho_workers: Optional[int] = None,
+    export_workers: Optional[int] = None,
+    lazy_export: bool = False,
+    mesh_options: Optional[Dict] = None,
 ) -> Geo3DData:
     """Build a geometry in 3D.
 
@@ -33,9 +43,11 @@ def build_3d_geometry(
         defining the axis that defines the normal of the cross section, and distance is
         the length along the axis used to set the cross section.
         (Default value = None)
-    serialized_input_file : bytes
+    serialized_input_file : SerialBlob
         FreeCAD template file that has been serialized using
-        qmt.infrastructure.serialize_file. This is useful for passing a
+        qmt.infrastructure.serialize_file. Raw file contents as bytes and
+        base64 strings from earlier qmt versions are accepted as well.
+        This is useful for passing a
         file into a docker container or other environment that
         doesn't have access to a shared drive. Either this or
         input_file must be set (but not both).
@@ -43,6 +55,33 @@ def build_3d_geometry(
     params : dict
         Dictionary of parameters to use in FreeCAD.
         (Default value = None)
+    cache : GeometryCache
+        Cache of previous builds. If the same inputs were built before, the cached
+        geometry is returned instead of running FreeCAD.
+        (Default value = None)
+    build_cache : PartBuildCache
+        In-memory cache of individual built parts. Parts whose sketches, spreadsheet
+        aliases and upstream parts are unchanged since an earlier build with the same
+        build_cache are reused instead of rebuilt.
+        (Default value = None)
+    litho_workers : int
+        If set, the lithography depositions of each layer are computed in parallel
+        in this many spawned worker processes, which import the main module, so
+        scripts must build under an ``if __name__ == "__main__":`` guard.
+        (Default value = None)
+    export_workers : int
+        If set, the STEP and STL exports of the built parts run in parallel in this
+        many spawned worker processes, which need the same ``__main__`` guard.
+        (Default value = None)
+    lazy_export : bool
+        If True, parts store their BRep instead of STEP and STL blobs, which are
+        only produced when write_stp or write_stl is called.
+        (Default value = False)
+    mesh_options : dict
+        Tessellation options of the STL exports, i.e. linearDeflection,
+        angularDeflection and binary as accepted by
+        qmt.geometry.freecad.fileIO.exportMeshed.
+        (Default value = None, the FreeCAD defaults)
     Returns
     -------
     Geo3DData instance
@@ -55,16 +94,37 @@ def build_3d_geometry(
     elif input_file is not None:
         serial_fcdoc = serialize_file(input_file)
     else:
-        serial_fcdoc = serialized_input_file
+        serial_fcdoc = as_serial_blob(serialized_input_file)
     if params is None:
         params = {}
     if xsec_dict is None:
         xsec_dict = {}
+    if cache is not None:
+        key = geometry_key(
+            serial_fcdoc,
+            input_parts,
+            params,
+            xsec_dict,
+            mesh_options=mesh_options,
+            lazy_export=lazy_export,
+        )
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
     options_dict = {}
     options_dict["serial_fcdoc"] = serial_fcdoc
     options_dict["input_parts"] = input_parts
     options_dict["params"] = params
     options_dict["xsec_dict"] = xsec_dict
+    if build_cache is not None:
+        options_dict["build_cache"] = build_cache
+    if litho_workers:
+        options_dict["litho_workers"] = litho_workers
+    if export_workers:
+        options_dict["export_workers"] = export_workers
+    options_dict["lazy_export"] = lazy_export
+    if mesh_options:
+        options_dict["mesh_options"] = mesh_options
 
     data = Geo3DData()
     data.serial_fcdoc = serial_fcdoc
@@ -76,4 +136,248 @@ def build_3d_geometry(
         FreeCAD.closeDocument("instance")
         raise
     FreeCAD.closeDocument("instance")
+    if cache is not None:
+        cache.put(key, built)
     return built
+
+
+# FreeCAD works on a single global "instance" document, so builds within one process
+# must not overlap.
+_build_lock = threading.Lock()
+
+# Sweep points built by the same worker usually share most of their parts
+_worker_build_cache = PartBuildCache(max_entries=256)
+
+
+def _build_sweep_point(
+    index: int,
+    input_parts: List[Geo3DPart],
+    serial_fcdoc: SerialBlob,
+    params: Dict,
+    xsec_dict: Dict[str, Dict],
+    cache: Optional[GeometryCache] = None,
+) -> Tuple[int, Geo3DData]:
+    """Build one point of a geometry sweep. This runs inside a worker process.
+
+    Parameters
+    ----------
+    index : int
+        Index of the sweep point.
+    input_parts : list
+        Ordered list of input parts.
+    serial_fcdoc : SerialBlob
+        Serialized FreeCAD template file.
+    params : dict
+        Dictionary of parameters to use in FreeCAD.
+    xsec_dict : dict
+        Dictionary of cross-section specifications.
+    cache : GeometryCache
+        Optional cache of previous builds. (Default value = None)
+    Returns
+    -------
+    Tuple of index and Geo3DData instance
+
+    """
+    with _build_lock:
+        geo = build_3d_geometry(
+            input_parts=input_parts,
+            serialized_input_file=serial_fcdoc,
+            params=params,
+            xsec_dict=xsec_dict,
+            cache=cache,
+            build_cache=_worker_build_cache,
+        )
+    return index, geo
+
+
+def _expand_param_grid(param_grid) -> List[Dict]:
+    """Turn a parameter grid into a list of parameter dicts.
+
+    Parameters
+    ----------
+    param_grid : dict or list
+        Either a list of parameter dicts, or a dict mapping each parameter name to a
+        sequence of values, in which case the cartesian product is taken.
+    Returns
+    -------
+    List of parameter dicts
+
+    """
+    if isinstance(param_grid, dict):
+        names = list(param_grid)
+        return [
+            dict(zip(names, values))
+            for values in itertools.product(*(param_grid[n] for n in names))
+        ]
+    return [dict(params) for params in param_grid]
+
+
+def build_3d_geometry_sweep(
+    input_parts: List[Geo3DPart],
+    input_file: Optional[str] = None,
+    param_grid: Union[Dict[str, Sequence], Sequence[Dict]] = None,
+    xsec_dict: Dict[str, Dict] = None,
+    serialized_input_file: Optional[Union[SerialBlob, bytes, str]] = None,
+    n_workers: Optional[int] = None,
+    dask_client=None,
+    max_pending: Optional[int] = None,
+    cache: Optional[GeometryCache] = None,
+) -> Iterator[Tuple[int, Dict, Geo3DData]]:
+    """Build a 3D geometry for every parameter set of a sweep in parallel.
+
+    The builds run in separate worker processes, each of which owns its own FreeCAD
+    document, either in a local process pool or on a dask cluster. Results are yielded
+    as soon as they complete, and at most `max_pending` builds are in flight at any
+    time, so memory use stays bounded for long sweeps.
+
+    Local workers are spawned processes that import the main module, so scripts
+    must call this under an ``if __name__ == "__main__":`` guard.
+
+    Parameters
+    ----------
+    input_parts : list
+        Ordered list of input parts, leftmost items get built first
+    input_file : str
+        Path to FreeCAD template file. Either this or serialized_input_file
+        must be set (but not both).
+        (Default value = None)
+    param_grid : dict or list
+        Either a list of parameter dicts, one per sweep point, or a dict mapping each
+        parameter name to a sequence of values, in which case the sweep covers the
+        cartesian product of all values.
+    xsec_dict : dict
+        Dictionary of cross-section specifications, see build_3d_geometry.
+        (Default value = None)
+    serialized_input_file : SerialBlob
+        FreeCAD template file that has been serialized using
+        qmt.infrastructure.serialize_file. Either this or input_file must be set
+        (but not both).
+        (Default value = None)
+    n_workers : int
+        Number of local worker processes. Ignored if dask_client is given.
+        (Default value = None, i.e. the number of CPUs)
+    dask_client : distributed.Client
+        Client of a dask cluster to run the builds on. Its workers must run a single
+        thread each, since builds within one process are serialized.
+        (Default value = None)
+    max_pending : int
+        Maximum number of builds submitted but not yet yielded.
+        (Default value = None, i.e. twice the number of workers)
+    cache : GeometryCache
+        Cache of previous builds, shared by all workers. Its directory must be
+        reachable from the workers. (Default value = None)
+    Returns
+    -------
+    Iterator over tuples (index, params, Geo3DData instance), in completion order.
+
+    """
+    if input_file is None and serialized_input_file is None:
+        raise ValueError("One of input_file or serialized_input_file must be non-none.")
+    elif input_file is not None and serialized_input_file is not None:
+        raise ValueError("Both input_file and serialized_input_file were non-none.")
+    elif input_file is not None:
+        serial_fcdoc = serialize_file(input_file)
+    else:
+        serial_fcdoc = as_serial_blob(serialized_input_file)
+    if param_grid is None:
+        raise ValueError("param_grid must be given.")
+    if xsec_dict is None:
+        xsec_dict = {}
+    param_list = _expand_param_grid(param_grid)
+
+    if dask_client is not None:
+        return _sweep_dask(
+            dask_client,
+            input_parts,
+            serial_fcdoc,
+            param_list,
+            xsec_dict,
+            max_pending,
+            cache,
+        )
+    return _sweep_local(
+        n_workers, input_parts, serial_fcdoc, param_list, xsec_dict, max_pending, cache
+    )
+
+
+def _sweep_local(
+    n_workers, input_parts, serial_fcdoc, param_list, xsec_dict, max_pending, cache
+):
+    """Run a geometry sweep in a local process pool. See build_3d_geometry_sweep."""
+    import concurrent.futures
+    import multiprocessing
+    import os
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 2 * n_workers
+    # spawn, so that workers don't inherit the FreeCAD state of this process
+    context = multiprocessing.get_context("spawn")
+    point_iter = iter(enumerate(param_list))
+    with concurrent.futures.ProcessPoolExecutor(n_workers, mp_context=context) as pool:
+
+        def _submit(pending):
+            for index, params in itertools.islice(
+                point_iter, max_pending - len(pending)
+            ):
+                pending.add(
+                    pool.submit(
+                        _build_sweep_point,
+                        index,
+                        input_parts,
+                        serial_fcdoc,
+                        params,
+                        xsec_dict,
+                        cache,
+                    )
+                )
+
+        pending = set()
+        _submit(pending)
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                index, geo = future.result()
+                yield index, param_list[index], geo
+            _submit(pending)
+
+
+def _sweep_dask(
+    client, input_parts, serial_fcdoc, param_list, xsec_dict, max_pending, cache
+):
+    """Run a geometry sweep on a dask cluster. See build_3d_geometry_sweep."""
+    from distributed import as_completed
+
+    if max_pending is None:
+        max_pending = 2 * max(1, len(client.scheduler_info()["workers"]))
+    # Ship the template and part specifications to the workers only once
+    [serial_future, parts_future] = client.scatter(
+        [serial_fcdoc, input_parts], broadcast=True
+    )
+    point_iter = iter(enumerate(param_list))
+
+    def _submit(count):
+        return [
+            client.submit(
+                _build_sweep_point,
+                index,
+                parts_future,
+                serial_future,
+                params,
+                xsec_dict,
+                cache,
+                pure=False,
+            )
+            for index, params in itertools.islice(point_iter, count)
+        ]
+
+    completed = as_completed(_submit(max_pending))
+    for future in completed:
+        index, geo = future.result()
+        future.release()
+        yield index, param_list[index], geo
+        for new_future in _submit(1):
+            completed.add(new_future)
@@ -14,6 +14,122 @@ from xml.etree import ElementTree
 import FreeCAD
 
 
+# Nesting depth of deferredRecompute blocks and recompute counters
+_deferDepth = 0
+_recomputeStats = {"requested": 0, "performed": 0, "partial": 0}
+
+
+def recompute(doc=None):
+    """Recompute a document, unless recomputes are deferred by deferredRecompute.
+
+    Parameters
+    ----------
+    doc : FreeCAD.App.Document
+        (Default value = None, the active document)
+
+    Returns
+    -------
+    None
+
+    """
+    _recomputeStats["requested"] += 1
+    if _deferDepth > 0:
+        return
+    if doc is None:
+        doc = FreeCAD.ActiveDocument
+    doc.recompute()
+    _recomputeStats["performed"] += 1
+
+
+def isDirty(obj):
+    """Checks if an object or any of its dependencies needs a recompute.
+
+    Parameters
+    ----------
+    obj : FreeCAD.App.DocumentObject
+        A FreeCAD object.
+
+    Returns
+    -------
+    Boolean
+
+    """
+    return any("Touched" in o.State for o in [obj] + obj.OutListRecursive)
+
+
+def ensureRecomputed(*objs):
+    """Recompute only the given objects and their dependencies if they are dirty.
+    Call this before reading the shape of an object inside deferredRecompute;
+    outside of it this is a no-op.
+
+    Parameters
+    ----------
+    objs : FreeCAD.App.DocumentObject
+        FreeCAD objects.
+
+    Returns
+    -------
+    None
+
+    """
+    if _deferDepth == 0:
+        return
+    dirty = [obj for obj in objs if obj is not None and isDirty(obj)]
+    if not dirty:
+        return
+    doc = dirty[0].Document
+    try:
+        doc.recompute(dirty)
+    except TypeError:  # FreeCAD < 0.19 can't restrict recomputes to objects
+        recompute(doc)
+    _recomputeStats["partial"] += 1
+
+
+@contextlib.contextmanager
+def deferredRecompute(doc=None):
+    """Suppress the document recomputes of construction helpers within a block.
+
+    Objects are recomputed on demand by ensureRecomputed right before their shapes
+    are read, and the whole document once at the end of the outermost block.
+
+    Parameters
+    ----------
+    doc : FreeCAD.App.Document
+        (Default value = None, the active document)
+
+    """
+    global _deferDepth
+    if doc is None:
+        doc = FreeCAD.ActiveDocument
+    _deferDepth += 1
+    try:
+        yield
+    finally:
+        _deferDepth -= 1
+        if _deferDepth == 0:
+            recompute(doc)
+
+
+def recomputeStats():
+    """Return the recompute counters.
+
+    Returns
+    -------
+    dict with the number of requested, performed (full) and partial recomputes,
+    and the number of full recomputes saved by deferral.
+
+    """
+    stats = dict(_recomputeStats)
+    stats["saved"] = stats["requested"] - stats["performed"]
+    return stats
+
+
+def resetRecomputeStats():
+    """Reset the recompute counters."""
+    for key in _recomputeStats:
+        _recomputeStats[key] = 0
+
+
 def delete(obj):
     """Delete an object by FreeCAD name.
 
@@ -29,7 +145,7 @@ def delete(obj):
     """
     doc = FreeCAD.ActiveDocument
     doc.removeObject(obj.Name)
-    doc.recompute()
+    recompute(doc)
 
 
 def _deepRemove_impl(obj):
@@ -77,7 +193,7 @@ def deepRemove(obj=None, name=None, label=None):
     else:
         raise RuntimeError("No object selected!")
     _deepRemove_impl(obj)
-    doc.recompute()
+    recompute(doc)
 
 
 @contextlib.contextmanager
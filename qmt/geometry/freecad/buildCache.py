@@ -0,0 +1,242 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Dependency tracking and shape caching for incremental 3D builds."""
+
+import hashlib
+import re
+from collections import OrderedDict
+
+from qmt.geometry import part_3d
+from qmt.geometry.geo_cache import canonical
+from qmt.geometry.freecad.shapeUtils import shapeHash
+
+# Matches spreadsheet references in expressions, e.g. modelParams.d1 or <<Params>>.d1
+_expressionReference = re.compile(r"(?:<<([^>]+)>>|([A-Za-z_]\w*))\.([A-Za-z_]\w*)")
+
+
+def consumedObjects(doc, part):
+    """Return all document objects a Geo3DPart is built from.
+
+    Parameters
+    ----------
+    doc : FreeCAD.App.Document
+        The document the part is built in.
+    part : Geo3DPart
+        Input part.
+
+    Returns
+    -------
+    List of objects, including everything they depend on recursively.
+
+    """
+    fcNames = [part.fc_name]
+    if isinstance(part, part_3d.WireShellPart):
+        fcNames.append(part.target_wire.fc_name)
+    objs = []
+    todo = [doc.getObject(name) for name in fcNames]
+    while todo:
+        obj = todo.pop()
+        if obj is None or obj in objs:
+            continue
+        objs.append(obj)
+        todo += obj.OutList
+    return objs
+
+
+def consumedAliases(doc, objs):
+    """Return the spreadsheet cells referenced by expressions of the given objects.
+
+    Parameters
+    ----------
+    doc : FreeCAD.App.Document
+
+    objs : list
+        Document objects.
+
+    Returns
+    -------
+    Set of (spreadsheet name, alias) tuples.
+
+    """
+    sheets = {}
+    for obj in doc.Objects:
+        if obj.TypeId == "Spreadsheet::Sheet":
+            sheets[obj.Name] = obj
+            sheets[obj.Label] = obj
+    aliases = set()
+    for obj in objs:
+        for _, expression in getattr(obj, "ExpressionEngine", []):
+            for label, name, alias in _expressionReference.findall(expression):
+                sheet = sheets.get(label or name)
+                if sheet is not None:
+                    aliases.add((sheet.Name, alias))
+    return aliases
+
+
+def partDependencies(doc, part):
+    """Describe the sketches and spreadsheet aliases a Geo3DPart consumes.
+
+    Parameters
+    ----------
+    doc : FreeCAD.App.Document
+
+    part : Geo3DPart
+        Input part.
+
+    Returns
+    -------
+    dict with the sorted lists "objects" (object names) and "aliases"
+    ((spreadsheet, alias) tuples).
+
+    """
+    objs = consumedObjects(doc, part)
+    return {
+        "objects": sorted(obj.Name for obj in objs),
+        "aliases": sorted(consumedAliases(doc, objs)),
+    }
+
+
+class PartBuildCache:
+    """Cache of built part shapes and exports that is shared between calls to build.
+
+    Built parts are stored as plain Part.Shape copies under keys that hash everything
+    the part consumes: its specification, the geometry of its sketches after the
+    parameter update and the spreadsheet aliases those sketches reference. Parts on
+    a lithography stack also depend on all other stack members and their substrates,
+    and the result after overlap subtraction depends on the earlier parts whose
+    bounding boxes intersect it. A rebuild thus only recomputes parts whose inputs
+    changed, plus anything downstream of them.
+
+    Parameters
+    ----------
+    max_entries : int
+        Maximum number of cached entries; the least recently used ones are dropped
+        first. (Default value = 1000)
+
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, field):
+        """Return a cached value or None.
+
+        Parameters
+        ----------
+        key : str
+
+        field : str
+            "shape", "stp" or "stl".
+
+        Returns
+        -------
+        Cached value (a copy for shapes) or None.
+
+        """
+        entry = self.entries.get(key)
+        if entry is None or field not in entry:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        value = entry[field]
+        return value.copy() if field == "shape" else value
+
+    def put(self, key, field, value):
+        """Store a value, copying shapes so that later document changes don't leak in.
+
+        Parameters
+        ----------
+        key : str
+
+        field : str
+            "shape", "stp" or "stl".
+        value :
+
+
+        Returns
+        -------
+        None
+
+        """
+        entry = self.entries.setdefault(key, {})
+        entry[field] = value.copy() if field == "shape" else value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        """Return the hit/miss counters and the number of entries."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+    def inputKeys(self, doc, input_parts):
+        """Compute the input key of every part to be built.
+
+        Parameters
+        ----------
+        doc : FreeCAD.App.Document
+            Document after the parameter update.
+        input_parts : list
+            Input parts in build order.
+
+        Returns
+        -------
+        dict from part label to key.
+
+        """
+        baseKeys = {}
+        for part in input_parts:
+            objs = consumedObjects(doc, part)
+            digest = hashlib.sha256(repr(canonical(part)).encode())
+            for obj in objs:
+                digest.update(obj.Name.encode())
+                if hasattr(obj, "Shape"):
+                    digest.update(shapeHash(obj.Shape).encode())
+            for sheetName, alias in sorted(consumedAliases(doc, objs)):
+                value = doc.getObject(sheetName).get(alias)
+                digest.update(repr((sheetName, alias, value)).encode())
+            baseKeys[part.label] = digest.hexdigest()
+
+        lithoParts = [p for p in input_parts if isinstance(p, part_3d.LithographyPart)]
+        substrateLabels = sorted({b.label for p in lithoParts for b in p.litho_base})
+        keys = {}
+        for part in input_parts:
+            if isinstance(part, part_3d.LithographyPart):
+                # Every litho part depends on the whole stack and its substrate
+                stack = [baseKeys[p.label] for p in lithoParts]
+                stack += [keys.get(l, baseKeys.get(l, l)) for l in substrateLabels]
+                digest = hashlib.sha256(baseKeys[part.label].encode())
+                digest.update(repr(stack).encode())
+                keys[part.label] = digest.hexdigest()
+            else:
+                keys[part.label] = baseKeys[part.label]
+        return keys
+
+    @staticmethod
+    def resultKey(inputKey, shape, earlierParts):
+        """Compute the key of a part after subtracting earlier parts from it.
+
+        Parameters
+        ----------
+        inputKey : str
+            Input key of the part.
+        shape : Part.Shape
+            Shape of the part before subtraction.
+        earlierParts : list
+            (key, shape) tuples of the earlier non-virtual parts after subtraction.
+
+        Returns
+        -------
+        str
+
+        """
+        digest = hashlib.sha256(inputKey.encode())
+        for key, otherShape in earlierParts:
+            # Parts with disjoint bounding boxes can't change the result
+            if shape.BoundBox.intersect(otherShape.BoundBox):
+                digest.update(key.encode())
+        return digest.hexdigest()
@@ -4,28 +4,81 @@
 
 """Functions that deal with file i/o."""
 
+import concurrent.futures
+import contextlib
+import functools
+import multiprocessing
+import logging
 import os
-from typing import Sequence
+import struct
+import time
+from typing import Optional, Sequence
 
+import FreeCAD
 import Part
 import Mesh
 
 from .auxiliary import silent_stdout
+from .shapeUtils import fromBrep
 
+# Tessellation defaults of exportMeshed when only some options are given
+_defaultLinearDeflection = 0.1
+_defaultAngularDeflection = 0.5
 
-def exportMeshed(obj_list: Sequence, file_name: str):
+
+def _stlTriangleCount(path: str) -> int:
+    """Count the triangles of an STL file without parsing the mesh.
+
+    Binary files store the count in their header, ASCII files are scanned for the
+    end of each facet.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(84)
+        if len(header) == 84:
+            (count,) = struct.unpack("<I", header[80:])
+            if size == 84 + 50 * count:
+                return count
+        f.seek(0)
+        return sum(line.strip() == b"endfacet" for line in f)
+
+
+def exportMeshed(
+    obj_list: Sequence,
+    file_name: str,
+    linearDeflection: Optional[float] = None,
+    angularDeflection: Optional[float] = None,
+    binary: Optional[bool] = None,
+    merge: bool = True,
+):
     """Export a STL 3D Mesh file.
 
+    Without any deflection option, the objects are meshed with the FreeCAD
+    defaults. Otherwise each shape is tessellated with MeshPart.meshFromShape.
+
     Parameters
     ----------
     obj_list : list
         List of objects to export.
     file_name : str
         Name of file to create and export into.
+    linearDeflection : float
+        Maximum distance between the mesh and the surface, in model units.
+        (Default value = None)
+    angularDeflection : float
+        Maximum angle between the normals of adjacent triangles on curved
+        surfaces, in radians. (Default value = None)
+    binary : bool
+        Whether to write binary or ASCII STL. (Default value = None, the FreeCAD
+        default)
+    merge : bool
+        Whether to write all objects into file_name, or every object into its own
+        file "<file_name stem>_<object label>.stl". (Default value = True)
 
     Returns
     -------
-    None
+    dict with the written "files", the "triangles" per file and the export "time"
+    in seconds.
 
     """
     if not isinstance(obj_list, list):
@@ -39,16 +92,63 @@ def exportMeshed(obj_list: Sequence, file_name: str):
     # meshedObj.Mesh=Mesh.Mesh(obj.Shape.tessellate(0.01))
     # meshedObj.Mesh.write(fileName,"STL",meshedObj.Name)
     supported_ext = ".stl"
-    if file_name.endswith(supported_ext):
-        with silent_stdout():
-            Mesh.export(obj_list, file_name)
-    else:
+    if not file_name.endswith(supported_ext):
         raise ValueError(
             file_name
             + " is not a supported extension ("
             + ", ".join(supported_ext)
             + ")"
         )
+    start = time.perf_counter()
+    if merge:
+        groups = [(obj_list, file_name)]
+    else:
+        stem = file_name[: -len(supported_ext)]
+        groups = [([obj], f"{stem}_{obj.Label}{supported_ext}") for obj in obj_list]
+    triangles = {}
+    if linearDeflection is None and angularDeflection is None:
+        for objs, path in groups:
+            with silent_stdout():
+                Mesh.export(objs, path)
+            if binary is None:
+                triangles[path] = _stlTriangleCount(path)
+                continue
+            # Keep the default tessellation and only change the writer
+            mesh = Mesh.Mesh(path)
+            with silent_stdout():
+                mesh.write(path, "AST" if binary is False else "STL")
+            triangles[path] = mesh.CountFacets
+    else:
+        import MeshPart
+
+        if linearDeflection is None:
+            linearDeflection = _defaultLinearDeflection
+        if angularDeflection is None:
+            angularDeflection = _defaultAngularDeflection
+        meshOptions = {
+            "LinearDeflection": linearDeflection,
+            "AngularDeflection": angularDeflection,
+            "Relative": False,
+        }
+        for objs, path in groups:
+            mesh = Mesh.Mesh()
+            for obj in objs:
+                mesh.addMesh(MeshPart.meshFromShape(Shape=obj.Shape, **meshOptions))
+            with silent_stdout():
+                mesh.write(path, "AST" if binary is False else "STL")
+            triangles[path] = mesh.CountFacets
+    report = {
+        "files": [path for _, path in groups],
+        "triangles": triangles,
+        "time": time.perf_counter() - start,
+    }
+    logging.debug(
+        "exported %d triangles to %s in %.3f s",
+        sum(triangles.values()),
+        file_name,
+        report["time"],
+    )
+    return report
 
 
 def exportCAD(obj_list: Sequence, file_name: str):
@@ -80,3 +180,92 @@ def exportCAD(obj_list: Sequence, file_name: str):
             + ", ".join(supported_ext)
             + ")"
         )
+
+
+@contextlib.contextmanager
+def _temporaryDocument():
+    """Provide a scratch document and restore the active document afterwards."""
+    active = FreeCAD.ActiveDocument
+    doc = FreeCAD.newDocument()
+    try:
+        yield doc
+    finally:
+        FreeCAD.closeDocument(doc.Name)
+        if active is not None:
+            FreeCAD.setActiveDocument(active.Name)
+
+
+def serializeBreps(
+    breps: Sequence, labels: Sequence, ext_format: str, meshOptions=None
+):
+    """Export BRep-serialized shapes into a single STEP or STL blob.
+
+    Several shapes give a multi-part file with one part per shape.
+
+    Parameters
+    ----------
+    breps : list
+        BRep strings of the shapes.
+    labels : list
+        Part labels, in the same order.
+    ext_format : str
+        "stp" or "stl".
+    meshOptions : dict
+        Tessellation keyword arguments of exportMeshed. (Default value = None)
+
+    Returns
+    -------
+    SerialBlob
+
+    """
+    from qmt.infrastructure import store_serial
+
+    exportFct = {
+        "stp": exportCAD,
+        "stl": functools.partial(exportMeshed, **(meshOptions or {})),
+    }[ext_format]
+    with _temporaryDocument() as doc:
+        objs = []
+        for brep, label in zip(breps, labels):
+            obj = doc.addObject("Part::Feature", "Part")
+            obj.Shape = fromBrep(brep)
+            obj.Label = label
+            objs.append(obj)
+        return store_serial(objs, exportFct, ext_format)
+
+
+def exportBreps(
+    items: Sequence, formats=("stp", "stl"), n_workers=None, meshOptions=None
+):
+    """Export BRep-serialized shapes to separate blobs in parallel worker processes.
+
+    Parameters
+    ----------
+    items : list
+        (label, BRep string) tuples.
+    formats : tuple
+        Formats to export every shape to. (Default value = ("stp", "stl"))
+    n_workers : int
+        Number of worker processes. (Default value = None, the number of CPUs)
+    meshOptions : dict
+        Tessellation keyword arguments of exportMeshed. (Default value = None)
+
+    Returns
+    -------
+    List of dicts from format to SerialBlob, in the order of items.
+
+    """
+    results = [{} for _ in items]
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(n_workers, mp_context=context) as pool:
+        futures = {}
+        for i, (label, brep) in enumerate(items):
+            for ext_format in formats:
+                future = pool.submit(
+                    serializeBreps, [brep], [label], ext_format, meshOptions
+                )
+                futures[future] = (i, ext_format)
+        for future in concurrent.futures.as_completed(futures):
+            i, ext_format = futures[future]
+            results[i][ext_format] = future.result()
+    return results
@@ -11,9 +11,13 @@ import Part
 
 from .auxiliary import *
 from .sketchUtils import findSegments
+from . import shapeUtils
 
 vec = FreeCAD.Vector
 
+# Shared by all overlap checks of this process
+overlapCache = shapeUtils.OverlapCache()
+
 
 def extrude_partwb(sketch, length, reverse=False, name=None):
     """Extrude via Part workbench.
@@ -50,7 +54,7 @@ def extrude_partwb(sketch, length, reverse=False, name=None):
     f.TaperAngle = 0.0
     f.TaperAngleRev = 0.0
     # ~ f.Base.ViewObject.hide()
-    doc.recompute()
+    recompute(doc)
     return f
 
 
@@ -92,22 +96,25 @@ def copy_move(obj, moveVec=(0.0, 0.0, 0.0), copy=True):
     -------
     f
     """
+    ensureRecomputed(obj)
     f = Draft.move([obj], vec(moveVec[0], moveVec[1], moveVec[2]), copy=copy)
+    ensureRecomputed(f)
     if f.Shape.Vertexes:
         f.Shape = f.Shape.removeSplitter()  # get rid of redundant lines
-    FreeCAD.ActiveDocument.recompute()
+    recompute()
     return f
 
 
 # ~ # TODO: consuming is questionable because inputs might be needed in a delayed fashion
 def make_solid(obj, consumeInputs=False):
     doc = FreeCAD.ActiveDocument
+    ensureRecomputed(obj)
     shell = obj.Shape.Faces
     shell = Part.Solid(Part.Shell(shell))
     solid = doc.addObject("Part::Feature", obj.Label + "_solid")
     solid.Label = obj.Label + "_solid"
     solid.Shape = shell
-    doc.recompute()
+    recompute(doc)
     del shell, solid
     return solid
 
@@ -140,26 +147,29 @@ def makeHexFace(sketch, zBottom, width):
     dy = y1 - y0
     # First, make the initial face:
     face = Draft.makePolygon(6, radius=width * 0.5, inscribed=False, face=True)
-    doc.recompute()
+    recompute(doc)
     # Spin the face so that its faces are oriented normal to the path:
     alpha = 90 - np.arctan(-dy / dx) * 180.0 / np.pi
     center = vec(0.0, 0.0, 0.0)
     axis = vec(0.0, 0.0, 1.0)
+    ensureRecomputed(face)
     face1 = Draft.rotate(face, alpha, center, axis=axis, copy=True)
-    doc.recompute()
+    recompute(doc)
     # Rotate the wire into the proper plane:
     alpha = 90.0
     center = vec(0.0, 0.0, 0.0)
     axis = vec(-dy, dx, 0)
+    ensureRecomputed(face1)
     face2 = Draft.rotate(face1, 90.0, center, axis=axis, copy=True)
-    doc.recompute()
+    recompute(doc)
     # Finally, move it into position:
     rVec = vec(x0, y0, 0.5 * width + zBottom)
+    ensureRecomputed(face2)
     face3 = Draft.move(face2, rVec, copy=True)
     delete(face)
     delete(face1)
     delete(face2)
-    doc.recompute()
+    recompute(doc)
     return face3
 
 
@@ -188,21 +198,13 @@ def genUnion(objList, consumeInputs=False):
             delete(objList[0])
         return returnObj
     else:
-        union = doc.addObject("Part::MultiFuse")
-        nonZeroList = []
-        for obj in objList:
-            if isNonempty(obj):
-                nonZeroList += [obj]
-        union.Shapes = nonZeroList
-        doc.recompute()  # crucial recompute
-        unionDupe = copy_move(union)
-        unionDupe.Label = objList[0].Label
-        doc.removeObject(union.Name)
-        doc.recompute()
+        shape = shapeUtils.fuse([shapeUtils.shapeOf(obj) for obj in objList])
+        if shape is None:
+            shape = Part.Shape()
+        unionDupe = shapeUtils.addShape(shape, "Union", objList[0].Label)
         if consumeInputs:
             for obj in objList:
                 doc.removeObject(obj.Name)
-            doc.recompute()
         return unionDupe
 
 
@@ -218,6 +220,7 @@ def getBB(obj):
     Tuple of (xMin, xMax, yMin, yMax, zMin, zMax).
 
     """
+    ensureRecomputed(obj)
     xMin = obj.Shape.BoundBox.XMin
     xMax = obj.Shape.BoundBox.XMax
     yMin = obj.Shape.BoundBox.YMin
@@ -250,7 +253,7 @@ def makeBB(BB):
     box.Length = xMax - xMin
     box.Width = yMax - yMin
     box.Height = zMax - zMin
-    doc.recompute()
+    recompute(doc)
     return box
 
 
@@ -272,17 +275,11 @@ def subtract(obj0, obj1, consumeInputs=False):
 
     """
     doc = FreeCAD.ActiveDocument
-    tempObj = doc.addObject("Part::Cut")
-    tempObj.Base = obj0
-    tempObj.Tool = obj1
-    doc.recompute()
-    returnObj = copy_move(tempObj)
-    doc.removeObject(tempObj.Name)
-    doc.recompute()
+    shape = shapeUtils.cut(shapeUtils.shapeOf(obj0), shapeUtils.shapeOf(obj1))
+    returnObj = shapeUtils.addShape(shape, "Cut")
     if consumeInputs:
         doc.removeObject(obj0.Name)
         doc.removeObject(obj1.Name)
-        doc.recompute()
     return returnObj
 
 
@@ -304,8 +301,9 @@ def subtractParts(domainObj, partList):
     doc = FreeCAD.ActiveDocument
     diffObj = copy_move(domainObj)
     for obj in partList:
+        ensureRecomputed(diffObj, obj)
         diffObjTemp = Draft.downgrade([diffObj, obj], delete=True)[0][0]
-        doc.recompute()
+        recompute(doc)
         diffObj = copy_move(diffObjTemp)
         delete(diffObjTemp)
     # TODO : This routine is leaving some nuisance objects around that should be deleted.
@@ -328,22 +326,18 @@ def intersect(objList, consumeInputs=False):
 
     """
     doc = FreeCAD.ActiveDocument
-    intersectTemp = doc.addObject("Part::MultiCommon")
-    intersectTemp.Shapes = objList
-    doc.recompute()
-    returnObj = copy_move(intersectTemp)
-    doc.removeObject(intersectTemp.Name)
-    doc.recompute()
+    shape = shapeUtils.common([shapeUtils.shapeOf(obj) for obj in objList])
+    returnObj = shapeUtils.addShape(shape, "Common")
     if consumeInputs:
         for obj in objList:
             doc.removeObject(obj.Name)
-        doc.recompute()
     return returnObj
 
 
 def checkOverlap(objList):
-    """Checks if a list of objects, when intersected, contains a finite volume.abs
-    Returns true if it does, returns false if the intersection is empty.
+    """Checks if a list of objects, when intersected, contains a finite volume.
+    Returns true if it does, returns false if the intersection is empty or its
+    volume is within the absolute tolerance of shapeUtils.hasCommonVolume.
 
     Parameters
     ----------
@@ -355,13 +349,61 @@ def checkOverlap(objList):
     Boolean
 
     """
-    intObj = intersect(objList)
-    if not intObj.Shape.Vertexes:
-        overlap = False
-    else:
-        overlap = True
-    delete(intObj)
-    return overlap
+    shapes = [shapeUtils.shapeOf(obj) for obj in objList]
+    if len(shapes) == 2:
+        return overlapCache.overlaps(*shapes)
+    return shapeUtils.hasCommonVolume(shapes, overlapCache.tolerance)
+
+
+def checkShapeOverlap(shape0, shape1):
+    """Checks if two shapes intersect, without creating document objects.
+    Shapes with disjoint bounding boxes are rejected without a boolean operation.
+
+    Parameters
+    ----------
+    shape0 : Part.Shape
+
+    shape1 : Part.Shape
+
+
+    Returns
+    -------
+    Boolean
+
+    """
+    return overlapCache.overlaps(shape0, shape1)
+
+
+def findOverlapCandidates(shapes):
+    """Find all pairs of shapes with intersecting bounding boxes by sweep and prune
+    along the x axis.
+
+    Parameters
+    ----------
+    shapes : list
+        Part.Shape objects; None entries are ignored.
+
+    Returns
+    -------
+    Set of index tuples (i, j) with i < j.
+
+    """
+    boxes = [(i, s.BoundBox) for i, s in enumerate(shapes) if s is not None]
+    boxes.sort(key=lambda item: item[1].XMin)
+    candidates = set()
+    active = []
+    for i, box in boxes:
+        active = [(j, other) for j, other in active if other.XMax >= box.XMin]
+        for j, other in active:
+            if (
+                other.YMin <= box.YMax
+                and box.YMin <= other.YMax
+                and other.ZMin <= box.ZMax
+                and box.ZMin <= other.ZMax
+            ):
+                candidates.add((min(i, j), max(i, j)))
+        active.append((i, box))
+    return candidates
 
 
 def isNonempty(obj):
@@ -376,6 +418,7 @@ def isNonempty(obj):
     Boolean
 
     """
+    ensureRecomputed(obj)
     if not obj.Shape.Vertexes:
         return False
     else:
@@ -401,13 +444,10 @@ def extrudeBetween(sketch, zMin, zMax, name=None):
     ext
 
     """
-    doc = FreeCAD.ActiveDocument
-    tempExt = extrude(sketch, zMax - zMin, name=name)
-    ext = copy_move(tempExt, moveVec=(0.0, 0.0, zMin))
-    doc.recompute()
-    doc.removeObject(tempExt.Name)
-    doc.recompute()
-    return ext
+    normal = sketch.Placement.Rotation.multVec(FreeCAD.Vector(0.0, 0.0, 1.0))
+    shape = shapeUtils.extrude(shapeUtils.shapeOf(sketch), zMax - zMin, normal)
+    shape = shapeUtils.translate(shape, (0.0, 0.0, zMin))
+    return shapeUtils.addShape(shape, "Extrude" if name is None else name)
 
 
 def liftObject(obj, d, consumeInputs=False):
@@ -464,7 +504,7 @@ def draftOffset(inputSketch, t):
     offsetVec1 = vec(-deltaT, -deltaT, 0.0)
     offsetVec2 = vec(deltaT, deltaT, 0.0)
 
-    offset0 = copy_move(inputSketch)
+    offset0 = copy_move(inputSketch)  # also brings inputSketch up to date
     # Currently FreeCAD throws an error if we try to collapse a shape into a point through offsetting. If that happens, set delta to 5E-5. Any closer and FreeCAD seems to suffer from numerical errors
     try:
         offset1 = Draft.offset(inputSketch, offsetVec1, copy=True)
@@ -477,6 +517,7 @@ def draftOffset(inputSketch, t):
         deltaT -= 5e-5
         offset2 = Draft.offset(inputSketch, vec(deltaT, deltaT, 0.0), copy=True)
 
+    ensureRecomputed(offset0, offset1, offset2)
     # Compute the areas of the sketches. FreeCAD will throw an exception if we try to make a Face out of a line or a point, we catch that give it an area of 0
     try:
         A0 = np.abs(Part.Face(offset0.Shape).Area)
@@ -606,6 +647,7 @@ def crossSection(obj, axis=(1.0, 0.0, 0.0), d=1.0, name=None):
     if name is None:
         name = obj.Name + "_section"
     wires = list()
+    ensureRecomputed(obj)
     shape = obj.Shape
     for i in shape.slice(vec(axis[0], axis[1], axis[2]), d):
         wires.append(i)
@@ -0,0 +1,201 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Parallel evaluation of the lithography H constructions.
+
+H_{n,i}(T) only depends on the B and C prisms of layer n, objID i, on the substrate
+and on the H objects of lower layers. All (objID, offset) nodes of one layer are
+therefore independent of each other. They are evaluated in worker processes on
+BRep-serialized shapes, one layer after the other. Substrate offsets need the
+document-based part builders and are computed in the main process up front.
+"""
+
+import concurrent.futures
+import logging
+import multiprocessing
+
+from . import shapeUtils
+
+# Overlap results of a worker process, shared by all nodes it evaluates
+_overlapCache = shapeUtils.OverlapCache()
+
+
+def requiredNodes(layers):
+    """Collect the H nodes needed to deposit all objects of a lithography stack.
+
+    Parameters
+    ----------
+    layers : dict
+        The "layers" entry of the lithoDict set up by initialize_lithography.
+
+    Returns
+    -------
+    dict mapping each layer number to the set of (objID, offset tuple) nodes.
+
+    """
+    needed = {n: set() for n in layers}
+    todo = [(n, i, ()) for n in layers for i in layers[n]["objIDs"]]
+    while todo:
+        n, i, offsetTuple = todo.pop()
+        if (i, offsetTuple) in needed[n]:
+            continue
+        needed[n].add((i, offsetTuple))
+        for m in layers:
+            if m < n:
+                for j in layers[m]["objIDs"]:
+                    todo.append((m, j, offsetTuple))
+                    todo.append((m, j, tuple(sorted(offsetTuple + (n,)))))
+    return needed
+
+
+def _offsetPrism(shape, t):
+    # Mirrors gen_offset, which skips very small offsets
+    if t < 1e-5:
+        return shape.copy()
+    return shapeUtils.offsetShape(shape, t)
+
+
+def _screenedUnionList(obj, checkList, useList):
+    """Select the components of useList whose counterparts in checkList overlap obj,
+    plus the components of useList that overlap obj themselves."""
+    returnList = []
+    for i, checkPart in enumerate(checkList):
+        if _overlapCache.overlaps(obj, checkPart):
+            returnList.append(useList[i])
+    # fix for multilayer intersections: make sure we really check all overlaps
+    for usePart in useList:
+        if _overlapCache.overlaps(obj, usePart):
+            returnList.append(usePart)
+    return returnList
+
+
+def computeH(B, C, t, lowerH, substrateCheck, substrateUse):
+    """Compute the components of one H node on BRep strings.
+
+    Parameters
+    ----------
+    B : str
+        B prism of the node.
+    C : str
+        C prism of the node.
+    t : float
+        Offset of the node.
+    lowerH : list
+        (check components, use components) tuples of all lower-layer H objects at
+        the check and total offsets of this node.
+    substrateCheck : list
+        Substrate parts at the check offset.
+    substrateUse : list
+        Substrate parts at the total offset.
+
+    Returns
+    -------
+    List of BRep strings of the H components.
+
+    """
+    B_t = _offsetPrism(shapeUtils.fromBrep(B), t)
+    C_t = _offsetPrism(shapeUtils.fromBrep(C), t)
+    unionList = []
+    for checkList, useList in lowerH:
+        unionList += _screenedUnionList(
+            C_t,
+            [shapeUtils.fromBrep(s) for s in checkList],
+            [shapeUtils.fromBrep(s) for s in useList],
+        )
+    substrateUse = [shapeUtils.fromBrep(s) for s in substrateUse]
+    for i, ACheck in enumerate(substrateCheck):
+        if _overlapCache.overlaps(C_t, shapeUtils.fromBrep(ACheck)):
+            unionList.append(substrateUse[i])
+    returnList = [B_t] + [shapeUtils.common([C_t, obj]) for obj in unionList]
+    return [shapeUtils.toBrep(shape) for shape in returnList]
+
+
+def scheduleLithography(info, substrateOffset, n_workers=None):
+    """Compute all H constructions of a lithography stack in parallel.
+
+    The results are stored in the HDict entries of info.lithoDict, where gen_G picks
+    them up instead of computing them serially.
+
+    Parameters
+    ----------
+    info :
+        Lithography info holder after initialize_lithography.
+    substrateOffset : callable
+        substrateOffset(A, t) returns the document object of substrate part A offset
+        by t.
+    n_workers : int
+        Number of worker processes. (Default value = None, the number of CPUs)
+
+    Returns
+    -------
+    None
+
+    """
+    layers = info.lithoDict["layers"]
+    substrate = info.lithoDict["substrate"]
+    needed = requiredNodes(layers)
+
+    def thickness(offsetTuple):
+        return sum(layers[m]["thickness"] for m in offsetTuple)
+
+    # Substrate offsets at every check and total offset
+    substrateBreps = {}
+    for n in needed:
+        for _, offsetTuple in needed[n]:
+            for key in (offsetTuple, tuple(sorted(offsetTuple + (n,)))):
+                if key not in substrate:
+                    substrate[key] = []
+                    for A in substrate[()]:
+                        AObj = substrateOffset(A, thickness(key))
+                        info.trash.append(AObj)
+                        substrate[key].append(AObj)
+                if key not in substrateBreps:
+                    substrateBreps[key] = [
+                        shapeUtils.toBrep(shapeUtils.shapeOf(A)) for A in substrate[key]
+                    ]
+
+    prisms = {
+        (n, i): (
+            shapeUtils.toBrep(shapeUtils.shapeOf(objDict["B"])),
+            shapeUtils.toBrep(shapeUtils.shapeOf(objDict["C"])),
+        )
+        for n in layers
+        for i, objDict in layers[n]["objIDs"].items()
+    }
+
+    HBreps = {}
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(n_workers, mp_context=context) as pool:
+        for n in sorted(needed):
+            futures = {}
+            for i, offsetTuple in needed[n]:
+                totalTuple = tuple(sorted(offsetTuple + (n,)))
+                lowerH = [
+                    (HBreps[(m, j, offsetTuple)], HBreps[(m, j, totalTuple)])
+                    for m in layers
+                    if m < n
+                    for j in layers[m]["objIDs"]
+                ]
+                B, C = prisms[(n, i)]
+                future = pool.submit(
+                    computeH,
+                    B,
+                    C,
+                    thickness(offsetTuple),
+                    lowerH,
+                    substrateBreps[offsetTuple],
+                    substrateBreps[totalTuple],
+                )
+                futures[future] = (n, i, offsetTuple)
+            for future in concurrent.futures.as_completed(futures):
+                HBreps[futures[future]] = future.result()
+            logging.debug("layer %d: %d H nodes", n, len(futures))
+
+    # Materialize the H components where gen_G expects them
+    for (n, i, offsetTuple), breps in HBreps.items():
+        HList = [
+            shapeUtils.addShape(shapeUtils.fromBrep(brep), f"H_{n}_{i}")
+            for brep in breps
+        ]
+        info.trash += HList
+        layers[n]["objIDs"][i]["HDict"][offsetTuple] = HList
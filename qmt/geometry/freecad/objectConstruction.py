@@ -5,6 +5,7 @@
 
 import numpy as np
 from copy import deepcopy
+from functools import partial
 import logging
 
 # ~ logging.getLogger().setLevel(logging.DEBUG)  # toggle debug logging for this file
@@ -14,7 +15,7 @@ import Draft
 
 # TODO: use namespace in code
 from qmt.geometry.freecad.auxiliary import *
-from qmt.geometry.freecad.fileIO import exportCAD, exportMeshed
+from qmt.geometry.freecad.fileIO import exportBreps, exportCAD, exportMeshed
 from qmt.geometry.freecad.geomUtils import (
     extrude,
     copy_move,
@@ -26,22 +27,26 @@ from qmt.geometry.freecad.geomUtils import (
     draftOffset,
     intersect,
     checkOverlap,
+    checkShapeOverlap,
+    findOverlapCandidates,
     subtract,
-    crossSection,
-)
-from qmt.geometry.freecad.sketchUtils import (
-    findSegments,
-    splitSketch,
-    extendSketch,
-    findEdgeCycles,
 )
+from qmt.geometry.freecad import shapeUtils
+from qmt.geometry.freecad.lithoScheduler import scheduleLithography
+from qmt.geometry.freecad.sectionUtils import sliceShapes
+from qmt.geometry.freecad.sketchUtils import findSegments, splitSketch, extendSketch
 
 from qmt.infrastructure import store_serial
 from qmt.geometry import Geo3DData, part_3d
+from qmt.geometry.geo_cache import canonical
 
 
 DBG_OUT = logging.getLogger().level <= logging.DEBUG
 
+# Offset shapes shared across layers, objIDs and builds, keyed by
+# (exact source shape hash, offset value, treatment)
+offsetMemo = shapeUtils.ShapeMemo()
+
 
 def set_params(doc, paramDict):
     # TODO: support passthrough params
@@ -73,7 +78,7 @@ def set_params(doc, paramDict):
         else:
             raise ValueError("Unknown geometric parameter type.")
 
-    doc.recompute()
+    recompute(doc)
 
 
 class DummyInfo:
@@ -88,8 +93,12 @@ def build(opts):
     Parameters
     ----------
     opts : dict
-        Options dict in the QMT Geometry3D.__init__ input format.
-        Options dict in the QMT Geometry3D.__init__ input format.
+        Options dict in the QMT Geometry3D.__init__ input format. If it contains a
+        PartBuildCache under "build_cache", only parts whose inputs changed since
+        an earlier build are rebuilt. With "export_workers", the STEP and STL exports
+        run in that many worker processes; with "lazy_export", parts keep their
+        BRep and are only exported when written. "mesh_options" holds tessellation
+        keyword arguments of exportMeshed for the STL exports.
 
     Returns
     -------
@@ -124,85 +133,185 @@ def build(opts):
         fcdict = {key: (value, "freeCAD") for (key, value) in opts["params"].items()}
         set_params(doc, fcdict)
 
-    doc.recompute()  # recompute here to update any sketches that change due to parameters
+    # recompute here to update any sketches that change due to parameters
+    recompute(doc)
 
     if "built_part_names" not in opts:
         opts["built_part_names"] = {}
     if "serial_stp_parts" not in opts:
         opts["serial_stp_parts"] = {}
 
-    # Build the parts
-    info_holder = DummyInfo()  # temporary workaround to support old litho code
-    built_parts = []
-    for input_part in opts["input_parts"]:
-
-        if isinstance(input_part, part_3d.ExtrudePart):
-            part = build_extrude(input_part)
-        elif isinstance(input_part, part_3d.SAGPart):
-            part = build_sag(input_part)
-        elif isinstance(input_part, part_3d.WirePart):
-            part = build_wire(input_part)
-        elif isinstance(input_part, part_3d.WireShellPart):
-            part = build_wire_shell(input_part)
-        elif isinstance(input_part, part_3d.LithographyPart):
-            part = build_lithography(input_part, opts, info_holder)
-        elif isinstance(input_part, part_3d.Geo3DPart):
-            part = build_pass(input_part)
-        else:
-            raise ValueError(f"{input_part} is not a recognized Geo3DPart type")
-
-        assert part is not None
-        doc.recompute()
-        built_parts.append(part)
-        # needed for litho steps
-        opts["built_part_names"][input_part.label] = part.Name
-
-    # Cleanup
-    if not DBG_OUT:
-        collect_garbage(info_holder)
-        for obj in blacklist:
-            delete(obj)
-        doc.recompute()
+    # Parts whose inputs are unchanged since an earlier build are taken from the cache
+    build_cache = opts.get("build_cache")
+    if build_cache is not None:
+        input_keys = build_cache.inputKeys(doc, opts["input_parts"])
+
+    # Build the parts, recomputing objects only when their shapes are needed
+    with deferredRecompute(doc):
+        info_holder = DummyInfo()  # temporary workaround to support old litho code
+        built_parts = []
+        for input_part in opts["input_parts"]:
 
-    # Subtraction (removes the need for subtractlists)
-    for i, (input_part, part) in enumerate(zip(opts["input_parts"], built_parts)):
+            cached_shape = None
+            if build_cache is not None:
+                cached_shape = build_cache.get(input_keys[input_part.label], "shape")
+            if cached_shape is not None:
+                part = shapeUtils.addShape(cached_shape, "cached_part")
+            elif isinstance(input_part, part_3d.ExtrudePart):
+                part = build_extrude(input_part)
+            elif isinstance(input_part, part_3d.SAGPart):
+                part = build_sag(input_part)
+            elif isinstance(input_part, part_3d.WirePart):
+                part = build_wire(input_part)
+            elif isinstance(input_part, part_3d.WireShellPart):
+                part = build_wire_shell(input_part)
+            elif isinstance(input_part, part_3d.LithographyPart):
+                part = build_lithography(input_part, opts, info_holder)
+            elif isinstance(input_part, part_3d.Geo3DPart):
+                part = build_pass(input_part)
+            else:
+                raise ValueError(f"{input_part} is not a recognized Geo3DPart type")
+
+            assert part is not None
+            recompute(doc)
+            if build_cache is not None and cached_shape is None:
+                ensureRecomputed(part)
+                build_cache.put(input_keys[input_part.label], "shape", part.Shape)
+            built_parts.append(part)
+            # needed for litho steps
+            opts["built_part_names"][input_part.label] = part.Name
+
+        # Cleanup
+        if not DBG_OUT:
+            collect_garbage(info_holder)
+            for obj in blacklist:
+                delete(obj)
+            recompute(doc)
+
+    # Subtraction (removes the need for subtractlists), carried out on plain shapes
+    built_shapes = [part.Shape for part in built_parts]
+    # Subtracting only shrinks parts, so pairs with disjoint bounding boxes before
+    # the subtraction can never overlap and are skipped
+    overlap_candidates = findOverlapCandidates(
+        [
+            None if input_part.virtual else shape
+            for input_part, shape in zip(opts["input_parts"], built_shapes)
+        ]
+    )
+    logging.debug("%d overlap candidate pairs", len(overlap_candidates))
+    result_keys = {}
+    changed = []
+    for i, input_part in enumerate(opts["input_parts"]):
         if input_part.virtual:
+            if build_cache is not None:
+                result_keys[input_part.label] = input_keys[input_part.label]
             continue
-        for other_input_part, other_part in zip(
-            opts["input_parts"][0:i], built_parts[0:i]
-        ):
-            if other_input_part.virtual:
+        if build_cache is not None:
+            earlier_parts = [
+                (result_keys[other_input_part.label], built_shapes[j])
+                for j, other_input_part in enumerate(opts["input_parts"][0:i])
+                if not other_input_part.virtual
+            ]
+            result_key = build_cache.resultKey(
+                input_keys[input_part.label], built_shapes[i], earlier_parts
+            )
+            result_keys[input_part.label] = result_key
+            cached_shape = build_cache.get(result_key, "shape")
+            if cached_shape is not None:
+                built_shapes[i] = cached_shape
+                changed.append(i)
                 continue
-            if checkOverlap([part, other_part]):
-                cut = subtract(
-                    part,
-                    copy_move(other_part),
-                    consumeInputs=True if not DBG_OUT else False,
-                )
-                simple_copy = doc.addObject("Part::Feature", "simple_copy")
-                # no solid, just its shape (can be disjoint)
-                simple_copy.Shape = cut.Shape
-                delete(cut)
-                part = simple_copy
-                built_parts[i] = simple_copy
+        tools = [
+            built_shapes[j]
+            for j in range(i)
+            if (j, i) in overlap_candidates
+            and checkShapeOverlap(built_shapes[i], built_shapes[j])
+        ]
+        if tools:
+            # no solid, just its shape (can be disjoint)
+            built_shapes[i] = shapeUtils.cut(built_shapes[i], tools)
+            changed.append(i)
+        if build_cache is not None:
+            build_cache.put(result_key, "shape", built_shapes[i])
+
+    # Materialize the subtracted shapes as document objects
+    for i in changed:
+        simple_copy = shapeUtils.addShape(built_shapes[i], "simple_copy")
+        if not DBG_OUT:
+            doc.removeObject(built_parts[i].Name)
+        built_parts[i] = simple_copy
 
     # Update names and store the built parts
     built_parts_dict = {}  # dict for cross sections
+    pending_exports = []  # (output part, missing formats, built part)
+    mesh_options = opts.get("mesh_options") or {}
+    # STL blobs of different tessellations are cached separately
+    cache_fields = {"stp": "stp", "stl": "stl"}
+    if mesh_options:
+        cache_fields["stl"] = "stl" + repr(sorted(mesh_options.items()))
     for input_part, built_part in zip(opts["input_parts"], built_parts):
         built_part.Label = input_part.label  # here it's collision free
         output_part = deepcopy(input_part)
-        output_part.serial_stp = store_serial([built_part], exportCAD, "stp")
-        output_part.serial_stl = store_serial([built_part], exportMeshed, "stl")
+        if build_cache is not None:
+            result_key = result_keys[input_part.label]
+            output_part.serial_stp = build_cache.get(result_key, cache_fields["stp"])
+            output_part.serial_stl = build_cache.get(result_key, cache_fields["stl"])
+        missing = [
+            ext_format
+            for ext_format in ("stp", "stl")
+            if getattr(output_part, f"serial_{ext_format}") is None
+        ]
+        if missing and opts.get("lazy_export"):
+            # write_stp/write_stl export from the BRep on demand
+            output_part.serial_brep = shapeUtils.toBrep(built_part.Shape)
+        elif missing:
+            pending_exports.append((output_part, missing, built_part))
         output_part.built_fc_name = built_part.Name
+        output_part.mesh_options = dict(mesh_options) or None
         geo.add_part(output_part.label, output_part)
         # dict for cross sections
         built_parts_dict[input_part.label] = built_part
 
+    geo.mesh_options = dict(mesh_options) or None
+
+    # Export the parts, either here or in worker processes on BRep-serialized shapes
+    export_fcts = {"stp": exportCAD, "stl": partial(exportMeshed, **mesh_options)}
+    if opts.get("export_workers") and pending_exports:
+        blobs = exportBreps(
+            [
+                (output_part.label, shapeUtils.toBrep(built_part.Shape))
+                for output_part, _, built_part in pending_exports
+            ],
+            n_workers=opts["export_workers"],
+            meshOptions=mesh_options,
+        )
+    else:
+        blobs = [
+            {
+                ext_format: store_serial(
+                    [built_part], export_fcts[ext_format], ext_format
+                )
+                for ext_format in missing
+            }
+            for _, missing, built_part in pending_exports
+        ]
+    for (output_part, missing, _), part_blobs in zip(pending_exports, blobs):
+        for ext_format in missing:
+            setattr(output_part, f"serial_{ext_format}", part_blobs[ext_format])
+    if build_cache is not None:
+        for output_part in geo.parts.values():
+            result_key = result_keys[output_part.label]
+            for ext_format in ("stp", "stl"):
+                blob = getattr(output_part, f"serial_{ext_format}")
+                if blob is not None:
+                    build_cache.put(result_key, cache_fields[ext_format], blob)
+
     # Build cross sections:
+    xsec_polygons = buildCrossSections(opts["xsec_dict"], built_parts_dict)
     for xsec_name in opts["xsec_dict"]:
         axis = opts["xsec_dict"][xsec_name]["axis"]
         distance = opts["xsec_dict"][xsec_name]["distance"]
-        polygons = buildCrossSection(xsec_name, axis, distance, built_parts_dict)
+        polygons = xsec_polygons[xsec_name]
         geo.add_xsec(xsec_name, polygons, axis=axis, distance=distance)
 
     # Store the FreeCAD document
@@ -248,12 +357,12 @@ def build_extrude(part):
     deltaz = part.thickness
     doc = FreeCAD.ActiveDocument
     sketch = doc.getObject(part.fc_name)
-    splitSketches = splitSketch(sketch)
+    splitSketches = splitSketch(sketch, editable=DBG_OUT)
     extParts = []
     for sketch in splitSketches:
         extParts.append(extrudeBetween(sketch, z0, z0 + deltaz, name=part.label))
         delete(sketch)
-    doc.recompute()
+    recompute(doc)
     return genUnion(extParts, consumeInputs=True if not DBG_OUT else False)
 
 
@@ -282,7 +391,7 @@ def build_sag(part, offset=0.0):
     sketch = doc.getObject(part.fc_name)
     sag = makeSAG(sketch, zBot, zMid, zTop, tIn, tOut, offset=offset)[0]
     sag.Label = part.label
-    doc.recompute()
+    recompute(doc)
     return sag
 
 
@@ -379,6 +488,13 @@ def build_lithography(part, opts, info_holder):
     if not info_holder.litho_setup_done:
         initialize_lithography(info_holder, opts, fillShells=True)
         info_holder.litho_setup_done = True
+        if opts.get("litho_workers"):
+            # Evaluate all H constructions up front, layer by layer in parallel
+            scheduleLithography(
+                info_holder,
+                lambda A, t: gen_offset(opts, A, t),
+                n_workers=opts["litho_workers"],
+            )
 
     if DBG_OUT:
         FreeCAD.ActiveDocument.saveAs("tmp_after_init.fcstd")
@@ -391,6 +507,7 @@ def build_lithography(part, opts, info_holder):
         ):
             returnObjs.append(gen_G(info_holder, opts, layer_num, objID))
     logging.debug([o.Name for o in returnObjs])
+    logging.debug("offset memo: %s", offsetMemo.stats())
     return genUnion(returnObjs, consumeInputs=True if not DBG_OUT else False)
 
 
@@ -430,7 +547,7 @@ def buildWire(sketch, zBottom, width, faceOverride=None, offset=0.0):
     mySweepTemp.Sections = [face]
     mySweepTemp.Spine = sketchForSweep
     mySweepTemp.Solid = True
-    doc.recompute()
+    recompute(doc)
     mySweep = copy_move(mySweepTemp)
     deepRemove(mySweepTemp)
     return mySweep
@@ -494,6 +611,7 @@ def buildAlShell(
         face = makeHexFace(
             sketch, zBottom - offset, width + 2 * offset
         )  # make the bigger face
+        ensureRecomputed(face)
         shiftedFace = Draft.move(face, transVec, copy=False)
         extendedSketch = extendSketch(sketch, offset)
         # The shell offset is handled manually since we are using faceOverride to
@@ -505,9 +623,10 @@ def buildAlShell(
         shellCut = doc.addObject("Part::Cut", f"{sketch.Name}_cut_{vert}")
         shellCut.Base = shiftedWire
         shellCut.Tool = originalWire
-        doc.recompute()
+        recompute(doc)
+        ensureRecomputed(shellCut)
         shell = Draft.move(shellCut, FreeCAD.Vector(0.0, 0.0, 0.0), copy=True)
-        doc.recompute()
+        recompute(doc)
         delete(shellCut)
         delete(originalWire)
         delete(shiftedWire)
@@ -515,7 +634,7 @@ def buildAlShell(
     if len(shellList) > 1:
         coatingUnion = doc.addObject("Part::MultiFuse", f"{sketch.Name}_coating")
         coatingUnion.Shapes = shellList
-        doc.recompute()
+        recompute(doc)
         coatingUnionClone = copy_move(coatingUnion)
         doc.removeObject(coatingUnion.Name)
         for shell in shellList:
@@ -574,7 +693,7 @@ def makeSAG(sketch, zBot, zMid, zTop, tIn, tOut, offset=0.0):
     # horizontal shift in the triangular part of the top after an offset
     f = offset * (1 - np.cos(alpha)) / np.sin(alpha)
 
-    sketchList = splitSketch(sketch)
+    sketchList = splitSketch(sketch, editable=DBG_OUT)
     returnParts = []
     for tempSketch in sketchList:
         botSketch = draftOffset(tempSketch, offset)  # the base of the wire
@@ -582,6 +701,7 @@ def makeSAG(sketch, zBot, zMid, zTop, tIn, tOut, offset=0.0):
         top_offset = f - tIn
         topSketch = draftOffset(tempSketch, top_offset)  # the top of the cap
         # If topSketch has been shrunk exactly to a line or a point, relax the offset to 5E-5. Any closer and FreeCAD seems to suffer from numerical errors
+        ensureRecomputed(topSketch)
         if topSketch.Shape.Area == 0:
             top_offset -= 5e-5
             delete(topSketch)
@@ -603,7 +723,7 @@ def makeSAG(sketch, zBot, zMid, zTop, tIn, tOut, offset=0.0):
         capPartTemp = doc.addObject("Part::Loft", f"{sketch.Name}_cap")
         capPartTemp.Sections = [midSketch, topSketchTemp]
         capPartTemp.Solid = True
-        doc.recompute()
+        recompute(doc)
         capPart = copy_move(capPartTemp, moveVec=(0.0, 0.0, zMid - offset))
         delete(capPartTemp)
         delete(topSketchTemp)
@@ -659,7 +779,7 @@ def initialize_lithography(info, opts, fillShells=True):
             # the sketch here into possibly disjoint sub-sketches to work
             # with them:
             sketch = doc.getObject(part.fc_name)
-            splitSketches = splitSketch(sketch)
+            splitSketches = splitSketch(sketch, editable=DBG_OUT)
             for mySplitSketch in splitSketches:
                 objID = len(layer["objIDs"])
                 objDict = {}
@@ -766,27 +886,36 @@ def gen_offset(opts, obj, offsetVal):
     # Extrude or lithography parts are treated normally:
     if treatment == part_3d.ExtrudePart or treatment == part_3d.LithographyPart:
         treatment = "standard"
-    if treatment == "standard":
-        # Apparently the offset function is buggy for very small offsets...
-        if offsetVal < 1e-5:
-            offsetDupe = copy_move(obj)
+    # Apparently the offset function is buggy for very small offsets...
+    if treatment == "standard" and offsetVal < 1e-5:
+        offsetDupe = copy_move(obj)
+    else:
+        sourceShape = shapeUtils.shapeOf(obj)
+        if treatment == "standard":
+            treatmentKey = treatment
+        else:
+            # These parts are rebuilt from their input specification
+            treatmentKey = (treatment.__name__, repr(canonical(input_part)))
+        memoKey = (
+            shapeUtils.shapeHash(sourceShape),
+            float.hex(float(offsetVal)),
+            treatmentKey,
+        )
+        offsetShape = offsetMemo.get(memoKey)
+        if offsetShape is not None:
+            offsetDupe = shapeUtils.addShape(offsetShape, obj.Name + "_offset")
         else:
-            offset = doc.addObject("Part::Offset")
-            offset.Source = obj
-            offset.Value = offsetVal
-            offset.Mode = 0
-            offset.Join = 2
-            doc.recompute()
-            offsetDupe = copy_move(offset)
-            doc.recompute()
-            delete(offset)
-    elif treatment == part_3d.WirePart:
-        offsetDupe = build_wire(input_part, offset=offsetVal)
-    elif treatment == part_3d.WireShellPart:
-        offsetDupe = build_wire_shell(input_part, offset=offsetVal)
-    elif treatment == part_3d.SAGPart:
-        offsetDupe = build_sag(input_part, offset=offsetVal)
-    doc.recompute()
+            if treatment == "standard":
+                offsetShape = shapeUtils.offsetShape(sourceShape, offsetVal)
+                offsetDupe = shapeUtils.addShape(offsetShape, obj.Name + "_offset")
+            elif treatment == part_3d.WirePart:
+                offsetDupe = build_wire(input_part, offset=offsetVal)
+            elif treatment == part_3d.WireShellPart:
+                offsetDupe = build_wire_shell(input_part, offset=offsetVal)
+            elif treatment == part_3d.SAGPart:
+                offsetDupe = build_sag(input_part, offset=offsetVal)
+            offsetMemo.put(memoKey, shapeUtils.shapeOf(offsetDupe))
+    recompute(doc)
 
     try:
         logging.debug(
@@ -1177,18 +1306,41 @@ def buildCrossSection(sliceName, axis, distance, built_parts_dict):
 
 
     """
-    polygons = {}
-    for part_name in built_parts_dict:
-        built_part = built_parts_dict[part_name]
-        # loop over FreeCAD shapes corresponding to part
-        # slice the 3D part
-        fcName = f"{part_name}_section_{sliceName}"
-        section = crossSection(built_part, axis=axis, d=distance, name=fcName)
-        # separate disjoint pieces
-        segments, cycles = findEdgeCycles(section)
-        for i, cycle in enumerate(cycles):
-            points = [tuple(segments[idx, 0]) for idx in cycle]
-            patchName = f"{part_name}_{i}"
-            # this mapping is necessary since numpy floats have a pickle error:
-            polygons[patchName] = [list(map(float, point)) for point in points]
-    return polygons
+    xsec_dict = {sliceName: {"axis": axis, "distance": distance}}
+    return buildCrossSections(xsec_dict, built_parts_dict)[sliceName]
+
+
+def buildCrossSections(xsec_dict, built_parts_dict):
+    """Compute the polygons of several cross-sections. The parts are sliced
+    directly on their shapes, once per axis for all distances along it.
+
+    Parameters
+    ----------
+    xsec_dict : dict
+        Cross-section specifications with axis and distance fields.
+    built_parts_dict : dict
+        Built part objects by part name.
+
+    Returns
+    -------
+    dict from cross-section name to the dict of polygons.
+
+    """
+    shapes = {name: part.Shape for name, part in built_parts_dict.items()}
+    byAxis = {}
+    for xsec_name, xsec in xsec_dict.items():
+        byAxis.setdefault(tuple(xsec["axis"]), []).append(xsec_name)
+    result = {}
+    for axis, xsec_names in byAxis.items():
+        distances = [xsec_dict[name]["distance"] for name in xsec_names]
+        for xsec_name, planePolygons in zip(
+            xsec_names, sliceShapes(shapes, axis, distances)
+        ):
+            polygons = {}
+            for part_name, partPolygons in planePolygons.items():
+                # separate disjoint pieces
+                for i, points in enumerate(partPolygons):
+                    # this mapping is necessary since numpy floats have a pickle error:
+                    polygons[f"{part_name}_{i}"] = points.tolist()
+            result[xsec_name] = polygons
+    return result
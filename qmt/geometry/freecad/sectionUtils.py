@@ -0,0 +1,153 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Document-free cross sections of shapes at many slice planes."""
+
+import concurrent.futures
+import logging
+import multiprocessing
+
+import numpy as np
+import FreeCAD
+import Part
+
+from . import shapeUtils
+from .sketchUtils import traceSegmentChains
+
+vec = FreeCAD.Vector
+
+
+def edgeSegments(edge, deflection):
+    """Approximate an edge by line segments.
+
+    Parameters
+    ----------
+    edge : Part.Edge
+        Edge of a section.
+    deflection :
+        maximal distance between a curved edge and its segments
+
+    Returns
+    -------
+    List of (start, end) point tuples. Closed edges, like the circles in sections
+    of cylinders, give a closed polyline.
+
+    """
+    if isinstance(edge.Curve, Part.Line):
+        return [(tuple(edge.Vertexes[0].Point), tuple(edge.Vertexes[-1].Point))]
+    points = [tuple(p) for p in edge.discretize(Deflection=deflection)]
+    if edge.isClosed():
+        points[-1] = points[0]
+    return list(zip(points[:-1], points[1:]))
+
+
+def sectionPolygons(section, tol=1e-8, deflection=None):
+    """Separate the edges of a planar section into closed polygons.
+    Curved edges are discretized, open chains and ambiguous junctions are logged
+    and skipped.
+
+    Parameters
+    ----------
+    section : Part.Shape
+        Compound of the wires of a section.
+    tol :
+        repair tolerance for matching (Default value = 1e-8)
+    deflection :
+        maximal distance between curved edges and the polygons
+        (Default value = None, 1e-3 times the diagonal of the section bounding box)
+
+    Returns
+    -------
+    List of (n, 3) arrays of polygon vertices.
+
+    """
+    if not section.Edges:
+        return []
+    if deflection is None:
+        deflection = 1e-3 * section.BoundBox.DiagonalLength
+    segments = np.array(
+        [seg for edge in section.Edges for seg in edgeSegments(edge, deflection)]
+    )
+    cycles, openChains, junctions = traceSegmentChains(segments, tol)
+    for chain in openChains:
+        logging.warning("Open chain of segments %s in section", chain)
+    for point, segs in junctions:
+        logging.warning(
+            "Ambiguous junction of segments %s at %s in section", segs, point
+        )
+    return [segments[cycle, 0] for cycle in cycles]
+
+
+def sliceShapes(shapes, axis=(1.0, 0.0, 0.0), distances=(0.0,), tol=1e-8):
+    """Slice shapes at many parallel planes.
+
+    Every shape is deserialized once and sliced plane by plane.
+
+    Parameters
+    ----------
+    shapes : dict
+        Part.Shape objects or their BRep strings by name.
+    axis : tuple
+        Normal of the slice planes. (Default value = (1.0, 0.0, 0.0))
+    distances : sequence
+        Positions of the planes along the axis. (Default value = (0.0,))
+    tol :
+        repair tolerance for matching (Default value = 1e-8)
+
+    Returns
+    -------
+    List with one dict per plane, mapping each name to its list of (n, 3) polygon
+    vertex arrays.
+
+    """
+    distances = [float(d) for d in distances]
+    result = [{} for _ in distances]
+    for name, shape in shapes.items():
+        if isinstance(shape, str):
+            shape = shapeUtils.fromBrep(shape)
+        for planeResult, d in zip(result, distances):
+            wires = shape.slice(vec(*axis), d)
+            planeResult[name] = sectionPolygons(Part.Compound(wires), tol)
+    return result
+
+
+def sliceShapesParallel(
+    shapes, axis=(1.0, 0.0, 0.0), distances=(0.0,), tol=1e-8, n_workers=None
+):
+    """Slice shapes at many parallel planes in worker processes.
+
+    The planes are split into one contiguous chunk per worker, and each worker
+    deserializes the shapes once for its chunk.
+
+    Parameters
+    ----------
+    shapes : dict
+        Part.Shape objects or their BRep strings by name.
+    axis : tuple
+        Normal of the slice planes. (Default value = (1.0, 0.0, 0.0))
+    distances : sequence
+        Positions of the planes along the axis. (Default value = (0.0,))
+    tol :
+        repair tolerance for matching (Default value = 1e-8)
+    n_workers : int
+        Number of worker processes. (Default value = None, the number of CPUs)
+
+    Returns
+    -------
+    List with one dict per plane, as returned by sliceShapes.
+
+    """
+    breps = {
+        name: shape if isinstance(shape, str) else shapeUtils.toBrep(shape)
+        for name, shape in shapes.items()
+    }
+    distances = [float(d) for d in distances]
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+    chunks = [c.tolist() for c in np.array_split(distances, n_workers) if len(c)]
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(n_workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(sliceShapes, breps, axis, chunk, tol) for chunk in chunks
+        ]
+        return [planeResult for f in futures for planeResult in f.result()]
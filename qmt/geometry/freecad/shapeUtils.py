@@ -0,0 +1,563 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Document-free geometry operations on Part.Shape objects.
+
+These are the shape counterparts of the boolean helpers in geomUtils. They never
+create document features or trigger recomputes; results are materialized in the
+document with addShape only where a document object is actually needed.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import FreeCAD
+import Part
+import numpy as np
+
+from .auxiliary import ensureRecomputed
+
+vec = FreeCAD.Vector
+
+
+def shapeOf(obj):
+    """Return the up-to-date shape of a document object, or a shape unchanged.
+
+    Parameters
+    ----------
+    obj : FreeCAD.App.DocumentObject or Part.Shape
+
+
+    Returns
+    -------
+    Part.Shape
+
+    """
+    if isinstance(obj, Part.Shape):
+        return obj
+    ensureRecomputed(obj)
+    if "Touched" in obj.State:
+        obj.recompute()
+    return obj.Shape
+
+
+def shapeHash(shape):
+    """Return a hash of the exact geometry of a shape.
+
+    The hash covers the BRep serialization, i.e. the topology and the types and
+    parameters of all curves and surfaces. Different shapes with the same vertices
+    and measures, like arcs of different radius between the same end points or
+    mirror images, get different hashes.
+
+    Parameters
+    ----------
+    shape : Part.Shape
+
+
+    Returns
+    -------
+    Hex digest.
+
+    """
+    return hashlib.sha256(toBrep(shape).encode()).hexdigest()
+
+
+def isNonemptyShape(shape):
+    """Checks if a shape has any vertices.
+
+    Parameters
+    ----------
+    shape : Part.Shape
+
+
+    Returns
+    -------
+    Boolean
+
+    """
+    return bool(shape.Vertexes)
+
+
+def fuse(shapes):
+    """Fuse a list of shapes, ignoring empty ones.
+
+    Parameters
+    ----------
+    shapes : list
+        Part.Shape objects.
+
+    Returns
+    -------
+    Part.Shape, or None if there is no nonempty shape.
+
+    """
+    shapes = [shape for shape in shapes if isNonemptyShape(shape)]
+    if not shapes:
+        return None
+    if len(shapes) == 1:
+        return shapes[0].copy()
+    return shapes[0].fuse(shapes[1:]).removeSplitter()
+
+
+def cut(shape, tools):
+    """Subtract one or several tool shapes from a shape.
+
+    Parameters
+    ----------
+    shape : Part.Shape
+
+    tools : Part.Shape or list
+
+
+    Returns
+    -------
+    Part.Shape
+
+    """
+    if isinstance(tools, Part.Shape):
+        tools = [tools]
+    if not tools:
+        return shape.copy()
+    result = shape.cut(tools)
+    if result.Vertexes:
+        result = result.removeSplitter()
+    return result
+
+
+def common(shapes):
+    """Intersect a list of shapes.
+
+    Parameters
+    ----------
+    shapes : list
+        Part.Shape objects.
+
+    Returns
+    -------
+    Part.Shape
+
+    """
+    if len(shapes) == 1:
+        return shapes[0].copy()
+    result = shapes[0].common(shapes[1:])
+    if result.Vertexes:
+        result = result.removeSplitter()
+    return result
+
+
+def hasCommonVolume(shapes, tolerance=1e-7):
+    """Checks if shapes share a volume larger than an absolute tolerance, so that
+    touching shapes don't overlap. This builds the intersection shape.
+
+    Parameters
+    ----------
+    shapes : list
+        Part.Shape objects.
+    tolerance : float
+        Volume tolerance in the units of the geometry. (Default value = 1e-7)
+
+    Returns
+    -------
+    Boolean
+
+    """
+    return common(shapes).Volume > tolerance
+
+
+def pointsInside(shape, points, tol=1e-5):
+    """Check which points lie inside a solid.
+    Points outside of the bounding box of the shape are rejected with numpy, and
+    only the remaining ones are queried one by one.
+
+    Parameters
+    ----------
+    shape : Part.Shape
+        Solid to test against.
+    points :
+        Array of 3D points with the coordinates on the last axis.
+    tol :
+        Tolerance of the check, points on the surface count as inside.
+        (Default value = 1e-5)
+
+    Returns
+    -------
+    Boolean array of the shape of points without the last axis.
+
+    """
+    points = np.asarray(points, dtype=float)
+    flat = points.reshape(-1, 3)
+    bb = shape.BoundBox
+    lower = np.array([bb.XMin, bb.YMin, bb.ZMin]) - tol
+    upper = np.array([bb.XMax, bb.YMax, bb.ZMax]) + tol
+    inside = np.zeros(len(flat), dtype=bool)
+    candidates = np.flatnonzero(np.all((flat >= lower) & (flat <= upper), axis=1))
+    for i in candidates:
+        inside[i] = shape.isInside(vec(*flat[i]), tol, True)
+    return inside.reshape(points.shape[:-1])
+
+
+def toBrep(shape):
+    """Serialize a shape to a BRep string.
+
+    Parameters
+    ----------
+    shape : Part.Shape
+
+
+    Returns
+    -------
+    str
+
+    """
+    return shape.exportBrepToString()
+
+
+def fromBrep(brep):
+    """Deserialize a shape from a BRep string.
+
+    Parameters
+    ----------
+    brep : str
+
+
+    Returns
+    -------
+    Part.Shape
+
+    """
+    shape = Part.Shape()
+    shape.importBrepFromString(brep)
+    return shape
+
+
+def translate(shape, moveVec):
+    """Return a translated copy of a shape.
+
+    Parameters
+    ----------
+    shape : Part.Shape
+
+    moveVec : tuple
+        Translation vector.
+
+    Returns
+    -------
+    Part.Shape
+
+    """
+    moved = shape.copy()
+    moved.translate(vec(*moveVec))
+    return moved
+
+
+def makeFaces(shape):
+    """Return the faces of a shape, creating them from closed wires if necessary.
+
+    Parameters
+    ----------
+    shape : Part.Shape
+
+
+    Returns
+    -------
+    Part.Shape with faces.
+
+    """
+    if shape.Faces:
+        return shape
+    return Part.makeFace(shape.Wires, "Part::FaceMakerBullseye")
+
+
+def extrude(shape, length, direction=(0.0, 0.0, 1.0)):
+    """Extrude the faces or closed wires of a shape into solids.
+
+    Parameters
+    ----------
+    shape : Part.Shape
+
+    length : float
+
+    direction : tuple
+        Extrusion direction. (Default value = (0.0, 0.0, 1.0))
+
+    Returns
+    -------
+    Part.Shape
+
+    """
+    direction = vec(*direction)
+    direction.normalize()
+    return makeFaces(shape).extrude(direction * length)
+
+
+def extrudeBetween(shape, zMin, zMax):
+    """Extrude a planar shape by zMax - zMin and lift the result by zMin.
+
+    Parameters
+    ----------
+    shape : Part.Shape
+
+    zMin : float
+
+    zMax : float
+
+
+    Returns
+    -------
+    Part.Shape
+
+    """
+    return translate(extrude(shape, zMax - zMin), (0.0, 0.0, zMin))
+
+
+def addShape(shape, name="Shape", label=None):
+    """Materialize a shape as a Part::Feature in the active document.
+
+    Parameters
+    ----------
+    shape : Part.Shape
+
+    name : str
+        (Default value = "Shape")
+    label : str
+        (Default value = None)
+
+    Returns
+    -------
+    FreeCAD.Part.Feature
+
+    """
+    obj = FreeCAD.ActiveDocument.addObject("Part::Feature", name)
+    obj.Shape = shape
+    if label is not None:
+        obj.Label = label
+    return obj
+
+
+def offsetShape(shape, offsetVal, tolerance=1e-7):
+    """Offset a solid like a Part::Offset feature in skin mode with intersection joins.
+
+    Parameters
+    ----------
+    shape : Part.Shape
+
+    offsetVal : float
+
+    tolerance : float
+        (Default value = 1e-7)
+
+    Returns
+    -------
+    Part.Shape
+
+    """
+    result = shape.makeOffsetShape(offsetVal, tolerance, join=2)
+    if result.Vertexes:
+        result = result.removeSplitter()
+    return result
+
+
+class ShapeMemo:
+    """Least recently used memo table of Part.Shape results with a memory cap.
+
+    The size of a shape is estimated by the length of its BRep serialization.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Memory cap. (Default value = 256 MiB)
+
+    """
+
+    def __init__(self, max_bytes=256 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return a copy of the memoized shape, or None.
+
+        Parameters
+        ----------
+        key : hashable
+
+
+        Returns
+        -------
+        Part.Shape or None
+
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0].copy()
+
+    def put(self, key, shape):
+        """Memoize a shape, evicting the least recently used ones beyond max_bytes.
+
+        Parameters
+        ----------
+        key : hashable
+
+        shape : Part.Shape
+
+
+        Returns
+        -------
+        None
+
+        """
+        size = len(shape.exportBrepToString())
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        self.entries[key] = (shape.copy(), size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, evictedSize) = self.entries.popitem(last=False)
+            self.nbytes -= evictedSize
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all entries."""
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        """Return the memo statistics.
+
+        Returns
+        -------
+        dict with hits, misses, hit_rate, evictions, entries and bytes.
+
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+        }
+
+
+class OverlapCache:
+    """Symmetric cache of overlap checks between pairs of shapes.
+
+    Pairs are keyed by the geometry hashes of both shapes, so copies of a shape share
+    results. The hashes of the most recently checked shapes are remembered, so that
+    they are computed once per shape. Checks that miss the cache go through increasingly
+    expensive stages: an AABB rejection, a minimum distance rejection, and finally
+    hasCommonVolume, which builds the intersection shape.
+
+    Parameters
+    ----------
+    max_entries : int
+        Maximum number of cached pair results. (Default value = 100000)
+    tolerance : float
+        Distance and volume tolerance. (Default value = 1e-7)
+    max_hashes : int
+        Maximum number of remembered shape hashes. These keep their shapes alive,
+        so the limit is much smaller. (Default value = 1000)
+
+    """
+
+    def __init__(self, max_entries=100000, tolerance=1e-7, max_hashes=1000):
+        self.max_entries = max_entries
+        self.tolerance = tolerance
+        self.max_hashes = max_hashes
+        self.results = OrderedDict()
+        self.hashes = OrderedDict()
+        self.resetStats()
+
+    def resetStats(self):
+        """Reset the counters."""
+        self.checks = 0
+        self.bboxRejects = 0
+        self.hits = 0
+        self.distanceRejects = 0
+        self.exactChecks = 0
+
+    def shapeHash(self, shape):
+        """Return the shapeHash of a shape, computed once per shape.
+
+        Parameters
+        ----------
+        shape : Part.Shape
+
+
+        Returns
+        -------
+        str
+
+        """
+        code = shape.hashCode()
+        entry = self.hashes.get(code)
+        if entry is not None and entry[0].isSame(shape):
+            self.hashes.move_to_end(code)
+            return entry[1]
+        result = shapeHash(shape)
+        self.hashes[code] = (shape, result)
+        while len(self.hashes) > self.max_hashes:
+            self.hashes.popitem(last=False)
+        return result
+
+    def overlaps(self, shape0, shape1):
+        """Checks if two shapes share a finite volume.
+
+        Parameters
+        ----------
+        shape0 : Part.Shape
+
+        shape1 : Part.Shape
+
+
+        Returns
+        -------
+        Boolean
+
+        """
+        self.checks += 1
+        if not shape0.BoundBox.intersect(shape1.BoundBox):
+            self.bboxRejects += 1
+            return False
+        key = tuple(sorted((self.shapeHash(shape0), self.shapeHash(shape1))))
+        result = self.results.get(key)
+        if result is not None:
+            self.results.move_to_end(key)
+            self.hits += 1
+            return result
+        if shape0.distToShape(shape1)[0] > self.tolerance:
+            self.distanceRejects += 1
+            result = False
+        else:
+            self.exactChecks += 1
+            result = hasCommonVolume([shape0, shape1], self.tolerance)
+        self.results[key] = result
+        while len(self.results) > self.max_entries:
+            self.results.popitem(last=False)
+        return result
+
+    def stats(self):
+        """Return the check statistics.
+
+        Returns
+        -------
+        dict with the number of checks, of checks decided by each stage, and of
+        boolean intersections avoided.
+
+        """
+        return {
+            "checks": self.checks,
+            "bbox_rejects": self.bboxRejects,
+            "hits": self.hits,
+            "distance_rejects": self.distanceRejects,
+            "exact_checks": self.exactChecks,
+            "avoided_intersections": self.checks - self.exactChecks,
+        }
@@ -3,6 +3,8 @@
 
 """Sketch manipulation."""
 
+import itertools
+import logging
 from copy import deepcopy
 
 import FreeCAD
@@ -33,6 +35,7 @@ def findSegments(sketch):
     In FC0.17 sketches contain wires by default.
     """
     lineSegments = []
+    ensureRecomputed(sketch)
     for wire in sketch.Shape.Wires:
         for edge in wire.Edges:
             lineSegments.append(
@@ -123,6 +126,303 @@ def findCycle(lineSegments, startingIndex, availSegIDs):
     return segList
 
 
+_neighbourCells = list(itertools.product((-1, 0, 1), repeat=3))
+
+
+def _endpointNodes(lineSegments, tol):
+    """Cluster the endpoints of line segments that lie within tol of each other
+    (in the 1-norm), using a hash grid of quantized coordinates.
+
+    Parameters
+    ----------
+    lineSegments :
+        ndarray with [lineSegmentIndex,start/end point,coordinate]
+    tol :
+        matching tolerance
+
+    Returns
+    -------
+    Array of node indices with [lineSegmentIndex,start/end point], and the list of
+    segment indices touching each node.
+
+    """
+    points = [tuple(p) for p in lineSegments.reshape(-1, 3).tolist()]
+    parent = list(range(len(points)))
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    grid = {}
+    for k, point in enumerate(points):
+        cell = tuple(int(np.floor(c / tol)) for c in point)
+        for offset in _neighbourCells:
+            neighbour = (cell[0] + offset[0], cell[1] + offset[1], cell[2] + offset[2])
+            for other in grid.get(neighbour, ()):
+                distance = sum(abs(a - b) for a, b in zip(point, points[other]))
+                if distance <= tol:
+                    parent[find(k)] = find(other)
+        grid.setdefault(cell, []).append(k)
+
+    nodeIDs = {}
+    nodeOf = np.empty((len(lineSegments), 2), dtype=int)
+    members = []
+    for k in range(len(points)):
+        root = find(k)
+        if root not in nodeIDs:
+            nodeIDs[root] = len(members)
+            members.append([])
+        nodeOf[k // 2, k % 2] = nodeIDs[root]
+        members[nodeIDs[root]].append(k // 2)
+    return nodeOf, members
+
+
+def traceSegmentChains(lineSegments, tol=1e-8):
+    """Order line segments into closed cycles and open chains in linear time.
+    Segments are flipped in place where necessary, so that the end point of each
+    segment in a chain is the start point of the next one. Chains stop at open ends
+    and at junctions where more than two segments meet. The chains between
+    junctions are then joined into cycles, taking the next chain counterclockwise at
+    every junction, so that e.g. a figure-eight or two polygons touching at a corner
+    give one cycle per face. Chains that can't be closed stay open.
+
+    Parameters
+    ----------
+    lineSegments :
+        ndarray with [lineSegmentIndex,start/end point,coordinate]
+    tol :
+        repair tolerance for matching (Default value = 1e-8)
+
+    Returns
+    -------
+    Tuple of the list of cycles, the list of open chains (both lists of segment
+    indices) and the list of ambiguous junctions as (point, segment indices).
+
+    """
+    nodeOf, members = _endpointNodes(lineSegments, tol)
+
+    def flip(seg):
+        lineSegments[seg] = lineSegments[seg, ::-1].copy()
+        nodeOf[seg] = nodeOf[seg, ::-1].copy()
+
+    def follow(seg, end):
+        """Return the unique other segment at the given end of seg, or None."""
+        others = [other for other in members[nodeOf[seg, end]] if other != seg]
+        return others[0] if len(others) == 1 else None
+
+    visited = np.zeros(len(lineSegments), dtype=bool)
+    cycles = []
+    openChains = []
+    for start in range(len(lineSegments)):
+        if visited[start]:
+            continue
+        visited[start] = True
+        chain = [start]
+        closed = False
+        current = start
+        while True:  # forward from the end point of start
+            seg = follow(current, 1)
+            if seg == start:
+                closed = True
+                break
+            if seg is None or visited[seg]:
+                break
+            if nodeOf[seg, 0] != nodeOf[current, 1]:
+                flip(seg)
+            visited[seg] = True
+            chain.append(seg)
+            current = seg
+        if closed:
+            cycles.append(chain)
+            continue
+        head = []
+        current = start
+        while True:  # backward from the start point of start
+            seg = follow(current, 0)
+            if seg is None or visited[seg]:
+                break
+            if nodeOf[seg, 1] != nodeOf[current, 0]:
+                flip(seg)
+            visited[seg] = True
+            head.append(seg)
+            current = seg
+        chain = head[::-1] + chain
+        openChains.append(chain)
+
+    # Join the chains that end at junctions on both sides into cycles
+    def isJunction(node):
+        return len(members[node]) > 2
+
+    def betweenJunctions(chain):
+        return isJunction(nodeOf[chain[0], 0]) and isJunction(nodeOf[chain[-1], 1])
+
+    openChains, junctionChains = (
+        [c for c in openChains if not betweenJunctions(c)],
+        [c for c in openChains if betweenJunctions(c)],
+    )
+    for chain in junctionChains:
+        if nodeOf[chain[0], 0] == nodeOf[chain[-1], 1]:
+            cycles.append(chain)
+    junctionChains = [c for c in junctionChains if nodeOf[c[0], 0] != nodeOf[c[-1], 1]]
+    joined = set()
+    for cycle in _joinChains(lineSegments, nodeOf, junctionChains, flip):
+        cycles.append(cycle)
+        joined.update(cycle)
+    openChains += [c for c in junctionChains if c[0] not in joined]
+    junctionNodes = {}  # ordered set
+    for chain in openChains:
+        for node in (nodeOf[chain[0], 0], nodeOf[chain[-1], 1]):
+            if isJunction(node):
+                junctionNodes[node] = None
+
+    junctions = []
+    for node in junctionNodes:
+        seg = members[node][0]
+        end = 0 if nodeOf[seg, 0] == node else 1
+        point = tuple(float(c) for c in lineSegments[seg, end])
+        junctions.append((point, sorted(set(members[node]))))
+    return cycles, openChains, junctions
+
+
+def _joinChains(lineSegments, nodeOf, chains, flip):
+    """Join chains between junction nodes into the cycles bounding faces.
+
+    Every chain is traversed in both directions, always continuing with the chain
+    that turns most to the left at a junction, in the plane of the segments. This
+    traces the boundaries of all faces of the planar graph of chains. The bounded
+    faces are then taken from small to large, skipping faces that reuse a chain of
+    an earlier one, since a segment can only be oriented for one cycle.
+
+    Parameters
+    ----------
+    lineSegments :
+        ndarray with [lineSegmentIndex,start/end point,coordinate]
+    nodeOf :
+        ndarray of node indices with [lineSegmentIndex,start/end point]
+    chains :
+        list of oriented chains of segment indices
+    flip :
+        function reversing a segment in lineSegments and nodeOf
+
+    Returns
+    -------
+    List of cycles of segment indices, oriented like the chains of
+    traceSegmentChains.
+
+    """
+    if not chains:
+        return []
+    # In-plane basis of the segments for measuring turning angles and areas
+    points = lineSegments.reshape(-1, 3)
+    basis = np.linalg.svd(points - points.mean(axis=0), full_matrices=False)[2][:2]
+    flat = lineSegments @ basis.T
+
+    # Half chains (chain index, forward) with their end nodes and end directions
+    halves = [(i, forward) for i in range(len(chains)) for forward in (True, False)]
+
+    def ends(half):
+        chain, forward = chains[half[0]], half[1]
+        if forward:
+            return nodeOf[chain[0], 0], nodeOf[chain[-1], 1]
+        return nodeOf[chain[-1], 1], nodeOf[chain[0], 0]
+
+    def leaving(half):
+        chain, forward = chains[half[0]], half[1]
+        if forward:
+            return flat[chain[0], 1] - flat[chain[0], 0]
+        return flat[chain[-1], 0] - flat[chain[-1], 1]
+
+    def arriving(half):
+        chain, forward = chains[half[0]], half[1]
+        if forward:
+            return flat[chain[-1], 1] - flat[chain[-1], 0]
+        return flat[chain[0], 0] - flat[chain[0], 1]
+
+    outgoing = {}
+    for k, half in enumerate(halves):
+        outgoing.setdefault(ends(half)[0], []).append(k)
+
+    def nextHalf(k):
+        back = -arriving(halves[k])
+        best = None
+        for other in outgoing[ends(halves[k])[1]]:
+            direction = leaving(halves[other])
+            angle = np.arctan2(
+                back[0] * direction[1] - back[1] * direction[0], back @ direction
+            ) % (2 * np.pi)
+            # Turning back along the same chain is the last resort
+            if other == k ^ 1:
+                angle = -1.0
+            if best is None or angle > best[0]:
+                best = (angle, other)
+        return best[1]
+
+    faces = []
+    visited = [False] * len(halves)
+    for start in range(len(halves)):
+        face = []
+        k = start
+        while not visited[k]:
+            visited[k] = True
+            face.append(k)
+            k = nextHalf(k)
+        if k != start:
+            continue  # degenerate geometry that doesn't close up
+        area = 0.0
+        for k in face:
+            i, forward = halves[k]
+            for seg in chains[i]:
+                a, b = flat[seg] if forward else flat[seg, ::-1]
+                area += a[0] * b[1] - a[1] * b[0]
+        faces.append((area / 2, face))
+
+    # The largest face by magnitude is an unbounded one, bounded faces turn the
+    # other way
+    sign = -np.sign(max(faces, key=lambda f: abs(f[0]))[0])
+    tol = 1e-12 * max(np.ptp(flat.reshape(-1, 2), axis=0)) ** 2
+    bounded = sorted((abs(area), face) for area, face in faces if area * sign > tol)
+    # Chains through the same nodes, e.g. an edge drawn once for each of two
+    # adjacent polygons, can stand in for each other. Node sequences are taken
+    # before any chain is flipped.
+    chainNodes = [
+        tuple([nodeOf[chain[0], 0]] + [nodeOf[seg, 1] for seg in chain])
+        for chain in chains
+    ]
+    twins = {}
+    for i, nodes in enumerate(chainNodes):
+        twins.setdefault(min(nodes, nodes[::-1]), []).append(i)
+
+    def substitute(i, forward):
+        nodes = chainNodes[i]
+        for j in twins[min(nodes, nodes[::-1])]:
+            if not used[j]:
+                return j, forward == (chainNodes[j] == nodes)
+        return None
+
+    used = [False] * len(chains)
+    cycles = []
+    for _, face in bounded:
+        face = [
+            halves[k] if not used[halves[k][0]] else substitute(*halves[k])
+            for k in face
+        ]
+        if None in face or len({i for i, _ in face}) < len(face):
+            continue
+        cycle = []
+        for i, forward in face:
+            used[i] = True
+            if forward:
+                cycle += chains[i]
+            else:
+                for seg in chains[i]:
+                    flip(seg)
+                cycle += chains[i][::-1]
+        cycles.append(cycle)
+    return cycles
+
+
 # ~ def findCycle2(sketch, lineSegments, idx):
 # ~ '''Find a cycle in a collection of line segments given a starting index.
 # ~ Return the list of indices in the cycle.
@@ -134,7 +434,7 @@ def findCycle(lineSegments, startingIndex, availSegIDs):
 # ~ if idx in wire
 
 
-def addCycleSketch(name, wire):
+def addCycleSketch(name, wire, editable=False):
     """Add a sketch of a cycle (closed wire) to a FC document.
 
     Parameters
@@ -143,6 +443,9 @@ def addCycleSketch(name, wire):
 
     wire :
 
+    editable :
+        whether to add coincidence constraints between consecutive segments, so
+        that the sketch can be edited in the GUI (Default value = False)
 
     Returns
     -------
@@ -159,6 +462,7 @@ def addCycleSketch(name, wire):
     # ~ return Draft.makeSketch([wire], name=name, autoconstraints=True)
 
     sketch = doc.addObject("Sketcher::SketchObject", name)
+    segments = []
     for i, edge in enumerate(wire.Edges):
         v0 = vec(tuple(edge.Vertexes[0].Point))
         v1 = vec(tuple(edge.Vertexes[1].Point))
@@ -167,15 +471,19 @@ def addCycleSketch(name, wire):
                 v1 = vec(tuple(edge.Vertexes[0].Point))
                 v0 = vec(tuple(edge.Vertexes[1].Point))
         old_v1 = v1
-        sketch.addGeometry(Part.LineSegment(v0, v1))
-        if i > 0:
-            sketch.addConstraint(Sketcher.Constraint("Coincident", i - 1, 2, i, 1))
-    sketch.addConstraint(Sketcher.Constraint("Coincident", i, 2, 0, 1))
-    doc.recompute()
+        segments.append(Part.LineSegment(v0, v1))
+    # Adding all geometry (and constraints) in one call solves the sketch only once
+    sketch.addGeometry(segments, False)
+    if editable:
+        n = len(segments)
+        sketch.addConstraint(
+            [Sketcher.Constraint("Coincident", i, 2, (i + 1) % n, 1) for i in range(n)]
+        )
+    recompute(doc)
     return sketch
 
 
-def addPolyLineSketch(name, doc, segmentOrder, lineSegments):
+def addPolyLineSketch(name, doc, segmentOrder, lineSegments, editable=False):
     """Add a sketch given segment order and line segments.
 
     Parameters
@@ -188,6 +496,9 @@ def addPolyLineSketch(name, doc, segmentOrder, lineSegments):
 
     lineSegments :
 
+    editable :
+        whether to add coincidence constraints between connected segments
+        (Default value = False)
 
     Returns
     -------
@@ -197,42 +508,115 @@ def addPolyLineSketch(name, doc, segmentOrder, lineSegments):
     if doc.getObject(name) is not None:
         raise ValueError(f"Sketch with name '{name}' already exists.")
     obj = doc.addObject("Sketcher::SketchObject", name)
-    for segIndex, segment in enumerate(lineSegments):
-        startPoint = segment[0, :]
-        endPoint = segment[1, :]
-        obj.addGeometry(Part.LineSegment(vec(tuple(startPoint)), vec(tuple(endPoint))))
-    for i in range(len(lineSegments)):
-        connectIndex = segmentOrder[i]
-        if connectIndex < len(lineSegments):
-            obj.addConstraint(Sketcher.Constraint("Coincident", i, 2, connectIndex, 1))
-    doc.recompute()
+    obj.addGeometry(
+        [
+            Part.LineSegment(vec(tuple(segment[0, :])), vec(tuple(segment[1, :])))
+            for segment in lineSegments
+        ],
+        False,
+    )
+    if editable:
+        constraints = []
+        for i in range(len(lineSegments)):
+            connectIndex = segmentOrder[i]
+            if connectIndex < len(lineSegments):
+                constraints.append(
+                    Sketcher.Constraint("Coincident", i, 2, connectIndex, 1)
+                )
+        if constraints:
+            obj.addConstraint(constraints)
+    recompute(doc)
     return obj
 
 
-def findEdgeCycles(sketch):  # TODO: port objectConstruction crossection stuff
+def addPolygonSketch(name, doc, polygons):
+    """Add an unconstrained sketch of closed polygons with a single geometry call.
+
+    Parameters
+    ----------
+    name :
+        name of the sketch
+    doc :
+        FreeCAD document
+    polygons :
+        list of (n, 2) or (n, 3) vertex arrays, without repeating the first vertex
+
+    Returns
+    -------
+    The sketch.
+
+    """
+    if doc.getObject(name) is not None:
+        raise ValueError(f"Sketch with name '{name}' already exists.")
+    segments = []
+    for polygon in polygons:
+        points = np.zeros((len(polygon), 3))
+        points[:, : np.shape(polygon)[1]] = polygon
+        for p0, p1 in zip(points, np.roll(points, -1, axis=0)):
+            segments.append(Part.LineSegment(vec(*p0), vec(*p1)))
+    sketch = doc.addObject("Sketcher::SketchObject", name)
+    sketch.addGeometry(segments, False)
+    recompute(doc)
+    return sketch
+
+
+def findEdgeCycles(sketch, tol=1e-8, returnDiagnostics=False):
     """Find the list of edges in a sketch and separate them into cycles.
+    Cycles sharing vertices are split at the shared vertices. Open chains, including
+    chains between two junctions that cannot be assigned to a cycle, and the
+    junctions they hang from are logged and skipped.
 
     Parameters
     ----------
     sketch :
 
+    tol :
+        repair tolerance for matching (Default value = 1e-8)
+    returnDiagnostics :
+        whether to also return the open chains and ambiguous junctions
+        (Default value = False)
 
     Returns
     -------
-
+    The line segments and the list of cycles. With returnDiagnostics, also a dict
+    with the "openChains" and "ambiguousJunctions" as returned by
+    traceSegmentChains.
 
     """
     lineSegments = findSegments(sketch)
-    # Next, detect cycles:
-    availSegIDs = range(lineSegments.shape[0])
-    cycles = []
-    for _ in range(lineSegments.shape[0]):
-        if len(availSegIDs) <= 0:
-            break
-        startingIndex = availSegIDs[0]
-        newCycle = findCycle(lineSegments, startingIndex, availSegIDs)
-        cycles += [newCycle]
-        availSegIDs = [item for item in availSegIDs if item not in newCycle]
+    if len(lineSegments) == 0:
+        cycles, openChains, junctions = [], [], []
+    else:
+        cycles, openChains, junctions = traceSegmentChains(lineSegments, tol)
+    junctionPoints = np.array([point for point, _ in junctions]).reshape(-1, 3)
+
+    def atJunction(point):
+        return (np.linalg.norm(junctionPoints - point, axis=1) <= tol).any()
+
+    for chain in openChains:
+        if atJunction(lineSegments[chain[0], 0]) and atJunction(
+            lineSegments[chain[-1], 1]
+        ):
+            logging.warning(
+                "Chain of segments %s between junctions in sketch %s does not "
+                "belong to a unique cycle",
+                chain,
+                sketch.Name,
+            )
+        else:
+            logging.warning(
+                "Open chain of segments %s in sketch %s", chain, sketch.Name
+            )
+    for point, segs in junctions:
+        logging.warning(
+            "Ambiguous junction of segments %s at %s in sketch %s",
+            segs,
+            point,
+            sketch.Name,
+        )
+    if returnDiagnostics:
+        diagnostics = {"openChains": openChains, "ambiguousJunctions": junctions}
+        return lineSegments, cycles, diagnostics
     return lineSegments, cycles
 
 
@@ -249,28 +633,37 @@ def findEdgeCycles2(sketch):
 
 
     """
+    ensureRecomputed(sketch)
     return sketch.Shape.Wires
 
 
-def splitSketch(sketch):
+def splitSketch(sketch, editable=False):
     """Splits a sketch into several, returning a list of names of the new sketches.
+    The new sketches are unconstrained unless editable is set, which keeps the
+    split linear in the number of edges.
 
     Parameters
     ----------
     sketch :
 
+    editable :
+        whether to add coincidence constraints to the new sketches
+        (Default value = False)
 
     Returns
     -------
 
 
     """
+    ensureRecomputed(sketch)
     if not sketch.Shape.Wires:
         raise ValueError("No wires in sketch.")
-    return [
-        addCycleSketch(f"{sketch.Name}_{i}", wire)
-        for i, wire in enumerate(sketch.Shape.Wires)
-    ]
+    # One recompute for all new sketches instead of one per wire
+    with deferredRecompute(sketch.Document):
+        return [
+            addCycleSketch(f"{sketch.Name}_{i}", wire, editable=editable)
+            for i, wire in enumerate(sketch.Shape.Wires)
+        ]
 
 
 def extendSketch(sketch, d):
@@ -291,16 +684,16 @@ def extendSketch(sketch, d):
     """
     doc = FreeCAD.ActiveDocument
     segments = findSegments(sketch)
-    connections = []
-    for i in range(len(segments)):
-        try:
-            connecting = nextSegment(segments, i)
-        except:
-            connecting = len(segments)
-        connections += [connecting]
+    cycles, openChains, junctions = traceSegmentChains(segments)
+    if cycles or junctions or len(openChains) != 1:
+        raise ValueError(f"Sketch {sketch.Name} is not a single open polyline.")
+    chain = openChains[0]
+    connections = [len(segments)] * len(segments)
+    for seg, nextSeg in zip(chain[:-1], chain[1:]):
+        connections[seg] = nextSeg
     # Find the first and last segments:
-    seg0Index = [i for i in range(len(segments)) if i not in connections][0]
-    seg1Index = connections.index(len(segments))
+    seg0Index = chain[0]
+    seg1Index = chain[-1]
     segIndices = [seg0Index, seg1Index]
 
     # Since we automatically reorder these, we know the orientation.
@@ -361,7 +754,8 @@ def makeIntoSketch(inputObj, sketchName=None):
     """
     if sketchName is None:
         sketchName = inputObj.Name + "_sketch"
+    ensureRecomputed(inputObj)
     returnSketch = Draft.makeSketch(inputObj, autoconstraints=True, name=sketchName)
     deepRemove(obj=inputObj)
-    FreeCAD.ActiveDocument.recompute()
+    recompute()
     return returnSketch
@@ -1,11 +1,19 @@
-from shapely.geometry import LinearRing, LineString, MultiLineString, Polygon
+import shapely
+from shapely.geometry import LinearRing, LineString, MultiLineString, Point, Polygon
+from shapely.geometry import box
 from shapely.ops import unary_union
+from shapely.prepared import prep
+from shapely.strtree import STRtree
 from typing import List, Optional, Sequence, Union
 import numpy as np
 from matplotlib.axes import Axes
 import matplotlib._color_data as mcd
 from .geo_data_base import GeoData
 
+# Shapely 2 has vectorized predicates and bulk STRtree queries, shapely 1 falls
+# back to one prepared predicate per geometry
+_SHAPELY_2 = int(shapely.__version__.split(".")[0]) >= 2
+
 
 class Geo2DData(GeoData):
     def __init__(self, lunit="nm"):
@@ -186,3 +194,194 @@ class Geo2DData(GeoData):
         # Set axis to auto. The user can change this later if he wishes
         ax.axis("auto")
         return ax
+
+
+class Geo2DPartMap:
+    def __init__(
+        self,
+        geo: Geo2DData,
+        part_names: Optional[Sequence[str]] = None,
+        grid_size: Optional[int] = 512,
+    ):
+        """Map points to the polygon parts of a 2D geometry containing them.
+
+        Where parts overlap, the part that comes first in `part_build_order()` wins;
+        points on a boundary belong to the part. Points outside of all parts map to
+        None. Points are first looked up in a raster of the bounding box, whose cells
+        are resolved up front if they are covered by their first part or touch no
+        part. Only points in the remaining cells along part boundaries are located
+        exactly, with a bulk query of a shapely STRtree and vectorized predicates.
+        With shapely 1, the queries and predicates run per geometry instead.
+
+        Parameters
+        ----------
+        geo : Geo2DData
+            Geometry to locate points in
+        part_names : Optional[Sequence[str]]
+            Parts to consider, in order of priority, by default
+            geo.part_build_order()
+        grid_size : Optional[int]
+            Number of raster cells along the longer side of the bounding box, by
+            default 512. None locates all points exactly.
+        """
+        if part_names is None:
+            part_names = geo.part_build_order()
+        self.partIds = list(part_names)
+        self.missing = len(self.partIds)
+        self.parts = _object_array([geo.parts[name] for name in self.partIds])
+        if _SHAPELY_2:
+            shapely.prepare(self.parts)
+            self.tree = shapely.STRtree(self.parts)
+        else:
+            self._prepared = [prep(part) for part in self.parts]
+            self._tree_ids = {id(part): i for i, part in enumerate(self.parts)}
+            self.tree = STRtree(list(self.parts)) if self.partIds else None
+        self._names = np.array(self.partIds + [None], dtype=object)
+        self.grid = None
+        if grid_size is not None and self.partIds:
+            self._build_grid(grid_size)
+
+    def _build_grid(self, grid_size: int):
+        """Rasterize the parts into self.grid, with -1 for unresolved cells.
+
+        Parameters
+        ----------
+        grid_size : int
+            Number of cells along the longer side of the bounding box
+        """
+        bounds = np.array([part.bounds for part in self.parts])
+        x0, y0 = bounds[:, :2].min(axis=0)
+        x1, y1 = bounds[:, 2:].max(axis=0)
+        self.bounds = (x0, y0, x1, y1)
+        self.cell = max(x1 - x0, y1 - y0, np.finfo(float).tiny) / grid_size
+        nx = max(int(np.ceil((x1 - x0) / self.cell)), 1)
+        ny = max(int(np.ceil((y1 - y0) / self.cell)), 1)
+        ix, iy = np.meshgrid(np.arange(nx), np.arange(ny), indexing="ij")
+        ix, iy = ix.ravel(), iy.ravel()
+        cells = _boxes(
+            x0 + ix * self.cell,
+            y0 + iy * self.cell,
+            x0 + (ix + 1) * self.cell,
+            y0 + (iy + 1) * self.cell,
+        )
+        cell_idx, part_idx = self._intersecting(cells)
+        first = np.full(len(cells), self.missing, dtype=np.intp)
+        np.minimum.at(first, cell_idx, part_idx)
+        grid = first.astype(np.int32)
+        touched = first < self.missing
+        if _SHAPELY_2:
+            covered = shapely.covers(self.parts[first[touched]], cells[touched])
+        else:
+            covered = np.array(
+                [
+                    self._prepared[i].covers(cell)
+                    for i, cell in zip(first[touched], cells[touched])
+                ],
+                dtype=bool,
+            )
+        grid[np.flatnonzero(touched)[~covered]] = -1
+        self.grid = grid.reshape(nx, ny)
+
+    def _intersecting(self, geoms: np.ndarray):
+        """Return the index pairs of geometries and parts that intersect.
+
+        Parameters
+        ----------
+        geoms : np.ndarray
+            Object array of shapely geometries
+        Returns
+        -------
+        Tuple of integer arrays of geometry and part indices.
+
+        """
+        if _SHAPELY_2:
+            return self.tree.query(geoms, predicate="intersects")
+        pairs = [
+            (i, self._tree_ids[id(part)])
+            for i, geom in enumerate(geoms)
+            for part in (self.tree.query(geom) if self.tree is not None else [])
+        ]
+        pairs = [(i, j) for i, j in pairs if self._prepared[j].intersects(geoms[i])]
+        return tuple(np.array(pairs, dtype=np.intp).reshape(-1, 2).T)
+
+    def _locate_exact(self, xy: np.ndarray) -> np.ndarray:
+        """Locate (n, 2) points with the STRtree, without the raster."""
+        codes = np.full(len(xy), self.missing, dtype=np.intp)
+        # Tree indices are build order ranks, so the first part wins
+        point_idx, part_idx = self._intersecting(_points(xy))
+        np.minimum.at(codes, point_idx, part_idx)
+        return codes
+
+    def locate(self, x) -> Union[int, np.ndarray]:
+        """Find the indices into partIds of the parts containing one or more points.
+
+        Parameters
+        ----------
+        x :
+            Coordinate vector or array of coordinate vectors. Only the first two
+            coordinates are used.
+        Returns
+        -------
+        Index or integer array of indices of the same shape as `x` except for the
+        last axis, with `missing` for points outside of all parts.
+
+        """
+        x = np.asanyarray(x, dtype=float)
+        xy = np.ascontiguousarray(x.reshape(-1, x.shape[-1])[:, :2])
+        if self.grid is None:
+            codes = self._locate_exact(xy)
+        else:
+            x0, y0, x1, y1 = self.bounds
+            nx, ny = self.grid.shape
+            inside = (xy[:, 0] >= x0) & (xy[:, 0] <= x1)
+            inside &= (xy[:, 1] >= y0) & (xy[:, 1] <= y1)
+            codes = np.full(len(xy), self.missing, dtype=np.intp)
+            idx = np.flatnonzero(inside)
+            ix = np.minimum(((xy[idx, 0] - x0) / self.cell).astype(np.intp), nx - 1)
+            iy = np.minimum(((xy[idx, 1] - y0) / self.cell).astype(np.intp), ny - 1)
+            codes[idx] = self.grid[ix, iy]
+            boundary = np.flatnonzero(codes < 0)
+            codes[boundary] = self._locate_exact(xy[boundary])
+        if x.ndim == 1:
+            return int(codes[0])
+        return codes.reshape(x.shape[:-1])
+
+    def __call__(self, x) -> Union[Optional[str], np.ndarray]:
+        """Find the parts containing one or more points.
+
+        Parameters
+        ----------
+        x :
+            Coordinate vector or array of coordinate vectors.
+        Returns
+        -------
+        Part name (or None) or object array of part names of the same shape as `x`
+        except for the last axis.
+
+        """
+        codes = self.locate(x)
+        if np.isscalar(codes):
+            return self._names[codes]
+        return self._names.take(codes)
+
+
+def _boxes(x0, y0, x1, y1) -> np.ndarray:
+    """Object array of the boxes with the given arrays of corner coordinates."""
+    if _SHAPELY_2:
+        return shapely.box(x0, y0, x1, y1)
+    return _object_array([box(*corners) for corners in zip(x0, y0, x1, y1)])
+
+
+def _points(xy: np.ndarray) -> np.ndarray:
+    """Object array of the points with the given (n, 2) coordinates."""
+    if _SHAPELY_2:
+        return shapely.points(xy)
+    return _object_array([Point(x, y) for x, y in xy])
+
+
+def _object_array(geoms: Sequence) -> np.ndarray:
+    """Object array of shapely geometries, without numpy unpacking shapely 1 ones."""
+    result = np.empty(len(geoms), dtype=object)
+    for i, geom in enumerate(geoms):
+        result[i] = geom
+    return result
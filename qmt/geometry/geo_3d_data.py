@@ -2,8 +2,14 @@
 Contains the Geo3DData class, which is used to describe a 3D geometry
 """
 
-from qmt.infrastructure import load_serial, store_serial, write_deserialised
-from typing import Any, Dict, List, Optional, Tuple
+from qmt.infrastructure import (
+    ScratchBackend,
+    SerialBlob,
+    load_serial,
+    store_serial,
+    write_deserialised,
+)
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from .part_3d import Geo3DPart
 import numpy as np
 import fenics as fn
@@ -13,6 +19,7 @@ from FreeCAD import Base
 from shapely.geometry import LineString, MultiLineString, Polygon
 from .geo_2d_data import Geo2DData
 from .geo_data_base import GeoData
+from .voxel_map import VoxelPartMap, voxelize_parts
 
 
 class Geo3DData(GeoData):
@@ -27,7 +34,25 @@ class Geo3DData(GeoData):
         # A cross section is a dict with axis and distance fields
         # E.g. xsec_dict={"test_xsec": {"axis": (1, 0, 0), "distance": 0}}
         self.xsecs: Dict[str, Dict] = {}
-        self.serial_fcdoc: str = None  # serialized FreeCAD document for this geometry
+        # serialized FreeCAD document for this geometry
+        self.serial_fcdoc: Optional[SerialBlob] = None
+        # Part.Solid of built parts by part name, loaded on demand and not pickled
+        self._solids: Dict[str, Any] = {}
+        # VoxelPartMap of built parts by voxel_part_map arguments
+        self.voxel_maps: Dict[str, VoxelPartMap] = {}
+        # Tessellation options of the build, the default of write_stl
+        self.mesh_options: Optional[Dict] = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_solids", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._solids = {}
+        self.__dict__.setdefault("voxel_maps", {})
+        self.__dict__.setdefault("mesh_options", None)
 
     def add_part(self, part_name: str, part: Geo3DPart, overwrite: bool = False):
         """Add a part to this geometry.
@@ -47,6 +72,8 @@ class Geo3DData(GeoData):
             overwrite,
             lambda p: self.build_order.append(p.label) if p is not None else None,
         )
+        self._solids.pop(part_name, None)
+        self.voxel_maps.clear()
 
     def remove_part(self, part_name: str, ignore_if_absent: bool = False):
         """Remove a part from this geometry.
@@ -59,11 +86,13 @@ class Geo3DData(GeoData):
             Whether we ignore an attempted removal if the part name is not present, by
             default False
         """
-        super.remove_part(
+        super().remove_part(
             part_name,
             ignore_if_absent,
-            lambda p: self.build_order.remove(p) if p is not None else None,
+            lambda p: self.build_order.remove(p.label) if p is not None else None,
         )
+        self._solids.pop(part_name, None)
+        self.voxel_maps.clear()
 
     def add_xsec(
         self,
@@ -96,7 +125,14 @@ class Geo3DData(GeoData):
             "polygons": polygons,
         }
 
-    def set_data(self, data_name: str, data: Any, scratch_dir: Optional[str] = None):
+    def set_data(
+        self,
+        data_name: str,
+        data: Any,
+        scratch_dir: Optional[str] = None,
+        compression: Optional[str] = None,
+        scratch: Optional[ScratchBackend] = None,
+    ):
         """Set data to a serial format that is easily portable.
 
         Parameters
@@ -109,6 +145,12 @@ class Geo3DData(GeoData):
             The corresponding data that we would like to set.
         scratch_dir : str
             Optional existing temporary (fast) storage location. (Default value = None)
+        compression : str
+            Optional codec ("zlib", "bz2" or "lzma") for the stored blob.
+            (Default value = None)
+        scratch : ScratchBackend
+            Optional backend for the temporary files, e.g. a SharedMemoryScratch.
+            Takes precedence over scratch_dir. (Default value = None)
         Returns
         -------
         None
@@ -119,8 +161,16 @@ class Geo3DData(GeoData):
                 doc.saveAs(path)
 
             self.serial_fcdoc = store_serial(
-                data, _save_fct, "fcstd", scratch_dir=scratch_dir
+                data,
+                _save_fct,
+                "fcstd",
+                scratch_dir=scratch_dir,
+                compression=compression,
+                scratch=scratch,
             )
+            # Solids and voxel maps may have been loaded from the old document
+            self._solids.clear()
+            self.voxel_maps.clear()
 
         elif data_name == "mesh" or data_name == "rmf":
 
@@ -129,17 +179,32 @@ class Geo3DData(GeoData):
 
             if data_name == "mesh":
                 self.serial_mesh = store_serial(
-                    data, _save_fct, "xml", scratch_dir=scratch_dir
+                    data,
+                    _save_fct,
+                    "xml",
+                    scratch_dir=scratch_dir,
+                    compression=compression,
+                    scratch=scratch,
                 )
             if data_name == "rmf":
                 self.serial_region_marker = store_serial(
-                    data, _save_fct, "xml", scratch_dir=scratch_dir
+                    data,
+                    _save_fct,
+                    "xml",
+                    scratch_dir=scratch_dir,
+                    compression=compression,
+                    scratch=scratch,
                 )
 
         else:
             raise ValueError(f"{data_name} was not a valid data_name.")
 
-    def get_data(self, data_name: str, scratch_dir: Optional[str] = None):
+    def get_data(
+        self,
+        data_name: str,
+        scratch_dir: Optional[str] = None,
+        scratch: Optional[ScratchBackend] = None,
+    ):
         """Get data from stored serial format.
 
         Parameters
@@ -148,6 +213,9 @@ class Geo3DData(GeoData):
             "fcdoc" freeCAD document.
         scratch_dir : str
             Optional existing temporary (fast) storage location. (Default value = None)
+        scratch : ScratchBackend
+            Optional backend for the temporary files. Takes precedence over
+            scratch_dir. (Default value = None)
         mesh :
             (Default value = None)
         Returns
@@ -162,7 +230,13 @@ class Geo3DData(GeoData):
                 doc.load(path)
                 return doc
 
-            return load_serial(self.serial_fcdoc, _load_fct, scratch_dir=scratch_dir)
+            return load_serial(
+                self.serial_fcdoc,
+                _load_fct,
+                ext_format="fcstd",
+                scratch_dir=scratch_dir,
+                scratch=scratch,
+            )
         else:
             raise ValueError(f"{data_name} was not a valid data_name.")
 
@@ -188,6 +262,211 @@ class Geo3DData(GeoData):
         write_deserialised(self.serial_fcdoc, file_path)
         return file_path
 
+    def _part_breps(self, part_names: List[str]) -> List[str]:
+        """Return the BReps of built parts, from the parts or the FreeCAD document.
+
+        Parameters
+        ----------
+        part_names : List[str]
+            Names of the parts
+        Returns
+        -------
+        List of BRep strings
+
+        """
+        breps = {name: self.parts[name].serial_brep for name in part_names}
+        missing = [name for name, brep in breps.items() if brep is None]
+        if missing:
+            doc = self.get_data("fcdoc")
+            try:
+                for name in missing:
+                    obj = doc.getObject(self.parts[name].built_fc_name)
+                    breps[name] = obj.Shape.exportBrepToString()
+            finally:
+                FreeCAD.closeDocument("instance")
+        return [breps[name] for name in part_names]
+
+    def _write_parts(
+        self,
+        ext_format: str,
+        file_path: str,
+        part_names: Optional[List[str]],
+        mesh_options: Optional[Dict] = None,
+    ) -> str:
+        from .freecad.fileIO import serializeBreps
+
+        if part_names is None:
+            part_names = [name for name in self.build_order if name in self.parts]
+        blob = serializeBreps(
+            self._part_breps(part_names), part_names, ext_format, mesh_options
+        )
+        write_deserialised(blob, file_path)
+        return file_path
+
+    def write_stp(self, file_path: str, part_names: Optional[List[str]] = None) -> str:
+        """Write several parts into a single multi-part STEP file.
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the STEP file
+        part_names : Optional[List[str]]
+            Parts to write. (Default value = None, all parts in build order)
+        Returns
+        -------
+        file_path
+
+        """
+        return self._write_parts("stp", file_path, part_names)
+
+    def write_stl(
+        self,
+        file_path: str,
+        part_names: Optional[List[str]] = None,
+        mesh_options: Optional[Dict] = None,
+    ) -> str:
+        """Write several parts into a single STL file.
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the STL file
+        part_names : Optional[List[str]]
+            Parts to write. (Default value = None, all parts in build order)
+        mesh_options : Optional[Dict]
+            Tessellation options of qmt.geometry.freecad.fileIO.exportMeshed.
+            (Default value = None, the mesh_options of the build)
+        Returns
+        -------
+        file_path
+
+        """
+        if mesh_options is None:
+            mesh_options = self.mesh_options
+        return self._write_parts("stl", file_path, part_names, mesh_options)
+
+    def slice_parts(
+        self,
+        axis: Tuple[float, float, float] = (1.0, 0.0, 0.0),
+        distances: Sequence[float] = (0.0,),
+        part_names: Optional[List[str]] = None,
+        n_workers: Optional[int] = None,
+    ) -> List[Dict[str, List[np.ndarray]]]:
+        """Slice built parts at many parallel planes, without document objects.
+
+        Parameters
+        ----------
+        axis : Tuple[float, float, float]
+            Normal of the slice planes. (Default value = (1.0, 0.0, 0.0))
+        distances : Sequence[float]
+            Positions of the planes along the axis, e.g. np.linspace(-50, 50, 200).
+            (Default value = (0.0,))
+        part_names : Optional[List[str]]
+            Parts to slice. (Default value = None, all parts in build order)
+        n_workers : Optional[int]
+            If set, the planes are sliced in this many spawned worker processes,
+            which import the main module, so scripts must call this under an
+            ``if __name__ == "__main__":`` guard. (Default value = None)
+        Returns
+        -------
+        List with one dict per plane, mapping each part name to its list of (n, 3)
+        arrays of polygon vertices.
+
+        """
+        from .freecad.sectionUtils import sliceShapes, sliceShapesParallel
+
+        if part_names is None:
+            part_names = [name for name in self.build_order if name in self.parts]
+        breps = dict(zip(part_names, self._part_breps(part_names)))
+        if n_workers:
+            return sliceShapesParallel(breps, axis, distances, n_workers=n_workers)
+        return sliceShapes(breps, axis, distances)
+
+    def _load_solids(self, part_names: List[str]) -> Dict[str, Any]:
+        """Return the solids of built parts, loading all missing ones at once.
+
+        Parameters
+        ----------
+        part_names : List[str]
+            Names of the parts
+        Returns
+        -------
+        Dict from part name to Part.Solid
+
+        """
+        missing = [name for name in part_names if name not in self._solids]
+        if missing:
+            for name, brep in zip(missing, self._part_breps(missing)):
+                shape = Part.Shape()
+                shape.importBrepFromString(brep)
+                self._solids[name] = Part.Solid(shape)
+        return {name: self._solids[name] for name in part_names}
+
+    def contains_points(
+        self, part_name: str, points: np.ndarray, tol: float = 1e-5
+    ) -> np.ndarray:
+        """Check which points lie inside a built part.
+
+        The solid of the part is loaded once and cached on this object; points
+        outside of its bounding box are rejected without a FreeCAD query.
+
+        Parameters
+        ----------
+        part_name : str
+            Name of the part
+        points : np.ndarray
+            Array of 3D points with the coordinates on the last axis
+        tol : float
+            Tolerance of the check, points on the surface count as inside.
+            (Default value = 1e-5)
+        Returns
+        -------
+        Boolean array of the shape of points without the last axis
+
+        """
+        from .freecad.shapeUtils import pointsInside
+
+        return pointsInside(self._load_solids([part_name])[part_name], points, tol)
+
+    def voxel_part_map(
+        self,
+        grid_size: int = 128,
+        part_names: Optional[List[str]] = None,
+        tol: float = 1e-5,
+    ) -> VoxelPartMap:
+        """Voxel label grid of built parts, usable as part_map of a PropertyMap.
+
+        The map is built once per set of arguments and kept in voxel_maps, so that
+        it is pickled (and stored by GeometryCache) along with the geometry.
+
+        Parameters
+        ----------
+        grid_size : int
+            Number of voxels along the longest side of the bounding box of the
+            parts. (Default value = 128)
+        part_names : Optional[List[str]]
+            Parts to map, in order of priority. (Default value = None, all
+            non-virtual parts in build order)
+        tol : float
+            Tolerance of the exact checks near part surfaces.
+            (Default value = 1e-5)
+        Returns
+        -------
+        VoxelPartMap of the parts.
+
+        """
+        if part_names is None:
+            part_names = [
+                name
+                for name in self.build_order
+                if name in self.parts and not self.parts[name].virtual
+            ]
+        key = repr((grid_size, list(part_names), tol))
+        if key not in self.voxel_maps:
+            breps = dict(zip(part_names, self._part_breps(part_names)))
+            self.voxel_maps[key] = voxelize_parts(breps, grid_size, tol)
+        return self.voxel_maps[key]
+
     def xsec_to_2d(self, xsec_name: str, lunit: Optional[str] = None) -> Geo2DData:
         """Generates a Geo2DData from a cross section
 
@@ -299,17 +578,16 @@ class Geo3DData(GeoData):
                         break
             return graph
 
-        def _is_inside(poly, part):
-            """Given a polygon, find a point inside of it, and then check if that point is
-            in the (3D) part
+        def _probe_point(poly):
+            """Given a polygon, find a point inside of it, to be checked against the
+            (3D) part
 
             Parameters
             ----------
             poly :
-            part :
             Returns
             -------
-            Boolean
+            3D point
 
             """
             # Find the midpoint in x, then find the intersections with the polygon on
@@ -320,31 +598,29 @@ class Geo3DData(GeoData):
             x_line = LineString([(x, min_y), (x, max_y)])
             intersec = x_line.intersection(poly)
             if type(intersec) == MultiLineString:
-                intersec = intersec[0]
+                intersec = intersec.geoms[0]
             x_line_intercept_min, x_line_intercept_max = intersec.xy[1].tolist()
             y = (x_line_intercept_min + x_line_intercept_max) / 2
 
-            # Get 3D coordinates and check if it's in the freecad shape
-            x, y, z = _inverse_project([x, y])
-            freecad_solid = Part.Solid(
-                FreeCAD.ActiveDocument.getObject(part.built_fc_name).Shape
-            )
-            return freecad_solid.isInside(Base.Vector(x, y, z), 1e-5, True)
+            # Get 3D coordinates to check against the freecad shape
+            return _inverse_project([x, y])
 
         # Let's deal with the physical domains first, which can have cavities
         geo_2d = Geo2DData()
-        self.get_data("fcdoc")  # The document name is "instance"
+        # Solids are cached across calls, so the document is loaded at most once
+        self._load_solids(list(part_polygons))
         for name, poly_list in part_polygons.items():
             cont_graph = _build_containment_graph(poly_list)
-            polys_to_add = []
             # For each polygon (in each part), we subtract from it all interior polygons
             # And then check if what remains is inside the part or not (it could be a
             # cavity). We add it if it's not a cavity
+            remainders = []
             for poly in poly_list:
                 for interior_poly in cont_graph[poly.name]:
                     poly = poly.difference(interior_poly)
-                if _is_inside(poly, self.parts[name]):
-                    polys_to_add.append(poly)
+                remainders.append(poly)
+            inside = self.contains_points(name, [_probe_point(p) for p in remainders])
+            polys_to_add = [p for p, keep in zip(remainders, inside) if keep]
             if not polys_to_add:
                 continue
             if len(polys_to_add) == 1:
@@ -362,6 +638,4 @@ class Geo3DData(GeoData):
                 geo_2d.add_part(f"{name}_{i}", poly)
 
         geo_2d.lunit = lunit
-        # Clean up freecad document
-        FreeCAD.closeDocument("instance")
         return geo_2d
@@ -0,0 +1,238 @@
+"""
+Contains the GeometryCache class, an on-disk cache of built 3D geometries
+"""
+
+import hashlib
+import os
+import pickle
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from qmt.infrastructure import SerialBlob, as_serial_blob
+from .part_3d import Geo3DPart
+
+# Bump this whenever a change to the builder invalidates previously cached geometries
+CACHE_FORMAT_VERSION = 1
+
+
+def canonical(value: Any) -> Any:
+    """Convert a build input into a nested tuple with a deterministic repr.
+
+    This is the key helper shared by the geometry cache, the per-part build cache
+    and the treatment memo of objectConstruction, so equal inputs hash equally in
+    all three.
+
+    Parameters
+    ----------
+    value : Any
+        Part, parameter or cross-section specification.
+    Returns
+    -------
+    Hashable canonical representation.
+
+    """
+    if isinstance(value, Geo3DPart):
+        # Outputs of a previous build must not influence the key
+        skip = (
+            "built_fc_name",
+            "serial_stl",
+            "serial_stp",
+            "serial_brep",
+            "mesh_options",
+        )
+        items = sorted((k, v) for k, v in vars(value).items() if k not in skip)
+        return (type(value).__name__,) + tuple((k, canonical(v)) for k, v in items)
+    if isinstance(value, dict):
+        return ("dict",) + tuple(
+            (repr(k), canonical(v)) for k, v in sorted(value.items(), key=repr)
+        )
+    if isinstance(value, (list, tuple)):
+        return ("seq",) + tuple(canonical(v) for v in value)
+    if hasattr(value, "tolist"):  # numpy scalars and arrays
+        return canonical(value.tolist())
+    if isinstance(value, float):
+        return float.hex(value)
+    return repr(value)
+
+
+def geometry_key(
+    serial_fcdoc: SerialBlob,
+    input_parts: List[Geo3DPart],
+    params: Optional[Dict] = None,
+    xsec_dict: Optional[Dict[str, Dict]] = None,
+    mesh_options: Optional[Dict] = None,
+    lazy_export: bool = False,
+) -> str:
+    """Compute the content hash identifying the inputs of build_3d_geometry.
+
+    Parameters
+    ----------
+    serial_fcdoc : SerialBlob
+        Serialized FreeCAD template file.
+    input_parts : list
+        Ordered list of input parts.
+    params : dict
+        Dictionary of parameters to use in FreeCAD. (Default value = None)
+    xsec_dict : dict
+        Dictionary of cross-section specifications. (Default value = None)
+    mesh_options : dict
+        Tessellation options of the STL exports. (Default value = None)
+    lazy_export : bool
+        Whether the parts keep BReps instead of exports. (Default value = False)
+    Returns
+    -------
+    Hex digest of the inputs
+
+    """
+    from qmt._version import __version__
+
+    digest = hashlib.sha256()
+    digest.update(f"{CACHE_FORMAT_VERSION}:{__version__}".encode())
+    digest.update(as_serial_blob(serial_fcdoc).view())
+    spec = (canonical(input_parts), canonical(params or {}))
+    spec += (canonical(xsec_dict or {}),)
+    if mesh_options:  # keeps the keys of default builds stable
+        spec += (canonical(mesh_options),)
+    if lazy_export:
+        spec += ("lazy_export",)
+    digest.update(repr(spec).encode())
+    return digest.hexdigest()
+
+
+class GeometryCache:
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = 2 ** 30):
+        """On-disk, content-addressed cache of Geo3DData built by build_3d_geometry.
+
+        Entries are keyed by a hash of the FreeCAD template, the input parts, the
+        parameters, the cross-section specifications and the export options, i.e.
+        lazy exports and tessellation options. When the cache grows beyond
+        max_bytes, the least recently used entries are evicted. The cache directory may
+        be shared by several processes.
+
+        Parameters
+        ----------
+        cache_dir : str, optional
+            Directory holding the cache entries, by default ~/.cache/qmt/geometry
+        max_bytes : int, optional
+            Size limit of the cache, by default 1 GiB
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(
+                os.path.expanduser("~"), ".cache", "qmt", "geometry"
+            )
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    @staticmethod
+    def _touch(path: str):
+        # File systems may store coarse default timestamps, so set them explicitly
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    def get(self, key: str) -> Optional[Any]:
+        """Look up a cached geometry.
+
+        Parameters
+        ----------
+        key : str
+            Key from geometry_key.
+        Returns
+        -------
+        Geo3DData instance, or None if the key is not cached
+
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                geo = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self._touch(path)  # mark as recently used
+        self.hits += 1
+        return geo
+
+    def put(self, key: str, geo: Any):
+        """Store a geometry and evict old entries if the cache is too large.
+
+        Parameters
+        ----------
+        key : str
+            Key from geometry_key.
+        geo : Geo3DData
+            Geometry to store.
+        """
+        tmp_path = os.path.join(self.cache_dir, f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(geo, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._touch(tmp_path)
+        os.replace(tmp_path, self._path(key))  # atomic for concurrent readers
+        self.evict()
+
+    def entries(self) -> List[os.DirEntry]:
+        """Return the cache entries, least recently used first."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                try:
+                    entries.append((entry.stat().st_mtime_ns, entry))
+                except FileNotFoundError:  # removed by another process
+                    pass
+        return [entry for _, entry in sorted(entries, key=lambda e: e[0])]
+
+    def size(self) -> int:
+        """Return the total size of the cache entries in bytes."""
+        return sum(entry.stat().st_size for entry in self.entries())
+
+    def evict(self, max_bytes: Optional[int] = None):
+        """Remove least recently used entries until the cache fits into max_bytes.
+
+        Parameters
+        ----------
+        max_bytes : int, optional
+            Size limit, by default the limit of this cache
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = self.entries()
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= max_bytes:
+                break
+            total -= entry.stat().st_size
+            try:
+                os.remove(entry.path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """Remove all cache entries."""
+        self.evict(max_bytes=0)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit/miss statistics of this cache object.
+
+        Returns
+        -------
+        dict with hits, misses, evictions, entries and bytes.
+
+        """
+        entries = self.entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(entry.stat().st_size for entry in entries),
+        }
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
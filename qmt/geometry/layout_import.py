@@ -0,0 +1,537 @@
+"""
+Import of GDSII mask layouts into Geo2DData and FreeCAD sketches
+"""
+
+import logging
+import struct
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+import shapely
+from shapely.geometry import CAP_STYLE, JOIN_STYLE, LineString, MultiPolygon, Polygon
+from shapely.ops import unary_union
+from .geo_2d_data import Geo2DData
+
+# Shapely 2 builds and repairs all polygons of a layer in vectorized calls, shapely 1
+# falls back to one call per polygon
+_SHAPELY_2 = int(shapely.__version__.split(".")[0]) >= 2
+
+LayerKey = Tuple[int, int]
+
+# GDSII record types
+_HEADER = 0x00
+_BGNLIB = 0x01
+_LIBNAME = 0x02
+_UNITS = 0x03
+_ENDLIB = 0x04
+_BGNSTR = 0x05
+_STRNAME = 0x06
+_ENDSTR = 0x07
+_BOUNDARY = 0x08
+_PATH = 0x09
+_SREF = 0x0A
+_AREF = 0x0B
+_TEXT = 0x0C
+_LAYER = 0x0D
+_DATATYPE = 0x0E
+_WIDTH = 0x0F
+_XY = 0x10
+_ENDEL = 0x11
+_SNAME = 0x12
+_COLROW = 0x13
+_STRANS = 0x1A
+_MAG = 0x1B
+_ANGLE = 0x1C
+_PATHTYPE = 0x21
+_BOX = 0x2D
+_BOXTYPE = 0x2E
+_BGNEXTN = 0x30
+_ENDEXTN = 0x31
+
+# GDSII data types
+_INT16 = 0x02
+_INT32 = 0x03
+_REAL8 = 0x05
+_ASCII = 0x06
+
+# Cap styles of the GDSII path types: flush, round, half-width extension. Type 4
+# paths are extended by their BGNEXTN and ENDEXTN and then cut flush.
+_PATH_CAPS = {
+    0: CAP_STYLE.flat,
+    1: CAP_STYLE.round,
+    2: CAP_STYLE.square,
+    4: CAP_STYLE.flat,
+}
+
+# STRANS flags
+_REFLECT = 0x8000
+_ABS_MAG = 0x0004
+_ABS_ANGLE = 0x0002
+
+
+def _decode_real8(data: bytes) -> np.ndarray:
+    """Decode GDSII excess-64 base-16 floating point numbers."""
+    bits = np.frombuffer(data, dtype=">u8").astype(np.uint64)
+    sign = np.where(bits >> np.uint64(63), -1.0, 1.0)
+    exponent = ((bits >> np.uint64(56)) & np.uint64(0x7F)).astype(np.int64) - 64
+    mantissa = (bits & np.uint64(0x00FFFFFFFFFFFFFF)).astype(np.float64)
+    return sign * mantissa / 2.0 ** 56 * 16.0 ** exponent
+
+
+def _iter_records(
+    stream: BinaryIO,
+) -> Iterator[Tuple[int, Union[None, str, np.ndarray]]]:
+    """Read the records of a GDSII stream one at a time.
+
+    Parameters
+    ----------
+    stream : BinaryIO
+        Binary GDSII stream.
+    Returns
+    -------
+    Iterator over (record type, decoded data) tuples.
+
+    """
+    while True:
+        header = stream.read(4)
+        if len(header) < 4:
+            return
+        length, rectype, datatype = struct.unpack(">HBB", header)
+        if length < 4:
+            raise ValueError(f"Corrupt GDSII record of length {length}.")
+        body = stream.read(length - 4)
+        if len(body) < length - 4:
+            raise ValueError("Unexpected end of GDSII stream.")
+        if datatype == _INT16:
+            data = np.frombuffer(body, dtype=">i2").astype(np.int64)
+        elif datatype == _INT32:
+            data = np.frombuffer(body, dtype=">i4").astype(np.int64)
+        elif datatype == _REAL8:
+            data = _decode_real8(body)
+        elif datatype == _ASCII:
+            data = body.rstrip(b"\0").decode("ascii")
+        elif body:
+            data = np.frombuffer(body, dtype=">u2").astype(np.int64)
+        else:
+            data = None
+        yield rectype, data
+        if rectype == _ENDLIB:
+            return
+
+
+class GDSReference:
+    def __init__(
+        self,
+        cell: str,
+        origins: np.ndarray,
+        magnification: float = 1.0,
+        angle: float = 0.0,
+        reflect: bool = False,
+    ):
+        """Placement of a cell inside another one, from an SREF or AREF element.
+
+        Parameters
+        ----------
+        cell : str
+            Name of the referenced cell
+        origins : np.ndarray
+            (n, 2) array of the positions of all instances, in database units
+        magnification : float, optional
+            Scale factor, by default 1.0
+        angle : float, optional
+            Counterclockwise rotation in degrees, by default 0.0
+        reflect : bool, optional
+            Whether the cell is mirrored about the x axis before the rotation, by
+            default False
+        """
+        self.cell = cell
+        self.origins = origins
+        self.magnification = magnification
+        self.angle = angle
+        self.reflect = reflect
+
+    def transform(self, points: np.ndarray) -> np.ndarray:
+        """Place the points of the referenced cell into the parent cell.
+
+        Parameters
+        ----------
+        points : np.ndarray
+            (m, 2) array of points in the referenced cell.
+        Returns
+        -------
+        (n, m, 2) array of the points of all n instances.
+
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if self.reflect:
+            points = points * np.array([1.0, -1.0])
+        phi = np.deg2rad(self.angle)
+        rotation = self.magnification * np.array(
+            [[np.cos(phi), -np.sin(phi)], [np.sin(phi), np.cos(phi)]]
+        )
+        return (points @ rotation.T)[np.newaxis] + self.origins[:, np.newaxis]
+
+
+class GDSCell:
+    def __init__(self, name: str):
+        """A GDSII structure.
+
+        Parameters
+        ----------
+        name : str
+            Name of the cell
+        """
+        self.name = name
+        # (layer, datatype) -> list of (n, 2) polygon vertex arrays in database units
+        self.polygons: Dict[LayerKey, List[np.ndarray]] = {}
+        self.references: List[GDSReference] = []
+
+    def add_polygon(self, layer: LayerKey, points: np.ndarray):
+        """Add a polygon, dropping the closing vertex if present.
+
+        Parameters
+        ----------
+        layer : LayerKey
+            (layer, datatype) tuple
+        points : np.ndarray
+            (n, 2) array of vertices
+        """
+        if len(points) > 1 and np.array_equal(points[0], points[-1]):
+            points = points[:-1]
+        if len(points) >= 3:
+            self.polygons.setdefault(layer, []).append(points)
+
+
+class GDSLibrary:
+    def __init__(self, name: str = "", db_unit: float = 1e-9, user_unit: float = 1e-3):
+        """Cells of a GDSII file.
+
+        Parameters
+        ----------
+        name : str, optional
+            Library name, by default ""
+        db_unit : float, optional
+            Size of a database unit in meters, by default 1e-9
+        user_unit : float, optional
+            Size of a database unit in user units, by default 1e-3
+        """
+        self.name = name
+        self.db_unit = db_unit
+        self.user_unit = user_unit
+        self.cells: Dict[str, GDSCell] = {}
+
+    def top_cells(self) -> List[str]:
+        """Return the names of the cells that are not referenced by any other cell."""
+        referenced = {ref.cell for c in self.cells.values() for ref in c.references}
+        return [name for name in self.cells if name not in referenced]
+
+    def layers(self) -> List[LayerKey]:
+        """Return the sorted (layer, datatype) tuples used in the library."""
+        return sorted({key for c in self.cells.values() for key in c.polygons})
+
+    def flatten(self, cell: Optional[str] = None) -> Dict[LayerKey, List[np.ndarray]]:
+        """Resolve all cell references below a cell.
+
+        Every cell is flattened once, no matter how often it is placed; arrays of
+        instances are transformed in a single vectorized operation.
+
+        Parameters
+        ----------
+        cell : str, optional
+            Name of the cell, by default the only top cell
+        Returns
+        -------
+        Dict from (layer, datatype) to the list of polygon vertex arrays in database
+        units.
+
+        Raises
+        ------
+        ValueError
+            The cell is ambiguous, unknown or references itself.
+        """
+        if cell is None:
+            top = self.top_cells()
+            if len(top) != 1:
+                raise ValueError(f"Choose one of the top cells {top}.")
+            cell = top[0]
+        flat: Dict[str, Dict[LayerKey, List[np.ndarray]]] = {}
+
+        def visit(name: str, stack: Tuple[str, ...]):
+            if name in flat:
+                return flat[name]
+            if name in stack:
+                raise ValueError(f"Cell {name} references itself.")
+            if name not in self.cells:
+                raise ValueError(f"Cell {name} is not in the library.")
+            this = self.cells[name]
+            result = {key: list(polys) for key, polys in this.polygons.items()}
+            for ref in this.references:
+                for key, polys in visit(ref.cell, stack + (name,)).items():
+                    target = result.setdefault(key, [])
+                    for poly in polys:
+                        target.extend(ref.transform(poly))
+            flat[name] = result
+            return result
+
+        return visit(cell, ())
+
+
+def read_gds(source: Union[str, BinaryIO]) -> GDSLibrary:
+    """Read a GDSII file.
+
+    Boundaries, boxes and paths become polygons; text elements are skipped. The file
+    is parsed record by record without loading it into memory first. Absolute
+    magnifications and angles of references are applied as relative ones, with a
+    warning, which is only exact when no enclosing placement scales or rotates.
+
+    Parameters
+    ----------
+    source : Union[str, BinaryIO]
+        Path or binary stream of the GDSII file
+    Returns
+    -------
+    GDSLibrary instance.
+
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as stream:
+            return read_gds(stream)
+
+    library = GDSLibrary()
+    cell = None
+    element = None
+    for rectype, data in _iter_records(source):
+        if rectype == _LIBNAME:
+            library.name = data
+        elif rectype == _UNITS:
+            library.user_unit, library.db_unit = float(data[0]), float(data[1])
+        elif rectype == _BGNSTR:
+            cell = None
+        elif rectype == _STRNAME:
+            cell = GDSCell(data)
+            library.cells[data] = cell
+        elif rectype == _ENDSTR:
+            cell = None
+        elif rectype in (_BOUNDARY, _BOX, _PATH, _SREF, _AREF, _TEXT):
+            element = {"type": rectype, "layer": 0, "datatype": 0, "width": 0}
+            element.update({"pathtype": 0, "mag": 1.0, "angle": 0.0, "reflect": False})
+            element.update({"bgnextn": 0, "endextn": 0})
+        elif element is None:
+            continue
+        elif rectype == _LAYER:
+            element["layer"] = int(data[0])
+        elif rectype in (_DATATYPE, _BOXTYPE):
+            element["datatype"] = int(data[0])
+        elif rectype == _WIDTH:
+            element["width"] = abs(int(data[0]))
+        elif rectype == _PATHTYPE:
+            element["pathtype"] = int(data[0])
+        elif rectype == _XY:
+            element["xy"] = data.reshape(-1, 2)
+        elif rectype == _SNAME:
+            element["sname"] = data
+        elif rectype == _COLROW:
+            element["colrow"] = (int(data[0]), int(data[1]))
+        elif rectype == _BGNEXTN:
+            element["bgnextn"] = int(data[0])
+        elif rectype == _ENDEXTN:
+            element["endextn"] = int(data[0])
+        elif rectype == _STRANS:
+            flags = int(data[0])
+            element["reflect"] = bool(flags & _REFLECT)
+            if flags & (_ABS_MAG | _ABS_ANGLE) and cell is not None:
+                # Exact only if no enclosing placement is magnified or rotated
+                logging.warning(
+                    "Absolute magnification or angle in cell %s is treated as "
+                    "relative to the enclosing placements",
+                    cell.name,
+                )
+        elif rectype == _MAG:
+            element["mag"] = float(data[0])
+        elif rectype == _ANGLE:
+            element["angle"] = float(data[0])
+        elif rectype == _ENDEL:
+            if cell is not None:
+                _add_element(cell, element)
+            element = None
+    return library
+
+
+def _add_element(cell: GDSCell, element: Dict):
+    """Convert a parsed element into polygons or references of a cell."""
+    kind = element["type"]
+    layer = (element["layer"], element["datatype"])
+    xy = element.get("xy")
+    if kind in (_BOUNDARY, _BOX):
+        cell.add_polygon(layer, xy)
+    elif kind == _PATH:
+        if element["width"] == 0 or len(xy) < 2:
+            return  # zero-width paths don't cover an area
+        if element["pathtype"] not in _PATH_CAPS:
+            logging.warning(
+                "Unknown path type %d in cell %s is imported with flush ends",
+                element["pathtype"],
+                cell.name,
+            )
+        elif element["pathtype"] == 4:
+            xy = _extend_path(xy, element["bgnextn"], element["endextn"])
+        cap = _PATH_CAPS.get(element["pathtype"], CAP_STYLE.flat)
+        outline = LineString(xy).buffer(
+            element["width"] / 2, cap_style=cap, join_style=JOIN_STYLE.mitre
+        )
+        for poly in getattr(outline, "geoms", [outline]):
+            cell.add_polygon(layer, np.asarray(poly.exterior.coords))
+    elif kind in (_SREF, _AREF):
+        if kind == _SREF:
+            origins = xy[:1].astype(np.float64)
+        else:
+            columns, rows = element["colrow"]
+            origin, column_end, row_end = xy.astype(np.float64)
+            column_step = (column_end - origin) / columns
+            row_step = (row_end - origin) / rows
+            c, r = np.meshgrid(np.arange(columns), np.arange(rows), indexing="ij")
+            origins = (
+                origin + c.reshape(-1, 1) * column_step + r.reshape(-1, 1) * row_step
+            )
+        cell.references.append(
+            GDSReference(
+                element["sname"],
+                origins,
+                element["mag"],
+                element["angle"],
+                element["reflect"],
+            )
+        )
+
+
+def _extend_path(xy: np.ndarray, begin: float, end: float) -> np.ndarray:
+    """Move the end points of a path outwards along its first and last segments."""
+    xy = xy.astype(np.float64)
+    for i, j, length in ((0, 1, begin), (-1, -2, end)):
+        direction = xy[i] - xy[j]
+        norm = np.hypot(*direction)
+        if norm > 0:
+            xy[i] += direction * (length / norm)
+    return xy
+
+
+def _polygon_array(polys: Sequence[np.ndarray]) -> np.ndarray:
+    """Build shapely polygons from vertex arrays in one vectorized call."""
+    if not _SHAPELY_2:
+        result = np.empty(len(polys), dtype=object)
+        for i, p in enumerate(polys):
+            poly = Polygon(p)
+            result[i] = poly if poly.is_valid else poly.buffer(0)
+        return result
+    lengths = np.array([len(p) for p in polys])
+    indices = np.repeat(np.arange(len(polys)), lengths)
+    rings = shapely.linearrings(np.concatenate(polys), indices=indices)
+    result = shapely.polygons(rings)
+    # Self-intersecting mask polygons are repaired the way layout tools read them
+    invalid = ~shapely.is_valid(result)
+    if invalid.any():
+        result[invalid] = shapely.buffer(result[invalid], 0)
+    return result
+
+
+def layout_to_geo2d(
+    library: GDSLibrary,
+    cell: Optional[str] = None,
+    layers: Optional[Sequence[Union[int, LayerKey]]] = None,
+    layer_names: Optional[Dict[Union[int, LayerKey], str]] = None,
+    lunit: str = "nm",
+    simplify_tol: float = 0.0,
+    merge: bool = True,
+    geo: Optional[Geo2DData] = None,
+) -> Geo2DData:
+    """Convert the layers of a layout cell into Geo2DData parts.
+
+    Parameters
+    ----------
+    library : GDSLibrary
+        Library returned by read_gds
+    cell : str, optional
+        Cell to import, by default the only top cell
+    layers : Sequence[Union[int, LayerKey]], optional
+        Layer numbers or (layer, datatype) tuples to import, by default all
+    layer_names : Dict[Union[int, LayerKey], str], optional
+        Part names of layer numbers or (layer, datatype) tuples, by default
+        "layer_<layer>_<datatype>"
+    lunit : str, optional
+        Length unit of the geometry, by default "nm"
+    simplify_tol : float, optional
+        Tolerance of the topology-preserving polygon simplification in lunit, by
+        default 0.0 (no simplification)
+    merge : bool, optional
+        Whether the polygons of each layer are merged into their union, by default
+        True
+    geo : Geo2DData, optional
+        Geometry to add the parts to, by default a new one with lunit
+    Returns
+    -------
+    Geo2DData with one part per layer, or parts "<name>_<i>" for layers with several
+    disjoint (or unmerged) polygons.
+
+    """
+    from qmt.physics_constants import parse_unit, to_float, units
+
+    if geo is None:
+        geo = Geo2DData(lunit)
+    scale = library.db_unit * to_float(units.m / parse_unit(geo.lunit))
+    layer_names = layer_names or {}
+    flat = library.flatten(cell)
+    for key in sorted(flat):
+        if layers is not None and key not in layers and key[0] not in layers:
+            continue
+        name = layer_names.get(key, layer_names.get(key[0], f"layer_{key[0]}_{key[1]}"))
+        polys = _polygon_array([p * scale for p in flat[key]])
+        if merge:
+            polys = [unary_union(list(polys))]
+        if simplify_tol > 0 and _SHAPELY_2:
+            polys = shapely.simplify(polys, simplify_tol, preserve_topology=True)
+        elif simplify_tol > 0:
+            polys = [p.simplify(simplify_tol, preserve_topology=True) for p in polys]
+        parts = []
+        for poly in polys:
+            if isinstance(poly, Polygon):
+                parts.append(poly)
+            elif isinstance(poly, MultiPolygon):
+                parts.extend(poly.geoms)
+        parts = [p for p in parts if not p.is_empty]
+        if len(parts) == 1:
+            geo.add_part(name, parts[0])
+        else:
+            for i, part in enumerate(parts):
+                geo.add_part(f"{name}_{i}", part)
+    return geo
+
+
+def geo2d_to_sketches(geo: Geo2DData, doc=None) -> Dict[str, object]:
+    """Create an unconstrained FreeCAD sketch for every polygon part.
+
+    Each sketch is filled with a single bulk geometry call, including the rings of
+    holes, and is ready for splitSketch or extrusion.
+
+    Parameters
+    ----------
+    geo : Geo2DData
+        Geometry, e.g. from layout_to_geo2d
+    doc : FreeCAD.App.Document, optional
+        Target document, by default the active document
+    Returns
+    -------
+    Dict from part name to sketch.
+
+    """
+    import FreeCAD
+    from .freecad.sketchUtils import addPolygonSketch
+
+    if doc is None:
+        doc = FreeCAD.ActiveDocument
+    sketches = {}
+    for name in geo.part_build_order():
+        part = geo.parts[name]
+        rings = [part.exterior] + list(part.interiors)
+        sketches[name] = addPolygonSketch(
+            name, doc, [np.asarray(ring.coords)[:-1] for ring in rings]
+        )
+    return sketches
@@ -6,9 +6,9 @@ special case because we need to inherit a base class with a default parameter (n
 virtual), and dataclasses don't play well with that inheritance
 """
 
-from typing import List, Optional
+from typing import Dict, List, Optional
 from enum import Enum
-from qmt.infrastructure import write_deserialised
+from qmt.infrastructure import SerialBlob, write_deserialised
 
 
 class Geo3DPart:
@@ -30,10 +30,32 @@ class Geo3DPart:
         self.built_fc_name: Optional[str] = None  # This gets set on geometry build
         self.fc_name = label if fc_name is None else fc_name
         self.label = label
-        self.serial_stl: Optional[str] = None  # This gets set on geometry build
-        self.serial_stp: Optional[str] = None  # This gets set on geometry build
+        self.serial_stl: Optional[SerialBlob] = None  # This gets set on geometry build
+        self.serial_stp: Optional[SerialBlob] = None  # This gets set on geometry build
+        # Set instead of serial_stl/serial_stp by a build with lazy_export
+        self.serial_brep: Optional[str] = None
+        # Tessellation options of the build, used when exporting serial_brep to STL
+        self.mesh_options: Optional[Dict] = None
         self.virtual = virtual
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Parts pickled before lazy exports were added
+        self.__dict__.setdefault("serial_brep", None)
+        self.__dict__.setdefault("mesh_options", None)
+
+    def _serial(self, ext_format: str) -> SerialBlob:
+        """Return the STEP or STL blob, exporting it from the BRep if necessary."""
+        attr = f"serial_{ext_format}"
+        if getattr(self, attr) is None and self.serial_brep is not None:
+            from qmt.geometry.freecad.fileIO import serializeBreps
+
+            blob = serializeBreps(
+                [self.serial_brep], [self.label], ext_format, self.mesh_options
+            )
+            setattr(self, attr, blob)
+        return getattr(self, attr)
+
     def write_stp(self, file_path=None):
         """Write part geometry to a STEP file.
 
@@ -50,7 +72,7 @@ class Geo3DPart:
         """
         if file_path is None:
             file_path = f"{self.label}.stp"
-        write_deserialised(self.serial_stp, file_path)
+        write_deserialised(self._serial("stp"), file_path)
         return file_path
 
     def write_stl(self, file_path=None):
@@ -69,7 +91,7 @@ class Geo3DPart:
         """
         if file_path is None:
             file_path = f"{self.label}.stl"
-        write_deserialised(self.serial_stl, file_path)
+        write_deserialised(self._serial("stl"), file_path)
         return file_path
 
 
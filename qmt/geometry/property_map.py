@@ -36,37 +36,237 @@ class PropertyMap:
         """
         return self.partMap(x)
 
-    def __call__(self, x):
+    def __call__(self, x, chunk_size=None):
         """Do the mapping.
 
         Parameters
         ----------
         x :
             Coordinate vector or array of coordinate vectors.
+        chunk_size : int
+            If set, the points are located and mapped in chunks of this many
+            points, which bounds the memory of intermediate arrays.
+            (Default value = None)
 
         Returns
         -------
         Property of the part(s) containing `x`, of the same shape as `x` except for
         the last axis corresponding to coordinate vector extent.
         """
+        if chunk_size is not None and np.ndim(x) > 1:
+            x = np.asanyarray(x)
+            points = x.reshape(-1, x.shape[-1])
+            cache = {}
+            chunks = [
+                self._map_points(points[i : i + chunk_size], cache)
+                for i in range(0, len(points), chunk_size)
+            ]
+            return np.concatenate(chunks).reshape(x.shape[:-1])
+
+        if np.ndim(x) > 1 and hasattr(self.partMap, "locate"):
+            return self._map_points(x, {})
         parts = self.get_part(x)
         if np.isscalar(parts):
             return self.propMap(parts)
+        return self._map_parts(parts, {})
+
+    def _map_points(self, x, cache):
+        """Locate an array of points and map them to properties.
+
+        Part maps with a `locate` method, like Geo2DPartMap, return integer indices
+        into their `partIds`, which are used directly instead of factorizing part
+        identifiers.
+
+        Parameters
+        ----------
+        x :
+            Array of coordinate vectors.
+        cache : dict
+            Properties of parts seen before, updated in place.
+
+        Returns
+        -------
+        Array of properties.
+        """
+        if not hasattr(self.partMap, "locate"):
+            return self._map_parts(self.get_part(x), cache)
+        index = np.asanyarray(self.partMap.locate(x))
+        part_ids = list(self.partMap.partIds) + [None]
+        present = np.flatnonzero(np.bincount(index.ravel(), minlength=len(part_ids)))
+        remap = np.zeros(len(part_ids), dtype=np.intp)
+        remap[present] = np.arange(len(present))
+        return self._map_codes(
+            [part_ids[i] for i in present], remap.take(index), index.shape, cache
+        )
+
+    def _map_parts(self, parts, cache):
+        """Map an array of part identifiers to properties.
 
-        unique_parts = set(np.asanyarray(parts).flat)
-        unique_props = [self.propMap(p) for p in unique_parts]
+        Parameters
+        ----------
+        parts :
+            Array of part identifiers.
+        cache : dict
+            Properties of parts seen before, updated in place.
+
+        Returns
+        -------
+        Array of properties of the same shape as `parts`.
+        """
+        parts = np.asanyarray(parts)
+        unique_parts, codes = _factorize(parts)
+        return self._map_codes(unique_parts, codes, parts.shape, cache)
+
+    def _map_codes(self, unique_parts, codes, shape, cache):
+        """Map codes of distinct parts to properties, calling propMap once per
+        distinct part (and only for parts not in cache yet) and gathering the
+        results from a lookup table.
+
+        Parameters
+        ----------
+        unique_parts : list
+            Distinct part identifiers.
+        codes :
+            Integer array of indices into `unique_parts`.
+        shape : tuple
+            Shape of the result.
+        cache : dict
+            Properties of parts seen before, updated in place.
+
+        Returns
+        -------
+        Array of properties of the given shape.
+        """
+        unique_props = []
+        for p in unique_parts:
+            if p not in cache:
+                cache[p] = self.propMap(p)
+            unique_props.append(cache[p])
         obj_types = [type(p) for p in unique_props]
         if obj_types[0] is str:
             assert all(t is str for t in obj_types)
             obj_type = object
         else:
             obj_type = np.result_type(*obj_types)
-        result = np.empty(np.shape(parts), dtype=obj_type)
-        for part, prop in zip(unique_parts, unique_props):
-            result[parts == part] = prop
+        table = np.empty(len(unique_props), dtype=obj_type)
+        for i, prop in enumerate(unique_props):
+            table[[i]] = prop
+        result = np.empty(shape, dtype=obj_type)
+        np.take(table, codes.reshape(shape), out=result)
         return result
 
 
+def _factorize(parts):
+    """Return the distinct values of an array and the index of every element into them.
+
+    Parameters
+    ----------
+    parts :
+        Array of part identifiers.
+
+    Returns
+    -------
+    List of distinct values and integer array of codes, flattened.
+    """
+    try:
+        unique_parts, codes = np.unique(parts, return_inverse=True)
+        return list(unique_parts), codes.reshape(-1)
+    except TypeError:  # identifiers without a total order
+        index = {}
+        codes = np.fromiter(
+            (index.setdefault(p, len(index)) for p in parts.flat),
+            dtype=np.intp,
+            count=parts.size,
+        )
+        return list(index), codes
+
+
+class PartIndexer:
+    """Map points to small integer codes of parts instead of part identifiers.
+
+    Part identifiers are interned once, so that arrays of codes can be reused to
+    look up any number of properties with integer gathers. Points in parts that are
+    not listed get the code `missing`, i.e. `len(part_ids)`.
+
+    Parameters
+    ----------
+    part_map : PartMap
+        Mapper from spatial location to part identifier.
+    part_ids : iterable
+        Part identifiers in the order of their codes.
+
+    Returns
+    -------
+
+
+    """
+
+    def __init__(self, part_map, part_ids):
+        self.partMap = part_map
+        self.partIds = list(part_ids)
+        self.codes = dict((p, i) for i, p in enumerate(self.partIds))
+        self.missing = len(self.partIds)
+        self.dtype = np.min_scalar_type(self.missing)
+
+    def encode(self, parts):
+        """Convert part identifiers to codes.
+
+        Parameters
+        ----------
+        parts :
+            Part identifier or array of part identifiers.
+
+        Returns
+        -------
+        Code or integer array of codes of the same shape as `parts`.
+        """
+        if np.isscalar(parts) or parts is None:
+            return self.codes.get(parts, self.missing)
+        parts = np.asanyarray(parts)
+        unique_parts, codes = _factorize(parts)
+        lookup = np.array(
+            [self.codes.get(p, self.missing) for p in unique_parts], dtype=self.dtype
+        )
+        return lookup.take(codes).reshape(parts.shape)
+
+    def __call__(self, x, chunk_size=None):
+        """Find the codes of the parts containing one or more points.
+
+        Parameters
+        ----------
+        x :
+            Coordinate vector or array of coordinate vectors.
+        chunk_size : int
+            If set, the points are located in chunks of this many points.
+            (Default value = None)
+
+        Returns
+        -------
+        Code or integer array of codes, of the same shape as `x` except for the
+        last axis.
+        """
+        if chunk_size is not None and np.ndim(x) > 1:
+            x = np.asanyarray(x)
+            points = x.reshape(-1, x.shape[-1])
+            chunks = [
+                self._locate(points[i : i + chunk_size])
+                for i in range(0, len(points), chunk_size)
+            ]
+            return np.concatenate(chunks).reshape(x.shape[:-1])
+        return self._locate(x)
+
+    def _locate(self, x):
+        """Find part codes, translating the indices of part maps with a `locate`
+        method instead of encoding part identifiers."""
+        if not hasattr(self.partMap, "locate"):
+            return self.encode(self.partMap(x))
+        lookup = self.encode(np.array(list(self.partMap.partIds) + [None], object))
+        index = self.partMap.locate(x)
+        if np.isscalar(index):
+            return lookup[index]
+        return lookup.take(index)
+
+
 class MaterialPropertyMap(PropertyMap):
     """Map points in the simulation domain to material properties of parts containing the points.
 
@@ -84,6 +284,14 @@ class MaterialPropertyMap(PropertyMap):
         Energy unit, passed to `mat_lib.find()`.
     fill_value :
         Value to be filled in places where there is no part or the part does not have a material or the material does not have the property `prop_name`. The default behavior `fill_value='raise'` is to raise a KeyError in these cases.
+    compiled : bool
+        If True, points are mapped to integer part codes by a PartIndexer and the
+        properties are gathered from a dense float table. This needs plain numbers
+        as property values, i.e. an `eunit` for energies. (Default value = False)
+    part_indexer : PartIndexer
+        Indexer for the compiled mode. Maps sharing an indexer accept each other's
+        part codes in `from_index`. (Default value = None, a new indexer over the
+        parts of `part_materials`)
 
     Returns
     -------
@@ -99,29 +307,15 @@ class MaterialPropertyMap(PropertyMap):
         prop_name,
         eunit=None,
         fill_value="raise",
+        compiled=False,
+        part_indexer=None,
     ):
         self.fillValue = fill_value
         self.materialsDict = dict(
             (p, mat_lib.find(m, eunit)) for p, m in part_materials.items()
         )
 
-        self.partProps = {}
-        for p, mat in self.materialsDict.items():
-            try:
-                if prop_name == "conductionBandMinimum":
-                    self.partProps[p] = mat_lib.conduction_band_minimum(mat)
-                elif prop_name == "valenceBandMaximum":
-                    self.partProps[p] = mat_lib.valence_band_maximum(mat)
-                elif prop_name == "lightHoleMass":
-                    self.partProps[p] = mat.hole_mass("light", "dos")
-                elif prop_name == "heavyHoleMass":
-                    self.partProps[p] = mat.hole_mass("heavy", "dos")
-                elif prop_name == "dosHoleMass":
-                    self.partProps[p] = mat.hole_mass("dos", "dos")
-                else:
-                    self.partProps[p] = mat[prop_name]
-            except KeyError:
-                pass
+        self.partProps = _part_properties(self.materialsDict, mat_lib, prop_name)
 
         def prop_map(part):
             try:
@@ -132,3 +326,288 @@ class MaterialPropertyMap(PropertyMap):
                 return self.fillValue
 
         super(MaterialPropertyMap, self).__init__(part_map, prop_map)
+
+        self.partIndexer = None
+        self.table = None
+        if compiled or part_indexer is not None:
+            if part_indexer is None:
+                part_indexer = PartIndexer(part_map, part_materials)
+            self.partIndexer = part_indexer
+            self.table, self.valid = _compile_table(
+                part_indexer.partIds, self.partProps, fill_value
+            )
+
+    def part_index(self, x, chunk_size=None):
+        """Find the integer codes of the parts containing one or more points, for use
+        with `from_index` of this or any other map sharing the part indexer.
+
+        Parameters
+        ----------
+        x :
+            Coordinate vector or array of coordinate vectors.
+        chunk_size : int
+            If set, the points are located in chunks of this many points.
+            (Default value = None)
+
+        Returns
+        -------
+        Code or integer array of codes.
+        """
+        return self.partIndexer(x, chunk_size)
+
+    def from_index(self, index):
+        """Gather the property at the given part codes.
+
+        Parameters
+        ----------
+        index :
+            Code or integer array of codes from `part_index`.
+
+        Returns
+        -------
+        Property value or float array of the shape of `index`.
+        """
+        return _gather(self.table, self.valid, index, self.partIndexer.partIds)
+
+    def __call__(self, x, chunk_size=None):
+        """Do the mapping, through the property table in the compiled mode.
+
+        Parameters
+        ----------
+        x :
+            Coordinate vector or array of coordinate vectors.
+        chunk_size : int
+            If set, the points are located in chunks of this many points.
+            (Default value = None)
+
+        Returns
+        -------
+        Property of the part(s) containing `x`.
+        """
+        if self.table is None:
+            return super(MaterialPropertyMap, self).__call__(x, chunk_size)
+        return self.from_index(self.part_index(x, chunk_size))
+
+
+def _part_properties(materials_dict, mat_lib, prop_name):
+    """Look up a material property for every part.
+
+    Parameters
+    ----------
+    materials_dict : dict
+        Dict mapping from part identifier to a material from `mat_lib.find()`.
+    mat_lib : qmt.Materials
+        Materials library of the materials.
+    prop_name : str
+        Name of the material property.
+
+    Returns
+    -------
+    Dict from part identifier to property value, without the parts whose material
+    does not have the property.
+    """
+    part_props = {}
+    for p, mat in materials_dict.items():
+        try:
+            if prop_name == "conductionBandMinimum":
+                part_props[p] = mat_lib.conduction_band_minimum(mat)
+            elif prop_name == "valenceBandMaximum":
+                part_props[p] = mat_lib.valence_band_maximum(mat)
+            elif prop_name == "lightHoleMass":
+                part_props[p] = mat.hole_mass("light", "dos")
+            elif prop_name == "heavyHoleMass":
+                part_props[p] = mat.hole_mass("heavy", "dos")
+            elif prop_name == "dosHoleMass":
+                part_props[p] = mat.hole_mass("dos", "dos")
+            else:
+                part_props[p] = mat[prop_name]
+        except KeyError:
+            pass
+    return part_props
+
+
+def _compile_table(part_ids, part_props, fill_value):
+    """Build a dense property table over part codes, with a last entry for the
+    `missing` code of a PartIndexer.
+
+    Parameters
+    ----------
+    part_ids : list
+        Part identifiers in the order of their codes.
+    part_props : dict
+        Property values by part identifier.
+    fill_value :
+        Value of parts without property, or "raise".
+
+    Returns
+    -------
+    Float array of properties, and boolean array of which entries are set.
+    """
+    table = np.zeros(len(part_ids) + 1)
+    valid = np.zeros(len(part_ids) + 1, dtype=bool)
+    for i, p in enumerate(part_ids):
+        if p in part_props:
+            table[i] = part_props[p]
+            valid[i] = True
+    if fill_value != "raise":
+        table[~valid] = fill_value
+        valid[:] = True
+    return table, valid
+
+
+def _gather(table, valid, index, part_ids):
+    """Gather table entries at part codes, raising a KeyError for unset entries.
+
+    Parameters
+    ----------
+    table :
+        Property table from `_compile_table`.
+    valid :
+        Set entries of the table.
+    index :
+        Code or integer array of codes.
+    part_ids : list
+        Part identifiers in the order of their codes.
+
+    Returns
+    -------
+    Property value or array of the shape of `index`.
+    """
+    if not valid.all() and not valid.take(index).all():
+        codes = np.unique(np.asanyarray(index)[~valid.take(index)])
+        part_ids = list(part_ids) + [None]
+        raise KeyError([part_ids[c] for c in codes])
+    return table.take(index)
+
+
+class MultiMaterialPropertyMap:
+    """Map points in the simulation domain to several material properties of the parts
+    containing the points at once.
+
+    The materials are looked up once per part, and each evaluation locates the points
+    once and gathers every property from a dense table with the same part codes.
+
+    Parameters
+    ----------
+    part_map : PartMap
+        Function that takes a spatial location and maps it to a part identifier.
+    part_materials : dict
+        Dict mapping from part identifier to a material name.
+    mat_lib : qmt.Materials
+        Materials library used to look up the material properties.
+    prop_names : list
+        Names of the material properties, as accepted by MaterialPropertyMap.
+    eunit :
+        Energy unit, passed to `mat_lib.find()`. Property values have to be plain
+        numbers, so this is needed for energies.
+    fill_value :
+        Value to be filled in places where there is no part or the part does not have
+        a material or the material does not have a property. Either one value for all
+        properties or a dict by property name. The default behavior
+        `fill_value='raise'` is to raise a KeyError in these cases.
+    part_indexer : PartIndexer
+        Indexer shared with other compiled maps. (Default value = None, a new indexer
+        over the parts of `part_materials`)
+
+    Returns
+    -------
+
+
+    """
+
+    def __init__(
+        self,
+        part_map,
+        part_materials,
+        mat_lib,
+        prop_names,
+        eunit=None,
+        fill_value="raise",
+        part_indexer=None,
+    ):
+        self.propNames = list(prop_names)
+        if not isinstance(fill_value, dict):
+            fill_value = dict((name, fill_value) for name in self.propNames)
+        self.fillValue = fill_value
+        self.materialsDict = dict(
+            (p, mat_lib.find(m, eunit)) for p, m in part_materials.items()
+        )
+        if part_indexer is None:
+            part_indexer = PartIndexer(part_map, part_materials)
+        self.partIndexer = part_indexer
+        self.tables = {}
+        self.valid = {}
+        for name in self.propNames:
+            part_props = _part_properties(self.materialsDict, mat_lib, name)
+            self.tables[name], self.valid[name] = _compile_table(
+                self.partIndexer.partIds, part_props, fill_value.get(name, "raise")
+            )
+
+    def part_index(self, x, chunk_size=None):
+        """Find the integer codes of the parts containing one or more points.
+
+        Parameters
+        ----------
+        x :
+            Coordinate vector or array of coordinate vectors.
+        chunk_size : int
+            If set, the points are located in chunks of this many points.
+            (Default value = None)
+
+        Returns
+        -------
+        Code or integer array of codes.
+        """
+        return self.partIndexer(x, chunk_size)
+
+    def from_index(self, index, structured=False):
+        """Gather all properties at the given part codes.
+
+        Parameters
+        ----------
+        index :
+            Code or integer array of codes from `part_index`.
+        structured : bool
+            Whether to return a structured array with one field per property
+            instead of a dict. (Default value = False)
+
+        Returns
+        -------
+        Dict from property name to values of the shape of `index`, or structured
+        array of the shape of `index`.
+        """
+        values = dict(
+            (
+                name,
+                _gather(
+                    self.tables[name], self.valid[name], index, self.partIndexer.partIds
+                ),
+            )
+            for name in self.propNames
+        )
+        if not structured:
+            return values
+        result = np.empty(np.shape(index), dtype=[(n, float) for n in self.propNames])
+        for name in self.propNames:
+            result[name] = values[name]
+        return result
+
+    def __call__(self, x, chunk_size=None, structured=False):
+        """Do the mapping for all properties.
+
+        Parameters
+        ----------
+        x :
+            Coordinate vector or array of coordinate vectors.
+        chunk_size : int
+            If set, the points are located in chunks of this many points.
+            (Default value = None)
+        structured : bool
+            Whether to return a structured array instead of a dict.
+            (Default value = False)
+
+        Returns
+        -------
+        Properties of the part(s) containing `x`, see `from_index`.
+        """
+        return self.from_index(self.part_index(x, chunk_size), structured)
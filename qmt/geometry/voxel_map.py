@@ -0,0 +1,341 @@
+"""
+Voxel label grids mapping 3D points to the parts of a Geo3DData
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+import numpy as np
+from scipy import ndimage
+
+# Label of voxels that are cut by the surface of a part and need an exact check
+BOUNDARY = -1
+_UNSET = -2
+
+
+def _surface_samples(
+    vertices: np.ndarray, triangles: np.ndarray, spacing: float
+) -> np.ndarray:
+    """Sample points on triangles such that every point of the triangles lies within
+    `spacing` of a sample.
+
+    Parameters
+    ----------
+    vertices : np.ndarray
+        (n, 3) array of vertex coordinates
+    triangles : np.ndarray
+        (m, 3) array of vertex indices
+    spacing : float
+        Maximal distance between neighbouring samples
+    Returns
+    -------
+    (k, 3) array of sample points.
+
+    """
+    a, b, c = (vertices[triangles[:, i]] for i in range(3))
+    edges = np.stack([b - a, c - b, a - c])
+    longest = np.linalg.norm(edges, axis=-1).max(axis=0)
+    steps = np.maximum(np.ceil(longest / spacing), 1).astype(int)
+    samples = [vertices]
+    # Triangles with the same number of steps share a barycentric sampling pattern
+    for n in np.unique(steps):
+        i, j = np.meshgrid(np.arange(n + 1), np.arange(n + 1), indexing="ij")
+        keep = i + j <= n
+        u, v = i[keep] / n, j[keep] / n
+        sel = steps == n
+        ab, ac = b[sel] - a[sel], c[sel] - a[sel]
+        pts = a[sel][:, None] + u[:, None] * ab[:, None] + v[:, None] * ac[:, None]
+        samples.append(pts.reshape(-1, 3))
+    return np.concatenate(samples)
+
+
+class VoxelPartMap:
+    def __init__(
+        self,
+        labels: np.ndarray,
+        origin: Sequence[float],
+        spacing: float,
+        part_ids: Sequence[str],
+        breps: Optional[Dict[str, str]] = None,
+        tol: float = 1e-5,
+    ):
+        """Map points to the 3D parts containing them with a voxel label grid.
+
+        Voxels inside a single part (after build-order priority) carry its index in
+        `partIds`, voxels outside of all parts carry `missing`, and voxels cut by a
+        part surface carry BOUNDARY. Points in boundary voxels are located exactly
+        against the part solids, which are loaded from their BRep strings on demand.
+        Where parts overlap, the part that comes first in `partIds` wins.
+
+        Parameters
+        ----------
+        labels : np.ndarray
+            (nx, ny, nz) integer array of voxel labels
+        origin : Sequence[float]
+            Lower corner of the grid
+        spacing : float
+            Edge length of the cubic voxels
+        part_ids : Sequence[str]
+            Part names in order of priority
+        breps : Optional[Dict[str, str]]
+            BRep strings of the parts for the exact check, by default None, in which
+            case locating points in boundary voxels raises a ValueError
+        tol : float
+            Tolerance of the exact check, by default 1e-5
+        """
+        self.labels = labels
+        self.origin = np.asarray(origin, dtype=float)
+        self.spacing = float(spacing)
+        self.partIds = list(part_ids)
+        self.missing = len(self.partIds)
+        self.breps = breps
+        self.tol = tol
+        # Part.Solid of the parts by name, loaded on demand and not pickled
+        self._solids: Dict[str, Any] = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_solids", None)
+        # Memory-mapped labels are pickled as plain arrays
+        state["labels"] = np.asarray(self.labels)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._solids = {}
+
+    def _solid(self, part_name: str):
+        if part_name not in self._solids:
+            from .freecad.shapeUtils import fromBrep
+            import Part
+
+            if self.breps is None:
+                raise ValueError("Exact point location needs the part BReps.")
+            self._solids[part_name] = Part.Solid(fromBrep(self.breps[part_name]))
+        return self._solids[part_name]
+
+    def _locate_exact(self, xyz: np.ndarray) -> np.ndarray:
+        """Locate (n, 3) points against the part solids in order of priority."""
+        from .freecad.shapeUtils import pointsInside
+
+        codes = np.full(len(xyz), self.missing, dtype=np.intp)
+        remaining = np.arange(len(xyz))
+        for i, name in enumerate(self.partIds):
+            if len(remaining) == 0:
+                break
+            hit = pointsInside(self._solid(name), xyz[remaining], self.tol)
+            codes[remaining[hit]] = i
+            remaining = remaining[~hit]
+        return codes
+
+    def locate(self, x) -> Union[int, np.ndarray]:
+        """Find the indices into partIds of the parts containing one or more points.
+
+        Parameters
+        ----------
+        x :
+            Coordinate vector or array of coordinate vectors.
+        Returns
+        -------
+        Index or integer array of indices of the same shape as `x` except for the
+        last axis, with `missing` for points outside of all parts.
+
+        """
+        x = np.asanyarray(x, dtype=float)
+        xyz = x.reshape(-1, 3)
+        shape = np.array(self.labels.shape)
+        ijk = np.floor((xyz - self.origin) / self.spacing).astype(np.intp)
+        # Points on the upper faces of the grid belong to the last voxels
+        on_face = xyz <= self.origin + shape * self.spacing
+        ijk = np.where(on_face & (ijk == shape), shape - 1, ijk)
+        inside = np.all((ijk >= 0) & (ijk < shape), axis=1)
+        codes = np.full(len(xyz), self.missing, dtype=np.intp)
+        idx = np.flatnonzero(inside)
+        codes[idx] = self.labels[ijk[idx, 0], ijk[idx, 1], ijk[idx, 2]]
+        boundary = np.flatnonzero(codes == BOUNDARY)
+        if len(boundary):
+            codes[boundary] = self._locate_exact(xyz[boundary])
+        if x.ndim == 1:
+            return int(codes[0])
+        return codes.reshape(x.shape[:-1])
+
+    def __call__(self, x) -> Union[Optional[str], np.ndarray]:
+        """Find the parts containing one or more points.
+
+        Parameters
+        ----------
+        x :
+            Coordinate vector or array of coordinate vectors.
+        Returns
+        -------
+        Part name (or None) or object array of part names of the same shape as `x`
+        except for the last axis.
+
+        """
+        names = np.array(self.partIds + [None], dtype=object)
+        codes = self.locate(x)
+        if np.isscalar(codes):
+            return names[codes]
+        return names.take(codes)
+
+    def save(self, path: str):
+        """Write the map into a directory, with the labels as a .npy file that can
+        be memory-mapped by load.
+
+        Parameters
+        ----------
+        path : str
+            Directory to write labels.npy and meta.json into
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "labels.npy"), np.asarray(self.labels))
+        meta = {
+            "origin": self.origin.tolist(),
+            "spacing": self.spacing,
+            "part_ids": self.partIds,
+            "breps": self.breps,
+            "tol": self.tol,
+        }
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> "VoxelPartMap":
+        """Read a map written by save.
+
+        Parameters
+        ----------
+        path : str
+            Directory written by save
+        mmap_mode : Optional[str]
+            Memory-map mode of the labels, see np.load, by default "r". None reads
+            the labels into memory.
+        Returns
+        -------
+        VoxelPartMap instance.
+
+        """
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        labels = np.load(os.path.join(path, "labels.npy"), mmap_mode=mmap_mode)
+        return cls(
+            labels,
+            meta["origin"],
+            meta["spacing"],
+            meta["part_ids"],
+            meta["breps"],
+            meta["tol"],
+        )
+
+
+def _voxelize_part(
+    shape,
+    origin: np.ndarray,
+    spacing: float,
+    grid_shape: Tuple[int, int, int],
+    tol: float,
+) -> Tuple[Tuple[slice, ...], np.ndarray, np.ndarray]:
+    """Classify the voxels around a part into inside, outside and boundary.
+
+    The surface is tessellated and sampled densely enough that, after growing the
+    marked voxels by one in every direction, all voxels cut by the surface are
+    marked. Every connected region of the other voxels is then entirely inside or
+    outside, which is decided by one exact check of its first voxel center.
+
+    Parameters
+    ----------
+    shape : Part.Shape
+        Solid of the part
+    origin : np.ndarray
+        Lower corner of the grid
+    spacing : float
+        Edge length of the voxels
+    grid_shape : Tuple[int, int, int]
+        Number of voxels along each axis
+    tol : float
+        Tolerance of the exact checks
+    Returns
+    -------
+    Slices of the grid around the part, and boolean arrays of the inside and
+    boundary voxels in these slices.
+
+    """
+    from .freecad.shapeUtils import pointsInside
+
+    bb = shape.BoundBox
+    lower = np.array([bb.XMin, bb.YMin, bb.ZMin])
+    upper = np.array([bb.XMax, bb.YMax, bb.ZMax])
+    start = np.maximum(np.floor((lower - origin) / spacing).astype(int) - 1, 0)
+    stop = np.minimum(np.ceil((upper - origin) / spacing).astype(int) + 1, grid_shape)
+    slices = tuple(slice(i, j) for i, j in zip(start, stop))
+    sub_origin = origin + start * spacing
+
+    points, triangles = shape.tessellate(spacing / 2)
+    vertices = np.array([tuple(p) for p in points], dtype=float).reshape(-1, 3)
+    triangles = np.array(triangles, dtype=np.intp).reshape(-1, 3)
+    samples = _surface_samples(vertices, triangles, spacing / 2)
+    ijk = np.floor((samples - sub_origin) / spacing).astype(np.intp)
+    ijk = np.clip(ijk, 0, stop - start - 1)
+    boundary = np.zeros(tuple(stop - start), dtype=bool)
+    boundary[ijk[:, 0], ijk[:, 1], ijk[:, 2]] = True
+    boundary = ndimage.binary_dilation(boundary, np.ones((3, 3, 3), dtype=bool))
+
+    regions, n_regions = ndimage.label(~boundary)
+    region_ids, first = np.unique(regions.ravel(), return_index=True)
+    first = first[region_ids > 0]
+    voxels = np.column_stack(np.unravel_index(first, regions.shape))
+    centers = sub_origin + (voxels + 0.5) * spacing
+    region_inside = np.zeros(n_regions + 1, dtype=bool)
+    region_inside[region_ids[region_ids > 0]] = pointsInside(shape, centers, tol)
+    return slices, region_inside[regions], boundary
+
+
+def voxelize_parts(
+    breps: Dict[str, str], grid_size: int = 128, tol: float = 1e-5
+) -> VoxelPartMap:
+    """Build a voxel label grid of solid parts.
+
+    Parameters
+    ----------
+    breps : Dict[str, str]
+        BRep strings of the parts by name, in order of priority
+    grid_size : int
+        Number of voxels along the longest side of the bounding box of all parts,
+        by default 128
+    tol : float
+        Tolerance of the exact checks, by default 1e-5
+    Returns
+    -------
+    VoxelPartMap instance.
+
+    """
+    from .freecad.shapeUtils import fromBrep
+    import Part
+
+    part_ids = list(breps)
+    shapes = [Part.Solid(fromBrep(breps[name])) for name in part_ids]
+    if shapes:
+        boxes = np.array(
+            [
+                [s.BoundBox.XMin, s.BoundBox.YMin, s.BoundBox.ZMin]
+                + [s.BoundBox.XMax, s.BoundBox.YMax, s.BoundBox.ZMax]
+                for s in shapes
+            ]
+        )
+        lower, upper = boxes[:, :3].min(axis=0), boxes[:, 3:].max(axis=0)
+    else:
+        lower, upper = np.zeros(3), np.ones(3)
+    spacing = max((upper - lower).max(), np.finfo(float).tiny) / grid_size
+    grid_shape = tuple(np.maximum(np.ceil((upper - lower) / spacing), 1).astype(int))
+    dtype = np.int16 if len(shapes) < 2 ** 15 else np.int32
+    labels = np.full(grid_shape, _UNSET, dtype=dtype)
+    for i, shape in enumerate(shapes):
+        slices, inside, boundary = _voxelize_part(
+            shape, lower, spacing, grid_shape, tol
+        )
+        sub = labels[slices]
+        unset = sub == _UNSET
+        sub[unset & inside] = i
+        sub[unset & boundary] = BOUNDARY
+    labels[labels == _UNSET] = len(part_ids)
+    return VoxelPartMap(labels, lower, spacing, part_ids, dict(breps), tol)
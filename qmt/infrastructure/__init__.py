@@ -2,6 +2,8 @@
 # Licensed under the MIT License.
 
 from .data_utils import (
+    SerialBlob,
+    as_serial_blob,
     load_serial,
     store_serial,
     write_deserialised,
@@ -9,6 +11,15 @@ from .data_utils import (
     reduce_data,
     retrieve_data,
     stream_data_to_file,
+    SweepData,
+)
+from .scratch import (
+    ScratchBackend,
+    DiskScratch,
+    ProcessScratch,
+    SharedMemoryScratch,
+    get_default_scratch,
+    set_default_scratch,
 )
 from .solvers_2d import Potential2dData, ThomasFermi2dData, Bdg2dData, Phase2dData
 from .solvers_3d import (
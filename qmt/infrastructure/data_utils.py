@@ -3,32 +3,181 @@
 
 """Utility functions for dealing with data."""
 
-import os
-import uuid
+import bz2
 import codecs
+import lzma
+import zlib
 import h5py
-import time
+import numpy as np
 import dask
 import dask.delayed
-import tempfile
 
+_COMPRESSORS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "bz2": (bz2.compress, bz2.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
 
-def serialize_file(path):
+
+class SerialBlob:
+    """Binary container for the contents of a serialised file.
+
+    The payload is kept as `bytes`, so it pickles without re-encoding and can be
+    handed to writers as a `memoryview` without copying. It may optionally be
+    compressed with one of the codecs of the standard library.
+
+    Parameters
+    ----------
+    data : bytes-like
+        Stored payload, already compressed with `compression` if that is set.
+    compression : str
+        One of None, "zlib", "bz2" or "lzma". (Default value = None)
+
+    """
+
+    def __init__(self, data, compression=None):
+        if compression is not None and compression not in _COMPRESSORS:
+            raise ValueError(
+                f"Unknown compression {compression}. Options are "
+                f"{[None] + list(_COMPRESSORS)}"
+            )
+        self.data = data if isinstance(data, bytes) else bytes(data)
+        self.compression = compression
+
+    @classmethod
+    def from_bytes(cls, raw_data, compression=None):
+        """Create a blob from uncompressed file contents.
+
+        Parameters
+        ----------
+        raw_data : bytes-like
+            File contents.
+        compression : str
+            Codec used to store the contents. (Default value = None)
+
+        Returns
+        -------
+        SerialBlob
+
+        """
+        if compression is not None:
+            if compression not in _COMPRESSORS:
+                raise ValueError(f"Unknown compression {compression}.")
+            raw_data = _COMPRESSORS[compression][0](raw_data)
+        return cls(raw_data, compression=compression)
+
+    @classmethod
+    def from_file(cls, path, compression=None):
+        """Create a blob from the contents of a file.
+
+        Parameters
+        ----------
+        path : str
+            Filename.
+        compression : str
+            Codec used to store the contents. (Default value = None)
+
+        Returns
+        -------
+        SerialBlob
+
+        """
+        with open(path, "rb") as f:
+            raw_data = f.read()
+        return cls.from_bytes(raw_data, compression=compression)
+
+    def tobytes(self):
+        """Return the uncompressed contents. No copy is made for uncompressed blobs.
+
+        Returns
+        -------
+        bytes
+
+        """
+        if self.compression is None:
+            return self.data
+        return _COMPRESSORS[self.compression][1](self.data)
+
+    def view(self):
+        """Return a read-only memoryview of the uncompressed contents.
+
+        Returns
+        -------
+        memoryview
+
+        """
+        return memoryview(self.tobytes())
+
+    def write(self, path):
+        """Write the uncompressed contents to a file.
+
+        Parameters
+        ----------
+        path : str
+            Filename.
+
+        Returns
+        -------
+        None
+
+        """
+        with open(path, "wb") as f:
+            f.write(self.view())
+
+    def __len__(self):
+        return len(self.data)
+
+    def __eq__(self, other):
+        if not isinstance(other, SerialBlob):
+            return NotImplemented
+        return self.tobytes() == other.tobytes()
+
+    def __repr__(self):
+        return f"SerialBlob({len(self.data)} bytes, compression={self.compression})"
+
+
+def as_serial_blob(serial_obj):
+    """Convert a serialised object to a SerialBlob.
+
+    Besides blobs, this accepts raw file contents as bytes-like objects and the
+    base64 strings produced by earlier versions of `serialize_file`.
+
+    Parameters
+    ----------
+    serial_obj : SerialBlob, bytes-like or str
+
+    Returns
+    -------
+    SerialBlob
+
+    """
+    if isinstance(serial_obj, SerialBlob):
+        return serial_obj
+    elif isinstance(serial_obj, (bytes, bytearray, memoryview)):
+        return SerialBlob(serial_obj)
+    elif isinstance(serial_obj, str):
+        return SerialBlob(codecs.decode(serial_obj.encode(), "base64"))
+    else:
+        raise TypeError(f"Cannot deserialise object of type {type(serial_obj)}.")
+
+
+def serialize_file(path, compression=None):
     """Return a serialised blob of the contents of a given file path.
 
     Parameters
     ----------
     path : str
         Filename.
+    compression : str
+        Optional codec ("zlib", "bz2" or "lzma") used to store the contents.
+        (Default value = None)
 
     Returns
     -------
-    serial_data
+    serial_data : SerialBlob
 
     """
-    with open(path, "rb") as f:
-        serial_data = codecs.encode(f.read(), "base64").decode()
-    return serial_data
+    return SerialBlob.from_file(path, compression=compression)
 
 
 def write_deserialised(serial_obj, path):
@@ -36,8 +185,8 @@ def write_deserialised(serial_obj, path):
 
     Parameters
     ----------
-    serial_obj :
-
+    serial_obj : SerialBlob, bytes-like or str
+        Serialised data. Base64 strings from earlier qmt versions are accepted.
     path : str
         Filename.
 
@@ -46,12 +195,12 @@ def write_deserialised(serial_obj, path):
     None
 
     """
-    data = codecs.decode(serial_obj.encode(), "base64")
-    with open(path, "wb") as f:
-        f.write(data)
+    as_serial_blob(serial_obj).write(path)
 
 
-def store_serial(obj, save_fct, ext_format, scratch_dir=None):
+def store_serial(
+    obj, save_fct, ext_format, scratch_dir=None, compression=None, scratch=None
+):
     """Return a serialised representation of
     `save_fct(obj, scratch_dir/temporary_file.ext_format)`.
     The parameter `ext_format` can be used for format distinction in some `save_fct`.
@@ -66,50 +215,55 @@ def store_serial(obj, save_fct, ext_format, scratch_dir=None):
 
     scratch_dir : str
         (Default value = None)
+    compression : str
+        Optional codec ("zlib", "bz2" or "lzma") used to store the contents.
+        (Default value = None)
+    scratch : qmt.infrastructure.ScratchBackend
+        Backend for the temporary file. If None, a DiskScratch in `scratch_dir` is
+        used if that is given, and the default backend otherwise.
+        (Default value = None)
 
     Returns
     -------
-    serial_data
+    serial_data : SerialBlob
 
     """
-    if not scratch_dir:
-        scratch_dir = tempfile.gettempdir()
-    tmp_path = os.path.join(scratch_dir, uuid.uuid4().hex + "." + ext_format)
-    save_fct(obj, tmp_path)
-    serial_data = serialize_file(tmp_path)
-    os.remove(tmp_path)
-    return serial_data
+    from .scratch import resolve_scratch
+
+    backend = resolve_scratch(scratch, scratch_dir)
+    return backend.store(obj, save_fct, ext_format, compression=compression)
 
 
-def load_serial(serial_obj, load_fct, ext_format=None, scratch_dir=None):
+def load_serial(serial_obj, load_fct, ext_format=None, scratch_dir=None, scratch=None):
     """Return the original object stored with `store_serial`. The `load_fct`
     must be a correct complement of the previously used `store_fct`.
 
     Parameters
     ----------
-    serial_obj :
-
+    serial_obj : SerialBlob, bytes-like or str
+        Serialised data. Base64 strings from earlier qmt versions are accepted.
     load_fct :
 
     ext_format :
         (Default value = None)
     scratch_dir : str
         (Default value = None)
+    scratch : qmt.infrastructure.ScratchBackend
+        Backend for the temporary file. If None, a DiskScratch in `scratch_dir` is
+        used if that is given, and the default backend otherwise.
+        (Default value = None)
 
     Returns
     -------
     obj
 
     """
+    from .scratch import resolve_scratch
+
     if not ext_format:
         ext_format = "tmpdata"
-    if not scratch_dir:
-        scratch_dir = tempfile.gettempdir()
-    tmp_path = os.path.join(scratch_dir, uuid.uuid4().hex + "." + ext_format)
-    write_deserialised(serial_obj, tmp_path)
-    obj = load_fct(tmp_path)
-    os.remove(tmp_path)
-    return obj
+    backend = resolve_scratch(scratch, scratch_dir)
+    return backend.load(serial_obj, load_fct, ext_format)
 
 
 def reduce_data(reduce_function, task, dask_client):
@@ -166,11 +320,24 @@ def retrieve_data(extracted_data, dask_client):
     return retrieved_data
 
 
-def stream_data_to_file(extracted_data, filename, dask_client, sweep_vals=None):
+def stream_data_to_file(
+    extracted_data,
+    filename,
+    dask_client,
+    sweep_vals=None,
+    resume=False,
+    layout="chunked",
+    chunk_points=64,
+    compression="gzip",
+):
     """Instead of simply retrieving all the data, we can stream it to a file on disk as the runs
-    complete. The data are stored in an hdf5 file with a single level. Data entries are given by
-    kesy of the form "index_paramval", where index is the numerical index of the result in the
-    extracted_data list and paramval is the descriptive key for the datum of interest.
+    complete. Each result is fetched exactly once, in batches of whatever has completed.
+
+    The hdf5 file has a columnar layout: every output key becomes one dataset "data/key"
+    whose first axis is the sweep point index, the sweep point values are stored in the
+    structured table "sweep", and the boolean dataset "completed" flags the points that have
+    been written. An interrupted stream can be continued with `resume=True`, which also
+    extends the datasets if `extracted_data` has grown. Use `SweepData` to read the file.
 
     Parameters
     ----------
@@ -181,33 +348,290 @@ def stream_data_to_file(extracted_data, filename, dask_client, sweep_vals=None):
     dask_client :
         The client we are using for the calculation
     sweep_vals :
-        Sweep point values to store along with the data. If None, then just uses
-        an integer list. (Default value = None)
+        Sweep point values (dicts with the same keys) to store along with the data. If None,
+        then just stores the integer index of each point. (Default value = None)
+    resume : bool
+        Keep the points already completed in an existing file and only wait for the
+        remaining ones. (Default value = False)
+    layout : str
+        "chunked" for compressed, resizable datasets or "contiguous" for fixed-size,
+        uncompressed datasets that can be memory-mapped with `SweepData.memmap`.
+        (Default value = "chunked")
+    chunk_points : int
+        Number of sweep points per chunk for the chunked layout. (Default value = 64)
+    compression : str
+        hdf5 compression filter for the chunked layout. (Default value = "gzip")
 
     Returns
     -------
     None
 
     """
+    from distributed import as_completed
     from tqdm import tqdm
 
+    if layout not in ("chunked", "contiguous"):
+        raise ValueError(f"{layout} is not a valid layout.")
+    num_points = len(extracted_data)
     if sweep_vals is None:
-        sweep_vals = range(len(extracted_data))
-    with h5py.File(filename, "w") as data_file:
-        # loop through data, write data as it comes in
-        job_finished = [False] * len(extracted_data)
-        pbar = tqdm(total=len(extracted_data))
-        while not all(job_finished):
-            time.sleep(1.0)
-            for index, future in enumerate(extracted_data):
-                if future.status == "finished" and not job_finished[index]:
-                    for k in future.result().keys():
-                        data_file.create_dataset(
-                            str(index) + "_" + k, data=future.result()[k]
-                        )
-                    for k in sweep_vals[index].keys():
-                        data_file.create_dataset(
-                            str(index) + "_" + str(k), data=sweep_vals[index][k]
-                        )
-                    job_finished[index] = True
-                    pbar.update(1)
+        sweep_vals = [{"index": index} for index in range(num_points)]
+    with h5py.File(filename, "a" if resume else "w") as data_file:
+        if "completed" in data_file:
+            if data_file.attrs.get("layout") != layout:
+                raise ValueError(f"{filename} was not written with layout {layout}.")
+            _resize_columns(data_file, num_points)
+        else:
+            data_file.attrs["layout"] = layout
+            data_file.attrs["chunk_points"] = chunk_points
+            data_file.attrs["compression"] = compression or ""
+            data_file.create_dataset(
+                "completed",
+                data=np.zeros(num_points, dtype=bool),
+                **_column_options(data_file, ()),
+            )
+            data_file.create_group("data")
+        _write_sweep_table(data_file, sweep_vals)
+        completed = data_file["completed"][()]
+        # Several indices may share a future if their computations were identical
+        pending = {}
+        for index, future in enumerate(extracted_data):
+            if not completed[index]:
+                pending.setdefault(future, []).append(index)
+        pbar = tqdm(total=num_points, initial=int(np.count_nonzero(completed)))
+        for batch in as_completed(list(pending)).batches():
+            results = dask_client.gather(batch)
+            indices = []
+            batch_results = []
+            for future, result in zip(batch, results):
+                for index in pending[future]:
+                    indices.append(index)
+                    batch_results.append(result)
+            _write_result_rows(data_file, indices, batch_results)
+            data_file.flush()
+            pbar.update(len(indices))
+        pbar.close()
+
+
+def _column_options(data_file, item_shape):
+    """Return the create_dataset options of a column with per-point shape item_shape.
+
+    Parameters
+    ----------
+    data_file : h5py.File
+
+    item_shape : tuple
+
+
+    Returns
+    -------
+    dict
+
+    """
+    if data_file.attrs["layout"] == "contiguous":
+        return {}
+    chunk_points = int(data_file.attrs["chunk_points"])
+    options = {
+        "maxshape": (None,) + tuple(item_shape),
+        "chunks": (chunk_points,) + tuple(item_shape),
+    }
+    if data_file.attrs["compression"]:
+        options["compression"] = data_file.attrs["compression"]
+    return options
+
+
+def _resize_columns(data_file, num_points):
+    """Grow all per-point datasets of an existing file to num_points entries.
+
+    Parameters
+    ----------
+    data_file : h5py.File
+
+    num_points : int
+
+
+    Returns
+    -------
+    None
+
+    """
+    columns = [data_file["completed"]] + list(data_file["data"].values())
+    for column in columns:
+        if column.shape[0] > num_points:
+            raise ValueError("Cannot resume with fewer points than already stored.")
+        if column.shape[0] < num_points:
+            if column.maxshape[0] is not None:
+                raise ValueError("Contiguous sweep files cannot be extended.")
+            column.resize(num_points, axis=0)
+
+
+def _write_sweep_table(data_file, sweep_vals):
+    """(Re)write the structured table of sweep point values.
+
+    Parameters
+    ----------
+    data_file : h5py.File
+
+    sweep_vals : list
+        List of dicts of sweep values.
+
+    Returns
+    -------
+    None
+
+    """
+    names = list(sweep_vals[0].keys()) if sweep_vals else []
+    columns = []
+    for name in names:
+        column = np.asarray([val[name] for val in sweep_vals])
+        if column.dtype.kind in "UO":
+            column = column.astype(h5py.string_dtype())
+        columns.append(column)
+    dtype = [(str(n), c.dtype, c.shape[1:]) for n, c in zip(names, columns)]
+    table = np.empty(len(sweep_vals), dtype=dtype)
+    for name, column in zip(names, columns):
+        table[str(name)] = column
+    if "sweep" in data_file:
+        del data_file["sweep"]
+    data_file.create_dataset("sweep", data=table)
+
+
+def _write_result_rows(data_file, indices, results):
+    """Write a batch of results into the per-key columns.
+
+    Parameters
+    ----------
+    data_file : h5py.File
+
+    indices : list
+        Sweep point indices of the results.
+    results : list
+        List of dicts with the data of each point.
+
+    Returns
+    -------
+    None
+
+    """
+    order = np.argsort(indices)  # hdf5 point selections must be increasing
+    indices = [indices[i] for i in order]
+    results = [results[i] for i in order]
+    num_points = data_file["completed"].shape[0]
+    for key in results[0].keys():
+        values = np.stack([np.asarray(result[key]) for result in results])
+        if values.dtype.kind in "UO":
+            values = values.astype(h5py.string_dtype())
+        name = str(key)
+        if name not in data_file["data"]:
+            data_file["data"].create_dataset(
+                name,
+                shape=(num_points,) + values.shape[1:],
+                dtype=values.dtype,
+                **_column_options(data_file, values.shape[1:]),
+            )
+        column = data_file["data"][name]
+        if column.shape[1:] != values.shape[1:]:
+            raise ValueError(
+                f"Data '{name}' has shape {values.shape[1:]}, but the stored "
+                f"column expects {column.shape[1:]}."
+            )
+        column[indices] = values
+    data_file["completed"][indices] = True
+
+
+class SweepData:
+    """Read access to sweep results written by `stream_data_to_file`.
+
+    Columns are returned as h5py datasets, so slicing a key across points only reads the
+    requested part of the file.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the hdf5 file.
+
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = h5py.File(filename, "r")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the underlying file."""
+        self.file.close()
+
+    def keys(self):
+        """Return the names of the stored data columns."""
+        return list(self.file["data"].keys())
+
+    def __getitem__(self, key):
+        return self.file["data"][key]
+
+    def __len__(self):
+        return self.file["completed"].shape[0]
+
+    @property
+    def completed(self):
+        """Boolean array flagging the sweep points that have been written."""
+        return self.file["completed"][()]
+
+    @property
+    def sweep_values(self):
+        """Structured array of the sweep point values."""
+        return self.file["sweep"][()]
+
+    def get(self, key, points=None):
+        """Read a data column, optionally restricted to some sweep points.
+
+        Parameters
+        ----------
+        key : str
+            Name of the data column.
+        points : slice or array of int
+            Sweep point selection. (Default value = None)
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        column = self[key]
+        if points is None:
+            return column[()]
+        if isinstance(points, slice):
+            return column[points]
+        # hdf5 point selections must be increasing and unique
+        unique_points, inverse = np.unique(np.asarray(points), return_inverse=True)
+        return column[unique_points][inverse]
+
+    def memmap(self, key):
+        """Memory-map a data column of a file written with the contiguous layout.
+
+        Parameters
+        ----------
+        key : str
+            Name of the data column.
+
+        Returns
+        -------
+        np.memmap
+
+        """
+        column = self[key]
+        offset = column.id.get_offset()
+        if offset is None or column.chunks is not None:
+            raise ValueError(
+                f"Column '{key}' is not stored contiguously and cannot be memory-mapped."
+            )
+        return np.memmap(
+            self.filename,
+            mode="r",
+            dtype=column.dtype,
+            shape=column.shape,
+            offset=offset,
+        )
@@ -0,0 +1,255 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Scratch storage backends for serialising objects through temporary files."""
+
+import abc
+import atexit
+import contextlib
+import itertools
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from .data_utils import SerialBlob, as_serial_blob
+
+
+class ScratchBackend(abc.ABC):
+    """Base class for the temporary storage used by `store_serial` and `load_serial`.
+
+    Every backend keeps counters of the bytes moved through it and of the time spent
+    in scratch round trips, which includes the time spent in the save and load
+    functions.
+    """
+
+    def __init__(self):
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset the I/O counters."""
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.time_spent = 0.0
+        self.num_files = 0
+
+    def stats(self):
+        """Return the I/O counters.
+
+        Returns
+        -------
+        dict with bytes_written, bytes_read, time_spent and num_files.
+
+        """
+        return {
+            "bytes_written": self.bytes_written,
+            "bytes_read": self.bytes_read,
+            "time_spent": self.time_spent,
+            "num_files": self.num_files,
+        }
+
+    @abc.abstractmethod
+    def _new_path(self, ext_format):
+        """Return a new unique file path with the extension `ext_format`."""
+
+    def _release(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    @contextlib.contextmanager
+    def scratch_path(self, ext_format):
+        """Provide a temporary file path that is removed on exit.
+
+        Parameters
+        ----------
+        ext_format : str
+            File extension, which some save/load functions use for format detection.
+
+        """
+        start = time.perf_counter()
+        path = self._new_path(ext_format)
+        self.num_files += 1
+        try:
+            yield path
+        finally:
+            self._release(path)
+            self.time_spent += time.perf_counter() - start
+
+    def store(self, obj, save_fct, ext_format, compression=None):
+        """Serialise `obj` by saving it to a scratch file with `save_fct(obj, path)`.
+
+        Parameters
+        ----------
+        obj :
+            Object to serialise.
+        save_fct :
+            Function writing `obj` to a path.
+        ext_format : str
+            File extension.
+        compression : str
+            Optional codec for the returned blob. (Default value = None)
+
+        Returns
+        -------
+        SerialBlob
+
+        """
+        with self.scratch_path(ext_format) as tmp_path:
+            save_fct(obj, tmp_path)
+            with open(tmp_path, "rb") as f:
+                raw_data = f.read()
+            self.bytes_written += len(raw_data)
+            self.bytes_read += len(raw_data)
+        return SerialBlob.from_bytes(raw_data, compression=compression)
+
+    def load(self, serial_obj, load_fct, ext_format):
+        """Deserialise an object by writing it to a scratch file read by `load_fct`.
+
+        Parameters
+        ----------
+        serial_obj : SerialBlob, bytes-like or str
+            Serialised data.
+        load_fct :
+            Function reading the object from a path.
+        ext_format : str
+            File extension.
+
+        Returns
+        -------
+        obj
+
+        """
+        blob = as_serial_blob(serial_obj)
+        with self.scratch_path(ext_format) as tmp_path:
+            blob.write(tmp_path)
+            size = os.path.getsize(tmp_path)
+            self.bytes_written += size
+            obj = load_fct(tmp_path)
+            self.bytes_read += size
+        return obj
+
+
+class DiskScratch(ScratchBackend):
+    """Scratch files with unique names in a directory, by default the system temp dir.
+
+    Parameters
+    ----------
+    scratch_dir : str
+        Existing directory for the scratch files. (Default value = None)
+
+    """
+
+    def __init__(self, scratch_dir=None):
+        self.scratch_dir = scratch_dir
+        super().__init__()
+
+    def _new_path(self, ext_format):
+        scratch_dir = self.scratch_dir or tempfile.gettempdir()
+        return os.path.join(scratch_dir, uuid.uuid4().hex + "." + ext_format)
+
+
+class ProcessScratch(ScratchBackend):
+    """Scratch files in a private directory that is created once per process.
+
+    The directory is reused for all round trips and removed at interpreter exit.
+    Forked processes create their own directory on first use.
+
+    Parameters
+    ----------
+    parent_dir : str
+        Directory in which the private directory is created. (Default value = None)
+
+    """
+
+    def __init__(self, parent_dir=None):
+        self.parent_dir = parent_dir
+        self._dir = None
+        self._pid = None
+        self._counter = itertools.count()
+        super().__init__()
+
+    @property
+    def scratch_dir(self):
+        """Private scratch directory of the current process."""
+        if self._dir is None or self._pid != os.getpid():
+            self._dir = tempfile.mkdtemp(prefix="qmt_scratch_", dir=self.parent_dir)
+            self._pid = os.getpid()
+            atexit.register(shutil.rmtree, self._dir, True)
+        return self._dir
+
+    def _new_path(self, ext_format):
+        return os.path.join(self.scratch_dir, f"{next(self._counter)}.{ext_format}")
+
+    def close(self):
+        """Remove the scratch directory of the current process."""
+        if self._dir is not None and self._pid == os.getpid():
+            shutil.rmtree(self._dir, ignore_errors=True)
+        self._dir = None
+
+
+class SharedMemoryScratch(ProcessScratch):
+    """Per-process scratch directory on the tmpfs at /dev/shm.
+
+    File contents never touch the disk. If /dev/shm is not available, this falls
+    back to the system temp dir, which is reported by `in_memory`.
+    """
+
+    shm_dir = "/dev/shm"
+
+    def __init__(self):
+        self.in_memory = os.path.isdir(self.shm_dir) and os.access(
+            self.shm_dir, os.W_OK
+        )
+        super().__init__(parent_dir=self.shm_dir if self.in_memory else None)
+
+
+_default_scratch = DiskScratch()
+
+
+def get_default_scratch():
+    """Return the backend used when no scratch is passed explicitly."""
+    return _default_scratch
+
+
+def set_default_scratch(scratch):
+    """Set the backend used when no scratch is passed explicitly.
+
+    Parameters
+    ----------
+    scratch : ScratchBackend
+
+    Returns
+    -------
+    The previous default backend.
+
+    """
+    global _default_scratch
+    if not isinstance(scratch, ScratchBackend):
+        raise TypeError("scratch must be a ScratchBackend instance.")
+    previous = _default_scratch
+    _default_scratch = scratch
+    return previous
+
+
+def resolve_scratch(scratch=None, scratch_dir=None):
+    """Select the scratch backend for a serialisation call.
+
+    Parameters
+    ----------
+    scratch : ScratchBackend
+        Explicitly requested backend. (Default value = None)
+    scratch_dir : str
+        Legacy scratch directory, used through a DiskScratch if `scratch` is None.
+        (Default value = None)
+
+    Returns
+    -------
+    ScratchBackend
+
+    """
+    if scratch is not None:
+        return scratch
+    if scratch_dir:
+        return DiskScratch(scratch_dir)
+    return _default_scratch
@@ -36,12 +36,14 @@ class SerialFenicsFunctionData:
         self.serial_function = serial_function
 
 
-def serialize_fenics_function(mesh, fenics_function):
+def serialize_fenics_function(mesh, fenics_function, compression="zlib"):
     def _write_fenics_file(data, path):
         fn.File(path) << data
 
-    serial_mesh = store_serial(mesh, _write_fenics_file, "xml")
-    serial_function = store_serial(fenics_function, _write_fenics_file, "xml")
+    serial_mesh = store_serial(mesh, _write_fenics_file, "xml", compression=compression)
+    serial_function = store_serial(
+        fenics_function, _write_fenics_file, "xml", compression=compression
+    )
 
     return SerialFenicsFunctionData(serial_mesh, serial_function)
 
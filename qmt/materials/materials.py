@@ -7,6 +7,7 @@
 #
 
 import collections
+import functools
 import json
 import os
 import re
@@ -23,6 +24,26 @@ toFloat = pc.to_float
 
 __all__ = ["Material", "Materials", "conduction_band_offset", "valence_band_offset"]
 
+# Alloy names, see Materials.find
+# A_y B_x C
+_BIN_PATTERN1 = re.compile(
+    r"([A-Z][a-z]*)(\d+\.?\d*|\.\d+)([A-Z][a-z]*)(\d+\.?\d*|\.\d+)([A-Z][a-z]*)"
+)
+# A B_y C_x
+_BIN_PATTERN2 = re.compile(
+    r"([A-Z][a-z]*)([A-Z][a-z]*)(\d+\.?\d*|\.\d+)([A-Z][a-z]*)(\d+\.?\d*|\.\d+)"
+)
+# (A)_y (B)_x
+_BIN_PATTERN3 = re.compile(r"\((.+)\)(\d+\.?\d*|\.\d+)\((.+)\)(\d+\.?\d*|\.\d+)")
+
+
+@functools.lru_cache(maxsize=32)
+def _energy_unit(eunit):
+    """Return the meV in units of eunit, or the sympy meV for eunit None."""
+    if eunit is None:
+        return units.meV
+    return toFloat(units.meV / parseUnit(eunit))
+
 
 class Material(collections.Mapping):
     """Wrapper for an entry in the materials database.
@@ -47,10 +68,7 @@ class Material(collections.Mapping):
     def __init__(self, name, properties, eunit=None):
         self.name = name
         self.properties = dict(properties)
-        if eunit is None:
-            self.energyUnit = units.meV
-        else:
-            self.energyUnit = toFloat(units.meV / parseUnit(eunit))
+        self.energyUnit = _energy_unit(eunit)
         # Tuple of key values that have energy units:
         self.energy_quantities = (
             "workFunction",
@@ -185,12 +203,18 @@ class Materials(collections.Mapping):
         Dictionary of materials to fill the database.
     load : bool
         Load the json file. Needs to be False when creating a new materials.json file.
+    cacheSize : int
+        Number of alloys whose interpolated properties are kept by `find`.
+        (Default value = 1024)
 
     """
 
-    def __init__(self, matPath=None, matDict=None, load=True):
+    def __init__(self, matPath=None, matDict=None, load=True, cacheSize=1024):
         self.matDict = {}
         self.bowingParameters = {}
+        # Interpolated alloy properties by name, least recently used first
+        self.cacheSize = cacheSize
+        self._alloyCache = collections.OrderedDict()
         if matPath is None and matDict is None:
             matPath = os.path.join(os.path.dirname(__file__), "materials.json")
         self.matPath = matPath
@@ -201,6 +225,7 @@ class Materials(collections.Mapping):
         if matDict is not None:
             self.bowingParameters.update(matDict.pop("__bowing_parameters", {}))
             self.matDict = matDict
+            self.clear_cache()
 
     def __iter__(self):
         return iter(self.matDict)
@@ -208,6 +233,15 @@ class Materials(collections.Mapping):
     def __len__(self):
         return len(self.matDict)
 
+    def clear_cache(self):
+        """Drop the alloy properties cached by `find`.
+
+        This happens automatically when the database is changed through the methods
+        of this class, but needs to be called after modifying matDict or
+        bowingParameters directly.
+        """
+        self._alloyCache.clear()
+
     def add_material(self, name, mat_type, **kwargs):
         """Generate a material and add it to the matDict.
 
@@ -228,6 +262,7 @@ class Materials(collections.Mapping):
         if mat_type in ("metal", "dielectric"):
             kwargs["electronMass"] = kwargs.get("electronMass", 1.0)
         self.matDict[name] = self._make_material(mat_type, **kwargs)
+        self.clear_cache()
 
     def set_bowing_parameters(self, name_a, name_b, mat_type, **kwargs):
         """Generate a bowing parameter set and add it to the bowingParameters dict.
@@ -251,6 +286,7 @@ class Materials(collections.Mapping):
         self.bowingParameters[(name_a, name_b)] = self._make_material(
             mat_type, **kwargs
         )
+        self.clear_cache()
 
     def _make_material(self, mat_type, **kwargs):
         material = {}
@@ -299,12 +335,14 @@ class Materials(collections.Mapping):
     def __setitem__(self, key, val):
         # This assumes that val is a Material object
         self.matDict[key] = val.properties
+        self.clear_cache()
 
     def find(self, name, eunit=None):
         """Retrieve a named material from the database.
 
         If the material is not found directly, an attempt is made to construct
         it by mixing two known materials. If that also fails, a KeyError is raised.
+        The properties of the last `cacheSize` alloys are cached.
 
         Parameters
         ----------
@@ -321,23 +359,13 @@ class Materials(collections.Mapping):
         """
         if name in self.matDict:
             properties = self.matDict[name]
+        elif name in self._alloyCache:
+            self._alloyCache.move_to_end(name)
+            properties = self._alloyCache[name]
         else:
-            # print("parsing", name)
-            # A_y B_x C
-            bin_pattern1 = (
-                r"([A-Z][a-z]*)(\d+\.?\d*|\.\d+)([A-Z][a-z]*)(\d+\.?\d*|\.\d+)([A-Z]["
-                r"a-z]*)"
-            )
-            # A B_y C_x
-            bin_pattern2 = (
-                r"([A-Z][a-z]*)([A-Z][a-z]*)(\d+\.?\d*|\.\d+)([A-Z][a-z]*)("
-                r"\d+\.?\d*|\.\d+)"
-            )
-            # (A)_y (B)_x
-            bin_pattern3 = r"\((.+)\)(\d+\.?\d*|\.\d+)\((.+)\)(\d+\.?\d*|\.\d+)"
-            match1 = re.match(bin_pattern1, name)
-            match2 = re.match(bin_pattern2, name)
-            match3 = re.match(bin_pattern3, name)
+            match1 = _BIN_PATTERN1.match(name)
+            match2 = _BIN_PATTERN2.match(name)
+            match3 = _BIN_PATTERN3.match(name)
             if match1:
                 A, y, B, x, C = match1.groups()
                 x, y = float(x), float(y)
@@ -355,6 +383,9 @@ class Materials(collections.Mapping):
                 properties = self._make_binary_alloy(A, B, x)
             else:
                 raise KeyError(name)
+            self._alloyCache[name] = properties
+            while len(self._alloyCache) > self.cacheSize:
+                self._alloyCache.popitem(last=False)
         return Material(name, properties, eunit=eunit)
 
     def _make_binary_alloy(self, nameA, nameB, x):
@@ -417,6 +448,7 @@ class Materials(collections.Mapping):
         self.bowingParameters = {}
         for k, v in bowingParms.items():
             self.bowingParameters[literal_eval(k)] = v
+        self.clear_cache()
 
     def save(self):
         """Save the current materials database to disk."""
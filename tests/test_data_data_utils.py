@@ -3,9 +3,23 @@
 
 """Testing data utilities."""
 
-from qmt.infrastructure import store_serial
+from qmt.infrastructure import (
+    DiskScratch,
+    ProcessScratch,
+    ScratchBackend,
+    SerialBlob,
+    SharedMemoryScratch,
+    load_serial,
+    serialize_file,
+    set_default_scratch,
+    store_serial,
+    stream_data_to_file,
+    SweepData,
+    write_deserialised,
+)
 import codecs
 import os
+import pytest
 
 
 def test_store_serial(datadir, fix_FCDoc):
@@ -15,13 +29,11 @@ def test_store_serial(datadir, fix_FCDoc):
     # Serialise document
     obj = fix_FCDoc.addObject("App::FeaturePython", "some_content")
     serial_data = store_serial(fix_FCDoc, lambda d, p: d.saveAs(p), "fcstd")
+    assert isinstance(serial_data, SerialBlob)
 
     # Write to a file
     file_path = os.path.join(datadir, "test.fcstd")
-
-    data = codecs.decode(serial_data.encode(), "base64")
-    with open(file_path, "wb") as of:
-        of.write(data)
+    write_deserialised(serial_data, file_path)
 
     # Load back and check
     doc = FreeCAD.newDocument("instance")
@@ -30,3 +42,123 @@ def test_store_serial(datadir, fix_FCDoc):
 
     assert doc.getObject("some_content") is not None
     FreeCAD.closeDocument("instance")
+
+
+@pytest.mark.parametrize("compression", [None, "zlib", "bz2", "lzma"])
+def test_serial_blob_roundtrip(datadir, compression):
+    """Test blob serialisation with and without compression."""
+    file_path = os.path.join(datadir, "raw.dat")
+    content = b"qmt" * 1000 + bytes(range(256))
+    with open(file_path, "wb") as f:
+        f.write(content)
+
+    blob = serialize_file(file_path, compression=compression)
+    assert blob.tobytes() == content
+    assert bytes(blob.view()) == content
+    if compression is not None:
+        assert len(blob) < len(content)
+
+    def _save_fct(data, path):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def _load_fct(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    stored = store_serial(content, _save_fct, "dat", compression=compression)
+    assert stored == blob
+    assert load_serial(stored, _load_fct) == content
+
+
+def test_legacy_base64_payload(datadir):
+    """Test that base64 strings from earlier versions can still be read."""
+    content = b"legacy payload"
+    legacy = codecs.encode(content, "base64").decode()
+    file_path = os.path.join(datadir, "legacy.dat")
+    write_deserialised(legacy, file_path)
+    with open(file_path, "rb") as f:
+        assert f.read() == content
+
+    with pytest.raises(ValueError):
+        SerialBlob(b"", compression="unknown")
+
+
+@pytest.mark.parametrize(
+    "scratch_type", [DiskScratch, ProcessScratch, SharedMemoryScratch]
+)
+def test_scratch_backends(scratch_type):
+    """Test serialisation round trips through the scratch backends."""
+    content = b"scratch" * 100
+
+    def _save_fct(data, path):
+        assert path.endswith(".dat")
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def _load_fct(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    scratch = scratch_type()
+    blob = store_serial(content, _save_fct, "dat", scratch=scratch)
+    assert load_serial(blob, _load_fct, ext_format="dat", scratch=scratch) == content
+    stats = scratch.stats()
+    assert stats["num_files"] == 2
+    assert stats["bytes_written"] == 2 * len(content)
+    assert stats["bytes_read"] == 2 * len(content)
+    assert stats["time_spent"] > 0
+    scratch.reset_stats()
+    assert scratch.stats()["num_files"] == 0
+
+    # Backends must provide their scratch paths
+    with pytest.raises(TypeError):
+        ScratchBackend()
+
+
+def test_default_scratch():
+    """Test swapping the default scratch backend."""
+    scratch = ProcessScratch()
+    previous = set_default_scratch(scratch)
+    try:
+        store_serial(b"data", lambda d, p: open(p, "wb").write(d), "dat")
+        assert scratch.num_files == 1
+        assert os.listdir(scratch.scratch_dir) == []
+    finally:
+        set_default_scratch(previous)
+        scratch.close()
+
+
+def test_stream_data_to_file(datadir):
+    """Test streaming of sweep results to hdf5, including resuming a partial file."""
+    import numpy as np
+    from dask.distributed import Client
+
+    dc = Client(processes=False)
+    sweep_vals = [{"x": float(x), "name": f"p{x}"} for x in range(5)]
+    futures = [
+        dc.submit(lambda x: {"y": np.arange(3) * x, "s": x}, x) for x in range(5)
+    ]
+    file_path = os.path.join(datadir, "sweep.h5")
+    stream_data_to_file(futures[:3], file_path, dc, sweep_vals=sweep_vals[:3])
+    with SweepData(file_path) as data:
+        assert len(data) == 3
+        assert data.completed.all()
+    stream_data_to_file(futures, file_path, dc, sweep_vals=sweep_vals, resume=True)
+    with SweepData(file_path) as data:
+        assert sorted(data.keys()) == ["s", "y"]
+        assert data.completed.all()
+        assert np.all(data.sweep_values["x"] == np.arange(5))
+        assert data.sweep_values["name"][4] == b"p4"
+        assert np.all(data["y"][:, 1] == np.arange(5))
+        assert np.all(data.get("s", [4, 1, 4]) == [4, 1, 4])
+        assert data["y"].compression == "gzip"
+        with pytest.raises(ValueError):
+            data.memmap("y")
+
+    contiguous_path = os.path.join(datadir, "sweep_contiguous.h5")
+    stream_data_to_file(futures, contiguous_path, dc, layout="contiguous")
+    with SweepData(contiguous_path) as data:
+        assert np.all(data.memmap("y") == data.get("y"))
+        assert np.all(data.sweep_values["index"] == np.arange(5))
+    dc.close()
@@ -55,3 +55,24 @@ def test_deepRemove(fix_FCDoc, fix_two_cycle_sketch):
     fix_FCDoc.removeObject(box1.Name)  # interjected delete without recompute
     deepRemove(inter2)
     assert not fix_FCDoc.Objects
+
+
+def test_deferredRecompute(fix_FCDoc):
+    """Test that recomputes are deferred and objects updated on demand."""
+    resetRecomputeStats()
+    box = fix_FCDoc.addObject("Part::Box", "Box")
+    with deferredRecompute(fix_FCDoc):
+        box.Length = 5.0
+        recompute(fix_FCDoc)
+        recompute(fix_FCDoc)
+        assert isDirty(box)
+        ensureRecomputed(box)
+        assert not isDirty(box)
+        assert box.Shape.BoundBox.XLength == 5.0
+    stats = recomputeStats()
+    assert stats["requested"] == 3
+    assert stats["performed"] == 1
+    assert stats["saved"] == 2
+    assert stats["partial"] == 1
+    ensureRecomputed(box)  # no-op outside of deferredRecompute
+    assert recomputeStats()["partial"] == 1
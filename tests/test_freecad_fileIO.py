@@ -52,3 +52,31 @@ def test_exportCAD(datadir, fix_FCDoc):
     with pytest.raises(ValueError) as err:
         exportCAD([testShape], "not_a_step_file")
     assert "not a supported extension" in str(err.value)
+
+
+def test_exportMeshed_options(datadir, fix_FCDoc):
+    """Test tessellation options, STL formats and per-part export."""
+    from qmt.geometry.freecad.geomUtils import makeBB
+
+    box0 = makeBB((0.0, 1.0, 0.0, 1.0, 0.0, 1.0))
+    box1 = makeBB((2.0, 3.0, 0.0, 1.0, 0.0, 1.0))
+    box1.Label = "box1"
+    filePath = os.path.join(datadir, "tmp_testMeshed.stl")
+
+    report = exportMeshed([box0, box1], filePath, linearDeflection=0.01, binary=True)
+    assert report["files"] == [filePath]
+    assert report["triangles"][filePath] == 24
+    assert report["time"] >= 0.0
+    assert os.path.getsize(filePath) == 84 + 50 * 24
+
+    # Only the writer changes, the default tessellation is kept
+    default = exportMeshed([box0], filePath)["triangles"][filePath]
+    report = exportMeshed([box0], filePath, binary=False)
+    assert report["triangles"][filePath] == default
+    with open(filePath) as f:
+        assert f.read().startswith("solid")
+
+    report = exportMeshed([box0, box1], filePath, angularDeflection=0.1, merge=False)
+    assert len(report["files"]) == 2
+    assert report["files"][1] == os.path.join(datadir, "tmp_testMeshed_box1.stl")
+    assert all(n == 12 for n in report["triangles"].values())
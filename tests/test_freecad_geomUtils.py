@@ -128,6 +128,36 @@ def test_checkOverlap(fix_FCDoc):
     assert checkOverlap((box1, box2)) is False
 
 
+def test_checkOverlap_touching(fix_FCDoc):
+    """Test that touching volumes don't overlap for any number of objects."""
+    boxes = [fix_FCDoc.addObject("Part::Box", f"Box{i}") for i in range(3)]
+    for box, x in zip(boxes, (0, 10, 5)):
+        box.Placement = FreeCAD.Placement(vec(x, 0, 0), FreeCAD.Rotation())
+    fix_FCDoc.recompute()
+    assert checkOverlap(boxes[:2]) is False
+    assert checkOverlap(boxes) is False
+    assert checkOverlap(boxes[1:]) is True
+
+
+def test_checkShapeOverlap():
+    """Test overlap between two shapes."""
+    box1 = Part.makeBox(10, 10, 10)
+    assert checkShapeOverlap(box1, Part.makeBox(10, 10, 10, vec(9.9, 0, 0))) is True
+    assert checkShapeOverlap(box1, Part.makeBox(10, 10, 10, vec(10.1, 0, 0))) is False
+
+
+def test_findOverlapCandidates():
+    """Test the bounding box prefilter."""
+    shapes = [
+        Part.makeBox(10, 10, 10),
+        Part.makeBox(10, 10, 10, vec(5, 5, 5)),
+        None,
+        Part.makeBox(10, 10, 10, vec(5, 12, 0)),
+        Part.makeBox(1, 1, 1, vec(30, 0, 0)),
+    ]
+    assert findOverlapCandidates(shapes) == {(0, 1), (1, 3)}
+
+
 def test_extrudeBetween(fix_FCDoc, fix_hexagon_sketch):
     """Test if extrusion bounding box is within z interval."""
     sketch = fix_hexagon_sketch()
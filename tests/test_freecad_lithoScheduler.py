@@ -0,0 +1,38 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Testing the parallel lithography scheduler."""
+
+import numpy as np
+
+from qmt.geometry.freecad.lithoScheduler import *
+from qmt.geometry.freecad.shapeUtils import fromBrep, toBrep
+
+import FreeCAD
+import Part
+
+vec = FreeCAD.Vector
+
+
+def test_requiredNodes():
+    """Test the H node dependencies of a two-layer stack."""
+    layers = {1: {"objIDs": {0: {}}}, 2: {"objIDs": {0: {}, 1: {}}}}
+    needed = requiredNodes(layers)
+    assert needed[2] == {(0, ()), (1, ())}
+    assert needed[1] == {(0, ()), (0, (2,))}
+
+
+def test_computeH():
+    """Test an H node on a single substrate block."""
+    B = toBrep(Part.makeBox(10, 10, 1))
+    C = toBrep(Part.makeBox(10, 10, 10))
+    substrateCheck = [toBrep(Part.makeBox(5, 5, 5, vec(0, 0, -1)))]
+    substrateUse = [toBrep(Part.makeBox(5, 5, 6, vec(0, 0, -1)))]
+    H = [fromBrep(brep) for brep in computeH(B, C, 0.0, [], [], [])]
+    assert len(H) == 1
+    H = [
+        fromBrep(brep) for brep in computeH(B, C, 0.0, [], substrateCheck, substrateUse)
+    ]
+    assert len(H) == 2
+    assert np.isclose(H[0].Volume, 100.0)
+    assert np.isclose(H[1].Volume, 125.0)
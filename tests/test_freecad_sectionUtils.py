@@ -0,0 +1,55 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Testing QMT multi-slice cross sections."""
+
+import numpy as np
+import Part
+
+from qmt.geometry.freecad.sectionUtils import *
+
+
+def test_sliceShapes():
+    """Test slicing a box and two disjoint boxes at several planes."""
+    box = Part.makeBox(10, 10, 10)
+    pair = Part.makeBox(2, 2, 2).fuse(Part.makeBox(2, 2, 2, vec(5, 5, 0)))
+    result = sliceShapes({"box": box, "pair": pair}, (1, 0, 0), [1.0, 4.0, 20.0])
+    assert len(result) == 3
+    polygon = result[0]["box"][0]
+    assert polygon.shape == (4, 3)
+    assert np.allclose(polygon[:, 0], 1.0)
+    assert {(y, z) for _, y, z in polygon} == {(0, 0), (10, 0), (10, 10), (0, 10)}
+    assert len(result[0]["pair"]) == 1
+    for d, planeResult in zip([1.0, 4.0, 20.0], result):
+        for polygons in planeResult.values():
+            for polygon in polygons:
+                assert np.allclose(polygon[:, 0], d)
+    assert len(result[1]["pair"]) == 0
+    assert result[2] == {"box": [], "pair": []}
+
+    # BRep strings are sliced the same way
+    fromBreps = sliceShapes({"box": shapeUtils.toBrep(box)}, (1, 0, 0), [1.0])
+    assert np.allclose(fromBreps[0]["box"][0], polygon)
+
+
+def test_sliceShapesParallel():
+    """Test that the parallel slices match the serial ones."""
+    box = Part.makeBox(10, 10, 10)
+    distances = np.linspace(0.5, 9.5, 7)
+    serial = sliceShapes({"box": box}, (0, 0, 1), distances)
+    parallel = sliceShapesParallel({"box": box}, (0, 0, 1), distances, n_workers=2)
+    assert len(parallel) == len(distances)
+    for d, s, p in zip(distances, serial, parallel):
+        assert len(s["box"]) == len(p["box"]) == 1
+        assert np.allclose(s["box"][0][:, 2], d)
+        assert np.allclose(s["box"][0], p["box"][0])
+
+
+def test_sectionPolygons_curved():
+    """Test that circular sections are discretized into closed polygons."""
+    cylinder = Part.makeCylinder(2, 10)
+    result = sliceShapes({"cylinder": cylinder}, (0, 0, 1), [5.0])
+    polygon = result[0]["cylinder"][0]
+    assert len(polygon) > 8
+    assert np.allclose(np.linalg.norm(polygon[:, :2], axis=1), 2)
+    assert np.allclose(polygon[:, 2], 5)
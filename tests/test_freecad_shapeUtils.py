@@ -0,0 +1,144 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Testing QMT document-free shape functions."""
+
+import numpy as np
+
+from qmt.geometry.freecad.shapeUtils import *
+
+vec = FreeCAD.Vector
+
+
+def test_fuse():
+    """Test fuse by checking the bounding box."""
+    box1 = Part.makeBox(10, 10, 10)
+    box2 = Part.makeBox(10, 10, 10, vec(10, 0, 0))
+    assert fuse([]) is None
+    assert np.isclose(fuse([Part.Shape(), box1]).Volume, 10 ** 3)
+    assert fuse([box1, box2]).BoundBox.XLength == 20
+
+
+def test_cut():
+    """Test cut by checking volume."""
+    box1 = Part.makeBox(10, 10, 10)
+    box2 = Part.makeBox(10, 10, 10, vec(5, 0, 0))
+    box3 = Part.makeBox(10, 10, 10, vec(-8, 0, 0))
+    assert np.isclose(cut(box1, box2).Volume, 10 ** 3 * 0.5)
+    assert np.isclose(cut(box1, [box2, box3]).Volume, 10 ** 3 * 0.3)
+    assert np.isclose(cut(box1, []).Volume, 10 ** 3)
+
+
+def test_common():
+    """Test common by checking volume."""
+    box1 = Part.makeBox(10, 10, 10)
+    box2 = Part.makeBox(10, 10, 10, vec(7, 0, 0))
+    assert np.isclose(common([box1, box2]).Volume, 10 ** 3 * 0.3)
+    assert not isNonemptyShape(common([box1, translate(box2, (10, 0, 0))]))
+
+
+def test_extrudeBetween():
+    """Test extrusion of a closed wire."""
+    wire = Part.makePolygon([vec(0, 0, 0), vec(2, 0, 0), vec(2, 3, 0), vec(0, 0, 0)])
+    solid = extrudeBetween(wire, 1.0, 5.0)
+    assert np.isclose(solid.Volume, 3.0 * 4.0)
+    assert np.isclose(solid.BoundBox.ZMin, 1.0)
+    assert np.isclose(solid.BoundBox.ZMax, 5.0)
+
+
+def test_addShape(fix_FCDoc):
+    """Test materializing a shape in the document."""
+    obj = addShape(Part.makeBox(1, 2, 3), label="Block")
+    assert obj.Label == "Block"
+    assert np.isclose(obj.Shape.Volume, 6.0)
+
+
+def test_offsetShape():
+    """Test offsetting a box."""
+    box = Part.makeBox(10, 10, 10)
+    offset = offsetShape(box, 1.0)
+    assert np.isclose(offset.BoundBox.XLength, 12.0)
+
+
+def test_shapeHash():
+    """Test that the hash only depends on geometry."""
+    box = Part.makeBox(10, 10, 10)
+    assert shapeHash(box) == shapeHash(Part.makeBox(10, 10, 10))
+    assert shapeHash(box) != shapeHash(Part.makeBox(10, 10, 11))
+    # Arcs with the same end points but different radii
+    arc1 = Part.Arc(vec(0, 0, 0), vec(1, 1, 0), vec(2, 0, 0)).toShape()
+    arc2 = Part.Arc(vec(0, 0, 0), vec(1, 2, 0), vec(2, 0, 0)).toShape()
+    assert shapeHash(arc1) != shapeHash(arc2)
+
+
+def test_shapeHash_mirror():
+    """Test that a D-shaped solid and its mirror image across the chord differ."""
+
+    def dSolid(bulge):
+        arc = Part.Arc(vec(0, 0, 0), vec(1, bulge, 0), vec(2, 0, 0)).toShape()
+        chord = Part.makeLine(vec(2, 0, 0), vec(0, 0, 0))
+        return extrudeBetween(Part.Wire([arc, chord]), 0.0, 1.0)
+
+    solid, mirrored = dSolid(1.0), dSolid(-1.0)
+    assert np.isclose(solid.Volume, mirrored.Volume)
+    assert shapeHash(solid) != shapeHash(mirrored)
+
+
+def test_ShapeMemo():
+    """Test memo hits and the memory cap."""
+    box = Part.makeBox(10, 10, 10)
+    memo = ShapeMemo()
+    assert memo.get("a") is None
+    memo.put("a", box)
+    assert np.isclose(memo.get("a").Volume, 1000.0)
+    assert memo.stats()["hit_rate"] == 0.5
+    memo.max_bytes = memo.nbytes
+    memo.put("b", Part.makeBox(1, 1, 1))
+    assert memo.get("a") is None
+    assert memo.stats()["evictions"] == 1
+    assert memo.stats()["entries"] == 1
+
+
+def test_OverlapCache():
+    """Test the overlap check stages and the symmetric cache."""
+    cache = OverlapCache()
+    box = Part.makeBox(10, 10, 10)
+    overlapping = Part.makeBox(10, 10, 10, vec(9.9, 0, 0))
+    touching = Part.makeBox(10, 10, 10, vec(10, 0, 0))
+    distant = Part.makeBox(10, 10, 10, vec(30, 0, 0))
+    inner = Part.makeBox(1, 1, 1, vec(2, 2, 2))
+    assert cache.overlaps(box, overlapping) is True
+    assert cache.overlaps(overlapping.copy(), box) is True
+    assert cache.overlaps(box, touching) is False
+    assert cache.overlaps(box, distant) is False
+    assert cache.overlaps(inner, box) is True
+    stats = cache.stats()
+    assert stats["checks"] == 5
+    assert stats["hits"] == 1
+    assert stats["bbox_rejects"] == 1
+    assert stats["exact_checks"] == 3
+    assert stats["avoided_intersections"] == 2
+    # Hashes are computed once per shape, and only a few shapes are kept
+    assert len(cache.hashes) == 5
+    small = OverlapCache(max_hashes=2)
+    small.overlaps(box, overlapping)
+    small.overlaps(box, inner)
+    assert len(small.hashes) == 2
+
+
+def test_OverlapCache_nonConvex():
+    """Test that a ring touching the core in its hole does not overlap it."""
+    cache = OverlapCache()
+    core = Part.makeCylinder(2, 10)
+    ring = Part.makeCylinder(5, 10).cut(core)
+    assert cache.overlaps(core, ring) is False
+    assert cache.stats()["exact_checks"] == 1
+
+
+def test_OverlapCache_largeParts():
+    """Test that small overlaps of large parts are found."""
+    cache = OverlapCache()
+    box = Part.makeBox(1e4, 1e4, 1e4)
+    corner = Part.makeBox(1e4, 1e4, 1e4, vec(9940, 9940, 9940))
+    assert cache.overlaps(box, corner) is True
+    assert hasCommonVolume([box, corner])
@@ -91,11 +91,21 @@ def test_addCycleSketch(fix_FCDoc, fix_two_cycle_sketch):
         addCycleSketch("cyclesketch", wire)
     assert "already exists" in str(err.value)
 
+    assert sketch_new.ConstraintCount == 0
+    sketch_editable = addCycleSketch("editablesketch", wire, editable=True)
+    assert sketch_editable.ConstraintCount == 4
+    assert len(sketch_editable.Shape.Wires) == 1
+
 
 def test_addPolyLineSketch(fix_FCDoc):
     """Test if polylines are correctly added."""
-    pass
-    # TODO
+    doc = FreeCAD.ActiveDocument
+    segArr = np.array([[[0, 0, 0], [1, 0, 0]], [[1, 0, 0], [1, 1, 0]]], dtype=float)
+    sketch = addPolyLineSketch("polyline", doc, [1, 2], segArr)
+    assert sketch.ConstraintCount == 0
+    assert len(sketch.Shape.Edges) == 2
+    sketch = addPolyLineSketch("polyline2", doc, [1, 2], segArr, editable=True)
+    assert sketch.ConstraintCount == 1
 
 
 def test_findEdgeCycles(fix_FCDoc, fix_two_cycle_sketch):
@@ -106,6 +116,108 @@ def test_findEdgeCycles(fix_FCDoc, fix_two_cycle_sketch):
     assert cycles[1] == [4, 5, 6]
 
 
+def test_findEdgeCycles_diagnostics(fix_FCDoc, fix_two_cycle_sketch):
+    """Test that cycles sharing a vertex are split at the shared vertex."""
+    a = (20, 20, 0)
+    sketch = fix_two_cycle_sketch(a=a, g=a)
+    _, cycles, diagnostics = findEdgeCycles(sketch, returnDiagnostics=True)
+    assert sorted(sorted(cycle) for cycle in cycles) == [[0, 1, 2, 3], [4, 5, 6]]
+    assert not diagnostics["openChains"]
+    assert not diagnostics["ambiguousJunctions"]
+
+
+def test_findEdgeCycles_bridge(fix_FCDoc):
+    """Test that a chain between junctions is reported instead of raising."""
+    doc = FreeCAD.ActiveDocument
+    sketch = doc.addObject("Sketcher::SketchObject", "Sketch")
+    points = [(0, 0), (1, 0), (0, 1), (3, 0), (4, 0), (3, 1)]
+    for i, j in [(0, 1), (1, 2), (2, 0), (3, 4), (4, 5), (5, 3), (1, 3)]:
+        sketch.addGeometry(
+            Part.LineSegment(vec(*points[i], 0), vec(*points[j], 0)), False
+        )
+    doc.recompute()
+    _, cycles, diagnostics = findEdgeCycles(sketch, returnDiagnostics=True)
+    assert sorted(sorted(cycle) for cycle in cycles) == [[0, 1, 2], [3, 4, 5]]
+    assert diagnostics["openChains"] == [[6]]
+    assert len(diagnostics["ambiguousJunctions"]) == 2
+
+
+def test_traceSegmentChains():
+    """Test chain ordering and orientation repair."""
+    segArr = np.array(
+        [[[1, 0, 0], [2, 0, 0]], [[0, 0, 0], [1, 0, 0]], [[3, 0, 0], [2, 0, 0]]],
+        dtype=float,
+    )
+    cycles, openChains, junctions = traceSegmentChains(segArr)
+    assert not cycles and not junctions
+    assert openChains == [[1, 0, 2]]
+    assert (segArr[2] == np.array([[2, 0, 0], [3, 0, 0]])).all()
+
+    segArr = np.array(
+        [[[0, 0, 0], [1, 0, 0]], [[1, 1, 0], [1, 0, 0]], [[1, 1, 0], [0, 0, 0]]],
+        dtype=float,
+    )
+    cycles, openChains, junctions = traceSegmentChains(segArr)
+    assert cycles == [[0, 1, 2]]
+    assert (segArr[1] == np.array([[1, 0, 0], [1, 1, 0]])).all()
+
+
+def test_traceSegmentChains_junctions():
+    """Test splitting of cycles that share vertices or edges."""
+
+    def closedPolyline(*points):
+        return [[p + (0,), q + (0,)] for p, q in zip(points, points[1:] + points[:1])]
+
+    def checkCycles(segArr, cycles):
+        for cycle in cycles:
+            for seg0, seg1 in zip(cycle, cycle[1:] + cycle[:1]):
+                assert (segArr[seg0, 1] == segArr[seg1, 0]).all()
+
+    # Figure-eight drawn as one polyline through its center
+    segArr = np.array(
+        closedPolyline((0, 0), (1, 1), (2, 0), (2, 2), (1, 1), (0, 2)), dtype=float
+    )
+    cycles, openChains, junctions = traceSegmentChains(segArr)
+    assert sorted(sorted(cycle) for cycle in cycles) == [[0, 4, 5], [1, 2, 3]]
+    assert not openChains and not junctions
+    checkCycles(segArr, cycles)
+
+    # Adjacent squares, each drawn with its own copy of the shared edge
+    segArr = np.array(
+        closedPolyline((0, 0), (1, 0), (1, 1), (0, 1))
+        + closedPolyline((1, 0), (2, 0), (2, 1), (1, 1)),
+        dtype=float,
+    )
+    segArr[1] = segArr[1, ::-1]
+    cycles, openChains, junctions = traceSegmentChains(segArr)
+    assert sorted(sorted(cycle) for cycle in cycles) == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert not openChains and not junctions
+    checkCycles(segArr, cycles)
+
+    # A dangling segment stays open, the triangle it hangs from is kept
+    segArr = np.array(
+        closedPolyline((0, 0), (1, 0), (0, 1)) + [[(0, 0, 0), (-1, -1, 0)]], dtype=float
+    )
+    cycles, openChains, junctions = traceSegmentChains(segArr)
+    assert sorted(sorted(cycle) for cycle in cycles) == [[0, 1, 2]]
+    assert openChains == [[3]]
+    assert junctions[0][0] == (0, 0, 0)
+    checkCycles(segArr, cycles)
+
+    # A bridge between two triangles belongs to no cycle
+    segArr = np.array(
+        closedPolyline((0, 0), (1, 0), (0, 1))
+        + closedPolyline((3, 0), (4, 0), (3, 1))
+        + [[(1, 0, 0), (3, 0, 0)]],
+        dtype=float,
+    )
+    cycles, openChains, junctions = traceSegmentChains(segArr)
+    assert sorted(sorted(cycle) for cycle in cycles) == [[0, 1, 2], [3, 4, 5]]
+    assert openChains == [[6]]
+    assert [point for point, _ in junctions] == [(1, 0, 0), (3, 0, 0)]
+    checkCycles(segArr, cycles)
+
+
 def test_findEdgeCycles2(fix_FCDoc, fix_two_cycle_sketch):
     """Test multiple cycle ordering."""
     sketch = fix_two_cycle_sketch()
@@ -0,0 +1,63 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Testing the geometry cache."""
+
+import os
+from qmt.geometry import GeometryCache, Geo3DData, part_3d, build_3d_geometry
+from qmt.geometry.geo_cache import canonical, geometry_key
+from qmt.infrastructure import SerialBlob
+
+
+def test_geometry_key():
+    blob = SerialBlob(b"template")
+    wire = part_3d.WirePart("wire", "Sketch", thickness=1.0)
+    parts = [wire, part_3d.WireShellPart("shell", "Sketch001", 0.1, wire, [1], "depo")]
+    key = geometry_key(blob, parts, {"d1": 1.0})
+    assert key == geometry_key(SerialBlob(b"template"), parts, {"d1": 1.0})
+    assert key != geometry_key(SerialBlob(b"other"), parts, {"d1": 1.0})
+    assert key != geometry_key(blob, parts, {"d1": 2.0})
+    assert key != geometry_key(blob, parts[:1], {"d1": 1.0})
+    assert key != geometry_key(blob, parts, {"d1": 1.0}, {"x": {"axis": (1, 0, 0)}})
+    assert key != geometry_key(blob, parts, {"d1": 1.0}, lazy_export=True)
+    assert key != geometry_key(blob, parts, {"d1": 1.0}, mesh_options={"binary": False})
+    # outputs of earlier builds are ignored
+    wire.serial_stp = SerialBlob(b"built")
+    assert key == geometry_key(blob, parts, {"d1": 1.0})
+
+
+def test_canonical():
+    wire = part_3d.WirePart("wire", "Sketch", thickness=1.0)
+    key = canonical(wire)
+    assert key == canonical(part_3d.WirePart("wire", "Sketch", thickness=1.0))
+    assert key != canonical(part_3d.WirePart("wire", "Sketch", thickness=2.0))
+    wire.serial_stl = SerialBlob(b"built")
+    assert key == canonical(wire)
+    assert canonical({"b": 1, "a": [1, 2]}) == canonical({"a": [1, 2], "b": 1})
+
+
+def test_geometry_cache_eviction(tmp_path):
+    cache = GeometryCache(str(tmp_path), max_bytes=10 ** 6)
+    assert cache.get("a") is None
+    geo = Geo3DData()
+    geo.serial_fcdoc = SerialBlob(os.urandom(4 * 10 ** 5))
+    cache.put("a", geo)
+    cache.put("b", geo)
+    assert cache.get("a").serial_fcdoc == geo.serial_fcdoc  # a is now most recent
+    cache.put("c", geo)
+    assert "a" in cache and "b" not in cache and "c" in cache
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["evictions"] == 1
+    assert stats["entries"] == 2
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+
+
+def test_build_with_cache(datadir, tmp_path):
+    cache = GeometryCache(str(tmp_path))
+    big = part_3d.ExtrudePart("big", "Sketch", z0=-4, thickness=8)
+    file_path = os.path.join(datadir, "simple.FCStd")
+    geo1 = build_3d_geometry(input_parts=[big], input_file=file_path, cache=cache)
+    geo2 = build_3d_geometry(input_parts=[big], input_file=file_path, cache=cache)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert geo2.parts["big"].serial_stp == geo1.parts["big"].serial_stp
@@ -1,5 +1,6 @@
-from qmt.geometry import part_3d, build_3d_geometry
+from qmt.geometry import part_3d, build_3d_geometry, VoxelPartMap
 import numpy as np
+import pickle
 import os
 import FreeCAD
 
@@ -84,3 +85,71 @@ def test_simple_xsection(datadir):
         (10.0, -4.0),
         (10.0, 4.0),
     }
+
+
+def test_contains_points(datadir):
+    small1 = part_3d.ExtrudePart("small1", "Sketch001", z0=-2, thickness=2)
+    big = part_3d.ExtrudePart("big", "Sketch", z0=-4, thickness=8)
+    file_path = os.path.join(datadir, "simple.FCStd")
+    geo_data = build_3d_geometry(
+        input_parts=[small1, big],
+        input_file=file_path,
+        xsec_dict={"test_xsec": {"axis": (1, 0, 0), "distance": 0}},
+    )
+
+    points = np.array([[[0.0, 0.0, -1.0], [0.0, 0.0, 3.0], [100.0, 0.0, 0.0]]])
+    assert geo_data.contains_points("small1", points).tolist() == [[True, False, False]]
+    assert geo_data.contains_points("big", points).tolist() == [[False, True, False]]
+
+    # Solids are cached across xsec_to_2d calls, but not pickled
+    geo_data.xsec_to_2d("test_xsec")
+    assert set(geo_data._solids) == {"small1", "big"}
+    assert pickle.loads(pickle.dumps(geo_data))._solids == {}
+
+    # Storing a document or removing a part drops the stale solids
+    geo_data.remove_part("small1")
+    assert set(geo_data._solids) == {"big"}
+    assert geo_data.build_order == ["big"]
+    geo_data.set_data("fcdoc", geo_data.get_data("fcdoc"))
+    FreeCAD.closeDocument("instance")
+    assert geo_data._solids == {}
+
+def test_voxel_part_map(datadir, tmp_path):
+    small1 = part_3d.ExtrudePart("small1", "Sketch001", z0=-2, thickness=2)
+    big = part_3d.ExtrudePart("big", "Sketch", z0=-4, thickness=8)
+    file_path = os.path.join(datadir, "simple.FCStd")
+    geo_data = build_3d_geometry(input_parts=[small1, big], input_file=file_path)
+
+    voxel_map = geo_data.voxel_part_map(grid_size=16)
+    assert voxel_map.partIds == ["small1", "big"]
+    assert geo_data.voxel_part_map(grid_size=16) is voxel_map
+    points = np.array([[0.0, 0.0, -1.0], [0.0, 0.0, 3.0], [100.0, 0.0, 0.0]])
+    assert voxel_map(points).tolist() == ["small1", "big", None]
+
+    # Points near the surfaces are checked exactly
+    bb = np.array(voxel_map.labels.shape) * voxel_map.spacing
+    grid_points = voxel_map.origin + np.random.rand(200, 3) * bb
+    expected = np.full(len(grid_points), 2)
+    for i, name in reversed(list(enumerate(voxel_map.partIds))):
+        expected[geo_data.contains_points(name, grid_points)] = i
+    assert voxel_map.locate(grid_points).tolist() == expected.tolist()
+
+    voxel_map.save(str(tmp_path / "voxels"))
+    loaded = VoxelPartMap.load(str(tmp_path / "voxels"))
+    assert isinstance(loaded.labels, np.memmap)
+    assert loaded.locate(grid_points).tolist() == expected.tolist()
+    assert list(pickle.loads(pickle.dumps(geo_data)).voxel_maps) == list(
+        geo_data.voxel_maps
+    )
+
+
+def test_unpickle_old_part():
+    part = part_3d.ExtrudePart("block", "Sketch", thickness=1.0)
+    state = vars(part).copy()
+    del state["serial_brep"], state["mesh_options"]
+    # Parts pickled before lazy exports lack the BRep attributes
+    old_part = part_3d.ExtrudePart.__new__(part_3d.ExtrudePart)
+    old_part.__dict__.update(state)
+    restored = pickle.loads(pickle.dumps(old_part))
+    assert restored.serial_brep is None and restored.mesh_options is None
+    assert restored.thickness == 1.0
@@ -10,6 +10,21 @@ import tempfile
 from qmt.geometry import part_3d, build_3d_geometry
 
 
+def assert_same_geometry(geo, reference, dir_path):
+    """Check that the STEP exports of two builds have the same parts and solids."""
+    import Part
+
+    assert list(geo.parts) == list(reference.parts)
+    file_path = os.path.join(dir_path, "part.stp")
+    for label in reference.parts:
+        shape, ref_shape = (
+            Part.read(g.parts[label].write_stp(file_path)) for g in (geo, reference)
+        )
+        assert np.isclose(shape.Volume, ref_shape.Volume)
+        # Equal volumes that fully overlap make equal solids
+        assert np.isclose(shape.common(ref_shape).Volume, ref_shape.Volume)
+
+
 def test_geo_task(datadir):
     """
     Tests the build geometry task. For now, just verifies that the build doesn't encounter errors.
@@ -59,3 +74,157 @@ def test_geo_task(datadir):
             file_name = os.path.join(temp_dir_path, f"{i}.fcstd")
             result.write_fcstd(file_name)
             # TODO: should find a meaningful test here
+
+
+def test_geo_sweep(datadir, tmp_path):
+    """
+    Tests the parallel geometry sweep against serial builds.
+    """
+    from qmt.geometry import build_3d_geometry_sweep
+
+    block1 = part_3d.ExtrudePart("Parametrised block", "Sketch", thickness=5.0, z0=-2.5)
+    block2 = part_3d.ExtrudePart("Two blocks", "Sketch001", thickness=0.5)
+    input_file_path = os.path.join(datadir, "geometry_test.fcstd")
+    d1_values = np.linspace(2.0, 7.0, 3)
+
+    results = {}
+    for i, params, geo in build_3d_geometry_sweep(
+        input_parts=[block1, block2],
+        input_file=input_file_path,
+        param_grid={"d1": d1_values},
+        n_workers=2,
+        max_pending=2,
+    ):
+        assert params == {"d1": d1_values[i]}
+        results[i] = geo
+    assert sorted(results) == [0, 1, 2]
+    for i, d1 in enumerate(d1_values):
+        serial_geo = build_3d_geometry(
+            input_parts=[block1, block2], input_file=input_file_path, params={"d1": d1}
+        )
+        assert_same_geometry(results[i], serial_geo, str(tmp_path))
+
+
+def test_geo_incremental(datadir, tmp_path, monkeypatch):
+    """
+    Tests that rebuilds with a PartBuildCache reuse unchanged parts.
+    """
+    from qmt.geometry.freecad import objectConstruction
+    from qmt.geometry.freecad.buildCache import PartBuildCache
+
+    built_labels = []
+    build_extrude = objectConstruction.build_extrude
+
+    def recording_build_extrude(part):
+        built_labels.append(part.label)
+        return build_extrude(part)
+
+    monkeypatch.setattr(objectConstruction, "build_extrude", recording_build_extrude)
+
+    block1 = part_3d.ExtrudePart("Parametrised block", "Sketch", thickness=5.0, z0=-2.5)
+    block2 = part_3d.ExtrudePart("Two blocks", "Sketch001", thickness=0.5)
+    input_file_path = os.path.join(datadir, "geometry_test.fcstd")
+    build_cache = PartBuildCache()
+
+    def build(d1):
+        return build_3d_geometry(
+            input_parts=[block1, block2],
+            input_file=input_file_path,
+            params={"d1": d1},
+            build_cache=build_cache,
+        )
+
+    first = build(2.0)
+    assert built_labels == ["Parametrised block", "Two blocks"]
+    misses = build_cache.stats()["misses"]
+    assert misses > 0
+    del built_labels[:]
+    second = build(2.0)
+    assert not built_labels
+    assert build_cache.stats()["misses"] == misses
+    for label, part in first.parts.items():
+        assert second.parts[label].serial_stp == part.serial_stp
+
+    # d1 only drives the sketch of the parametrised block
+    changed = build(7.0)
+    assert built_labels == ["Parametrised block"]
+    assert build_cache.stats()["misses"] > misses
+    del built_labels[:]
+    reference = build_3d_geometry(
+        input_parts=[block1, block2], input_file=input_file_path, params={"d1": 7.0}
+    )
+    assert built_labels == ["Parametrised block", "Two blocks"]
+    assert_same_geometry(changed, reference, str(tmp_path))
+
+
+def test_geo_litho_workers(datadir, tmp_path):
+    """
+    Tests that the parallel lithography scheduler reproduces the serial build.
+    """
+    substrate = part_3d.ExtrudePart("Substrate", "Sketch005", z0=-2, thickness=2)
+    wrap = part_3d.LithographyPart(
+        "First Layer",
+        "Sketch006",
+        z0=0,
+        layer_num=1,
+        thickness=4,
+        litho_base=[substrate],
+    )
+    wrap2 = part_3d.LithographyPart(
+        "Second Layer", "Sketch007", layer_num=2, thickness=1
+    )
+    input_file_path = os.path.join(datadir, "geometry_test.fcstd")
+    build_order = [substrate, wrap, wrap2]
+
+    serial_geo = build_3d_geometry(input_parts=build_order, input_file=input_file_path)
+    parallel_geo = build_3d_geometry(
+        input_parts=build_order, input_file=input_file_path, litho_workers=2
+    )
+    assert_same_geometry(parallel_geo, serial_geo, str(tmp_path))
+    for part in parallel_geo.parts.values():
+        assert len(part.serial_stl) > 0
+
+
+def test_geo_export_modes(datadir, tmp_path):
+    """
+    Tests parallel and lazy part exports and the multi-part export.
+    """
+    block1 = part_3d.ExtrudePart("Parametrised block", "Sketch", thickness=5.0, z0=-2.5)
+    block2 = part_3d.ExtrudePart("Two blocks", "Sketch001", thickness=0.5)
+    input_file_path = os.path.join(datadir, "geometry_test.fcstd")
+
+    parallel_geo = build_3d_geometry(
+        input_parts=[block1, block2], input_file=input_file_path, export_workers=2
+    )
+    lazy_geo = build_3d_geometry(
+        input_parts=[block1, block2], input_file=input_file_path, lazy_export=True
+    )
+    for label, part in parallel_geo.parts.items():
+        assert len(part.serial_stl) > 0 and len(part.serial_stp) > 0
+        lazy_part = lazy_geo.parts[label]
+        assert lazy_part.serial_stp is None and lazy_part.serial_brep
+        assert os.path.getsize(lazy_part.write_stp(str(tmp_path / "part.stp"))) > 0
+        assert lazy_part.serial_stp is not None
+
+    for geo in (parallel_geo, lazy_geo):
+        path = geo.write_stp(str(tmp_path / "all.stp"))
+        with open(path) as f:
+            contents = f.read()
+        assert all(label in contents for label in geo.parts)
+        assert os.path.getsize(geo.write_stl(str(tmp_path / "all.stl"))) > 0
+
+    # Lazy exports use the tessellation options of the build
+    mesh_options = {"binary": False}
+    ascii_geo = build_3d_geometry(
+        input_parts=[block1, block2],
+        input_file=input_file_path,
+        lazy_export=True,
+        mesh_options=mesh_options,
+    )
+    assert ascii_geo.mesh_options == mesh_options
+    for part in ascii_geo.parts.values():
+        assert part.mesh_options == mesh_options
+        with open(part.write_stl(str(tmp_path / "part.stl"))) as f:
+            assert f.read().startswith("solid")
+    with open(ascii_geo.write_stl(str(tmp_path / "all.stl"))) as f:
+        assert f.read().startswith("solid")
@@ -0,0 +1,138 @@
+import io
+import logging
+import struct
+import numpy as np
+from qmt.geometry import read_gds, layout_to_geo2d
+
+
+def _real8(value):
+    # GDSII excess-64 base-16 floating point
+    if value == 0:
+        return b"\0" * 8
+    exponent = 64
+    mantissa = abs(value)
+    while mantissa >= 1:
+        mantissa /= 16
+        exponent += 1
+    while mantissa < 1 / 16:
+        mantissa *= 16
+        exponent -= 1
+    bits = ((value < 0) << 63) | (exponent << 56) | int(round(mantissa * 2 ** 56))
+    return struct.pack(">Q", bits)
+
+
+def _record(rectype, datatype, body=b""):
+    return struct.pack(">HBB", len(body) + 4, rectype, datatype) + body
+
+
+def _ascii(rectype, text):
+    data = text.encode()
+    return _record(rectype, 6, data + b"\0" * (len(data) % 2))
+
+
+def _int16(rectype, *values):
+    return _record(rectype, 2, struct.pack(f">{len(values)}h", *values))
+
+
+def _xy(points):
+    flat = [int(c) for point in points for c in point]
+    return _record(0x10, 3, struct.pack(f">{len(flat)}i", *flat))
+
+
+def _boundary(layer, points):
+    points = list(points) + [points[0]]
+    return (
+        _record(0x08, 0)
+        + _int16(0x0D, layer)
+        + _int16(0x0E, 0)
+        + _xy(points)
+        + _record(0x11, 0)
+    )
+
+
+def _gds_file():
+    """Write a library with a cell that places an array of squares and a gate."""
+    square = [(0, 0), (100, 0), (100, 100), (0, 100)]
+    stream = _int16(0x00, 600) + _int16(0x01, *([0] * 12)) + _ascii(0x02, "LIB")
+    stream += _record(0x03, 5, _real8(1e-3) + _real8(1e-9))
+    stream += _int16(0x05, *([0] * 12)) + _ascii(0x06, "SQUARE")
+    stream += _boundary(1, square) + _record(0x07, 0)
+    stream += _int16(0x05, *([0] * 12)) + _ascii(0x06, "TOP")
+    # 3 x 2 array of squares with 200 nm pitch
+    stream += _record(0x0B, 0) + _ascii(0x12, "SQUARE") + _int16(0x13, 3, 2)
+    stream += _xy([(0, 0), (600, 0), (0, 400)]) + _record(0x11, 0)
+    # Mirrored and rotated single placement
+    stream += _record(0x0A, 0) + _ascii(0x12, "SQUARE")
+    stream += _int16(0x1A, -0x8000) + _record(0x1C, 5, _real8(90.0))
+    stream += _xy([(1000, 0)]) + _record(0x11, 0)
+    # Two overlapping gate polygons and a path on layer 2
+    stream += _boundary(2, [(0, 500), (300, 500), (300, 600), (0, 600)])
+    stream += _boundary(2, [(200, 500), (500, 500), (500, 600), (200, 600)])
+    stream += _record(0x09, 0) + _int16(0x0D, 3) + _int16(0x0E, 0)
+    stream += _record(0x0F, 3, struct.pack(">i", 20)) + _xy([(0, 800), (400, 800)])
+    stream += _record(0x11, 0) + _record(0x07, 0) + _record(0x04, 0)
+    return io.BytesIO(stream)
+
+
+def _single_cell_file(*elements):
+    stream = _int16(0x00, 600) + _int16(0x01, *([0] * 12)) + _ascii(0x02, "LIB")
+    stream += _record(0x03, 5, _real8(1e-3) + _real8(1e-9))
+    stream += _int16(0x05, *([0] * 12)) + _ascii(0x06, "SQUARE")
+    stream += _boundary(1, [(0, 0), (100, 0), (100, 100), (0, 100)])
+    stream += _record(0x07, 0) + _int16(0x05, *([0] * 12)) + _ascii(0x06, "TOP")
+    stream += b"".join(elements) + _record(0x07, 0) + _record(0x04, 0)
+    return io.BytesIO(stream)
+
+
+def test_read_gds():
+    library = read_gds(_gds_file())
+    assert library.name == "LIB"
+    assert np.isclose(library.db_unit, 1e-9)
+    assert library.top_cells() == ["TOP"]
+    assert library.layers() == [(1, 0), (2, 0), (3, 0)]
+    flat = library.flatten()
+    assert sorted(flat) == [(1, 0), (2, 0), (3, 0)]
+    assert len(flat[(1, 0)]) == 7
+    # Reflection about x, then a rotation by 90 degrees maps (x, y) to (y, x)
+    placed = flat[(1, 0)][-1]
+    assert set(map(tuple, np.round(placed))) == {
+        (1000, 0),
+        (1000, 100),
+        (1100, 0),
+        (1100, 100),
+    }
+
+
+def test_layout_to_geo2d():
+    library = read_gds(_gds_file())
+    geo = layout_to_geo2d(library, layer_names={2: "gate"})
+    assert len([n for n in geo.parts if n.startswith("layer_1_0")]) == 7
+    assert np.isclose(geo.parts["gate"].area, 500 * 100)
+    assert np.isclose(geo.parts["layer_3_0"].area, 400 * 20)
+
+    geo_um = layout_to_geo2d(library, layers=[(2, 0)], lunit="um", merge=False)
+    assert sorted(geo_um.parts) == ["layer_2_0_0", "layer_2_0_1"]
+    assert np.isclose(geo_um.parts["layer_2_0_0"].area, 0.3 * 0.1)
+
+
+def test_read_gds_path_extensions():
+    # Path type 4 extends the start by 10 and the end by 30 database units
+    path = _record(0x09, 0) + _int16(0x0D, 3) + _int16(0x0E, 0)
+    path += _int16(0x21, 4) + _record(0x0F, 3, struct.pack(">i", 20))
+    path += _record(0x30, 3, struct.pack(">i", 10))
+    path += _record(0x31, 3, struct.pack(">i", 30))
+    path += _xy([(0, 0), (400, 0)]) + _record(0x11, 0)
+    (outline,) = read_gds(_single_cell_file(path)).flatten("TOP")[(3, 0)]
+    assert np.isclose(outline[:, 0].min(), -10)
+    assert np.isclose(outline[:, 0].max(), 430)
+    geo = layout_to_geo2d(read_gds(_single_cell_file(path)), cell="TOP")
+    assert np.isclose(geo.parts["layer_3_0"].area, 440 * 20)
+
+
+def test_read_gds_absolute_transform(caplog):
+    caplog.set_level(logging.WARNING)
+    ref = _record(0x0A, 0) + _ascii(0x12, "SQUARE") + _int16(0x1A, 0x0006)
+    ref += _record(0x1B, 5, _real8(2.0)) + _xy([(0, 0)]) + _record(0x11, 0)
+    flat = read_gds(_single_cell_file(ref)).flatten("TOP")
+    assert "Absolute magnification or angle in cell TOP" in caplog.text
+    assert np.isclose(np.ptp(flat[(1, 0)][-1][:, 0]), 200)
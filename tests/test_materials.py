@@ -136,3 +136,31 @@ def test_effective_mass():
     assert inas.hole_mass("heavy", "dos") == approx(0.41, rel=0.2)
     assert inas.hole_mass("light", "dos") == approx(0.026, rel=0.2)
     assert inas.hole_mass("dos", "dos") == approx(0.41, rel=0.2)
+
+
+def test_alloy_cache():
+    """Test that cached alloys are evicted and invalidated by database changes."""
+    matlib = materials.Materials(cacheSize=2)
+    alloy = matlib.find("InAs80Sb20", eunit="eV")
+    assert matlib.find("InAs80Sb20")["electronMass"] == alloy["electronMass"]
+    # Materials don't share their properties with the cache
+    alloy["electronMass"] = 1.0
+    assert matlib.find("InAs80Sb20")["electronMass"] != 1.0
+    matlib.find("InAs70Sb30")
+    matlib.find("InAs60Sb40")
+    assert list(matlib._alloyCache) == ["InAs70Sb30", "InAs60Sb40"]
+
+    mass = matlib.find("InAs60Sb40")["electronMass"]
+    matlib.set_bowing_parameters("InAs", "InSb", "semi", electronMass=0.0)
+    x = 0.4
+    inas, insb = matlib["InAs"], matlib["InSb"]
+    linear = (1 - x) * inas["electronMass"] + x * insb["electronMass"]
+    assert matlib.find("InAs60Sb40")["electronMass"] == approx(linear)
+    assert matlib.find("InAs60Sb40")["electronMass"] != approx(mass)
+
+    matlib.add_material("InAs", "semi", electronMass=0.1)
+    assert matlib.find("InAs60Sb40")["electronMass"] == approx(
+        0.6 * 0.1 + 0.4 * matlib["InSb"]["electronMass"]
+    )
+    matlib["InSb"] = matlib["InAs"]
+    assert matlib.find("InAs60Sb40")["electronMass"] == approx(0.1)
@@ -1,6 +1,17 @@
 import numpy as np
 
-from qmt.geometry import PropertyMap, MaterialPropertyMap
+import pytest
+
+from shapely.geometry import Polygon, box
+
+from qmt.geometry import (
+    Geo2DData,
+    Geo2DPartMap,
+    PropertyMap,
+    MaterialPropertyMap,
+    MultiMaterialPropertyMap,
+    PartIndexer,
+)
 from qmt.materials import Materials
 
 
@@ -78,3 +89,108 @@ def test_materials_property_map():
     assert np.all(
         prop_map2(-np.ones((2, 3))) == mat_lib.find("InAs", "eV")["directBandGap"]
     )
+
+
+def test_property_map_chunked():
+    str_map = DummyPartMap(["part1", "part2"])
+    props = {"part1": 1, "part2": 1.5}
+    prop_map = PropertyMap(str_map, lambda p: props[p])
+    x = np.linspace(-1.0, 1.0, 30).reshape(5, 2, 3)
+    result = prop_map(x, chunk_size=4)
+    assert result.shape == (5, 2)
+    assert result.dtype == np.float64
+    assert np.all(result == prop_map(x))
+
+
+def test_compiled_materials_property_map():
+    str_map = DummyPartMap(["part1", "part2"])
+    part_materials = {"part1": "InAs", "part2": "Al"}
+    mat_lib = Materials(matDict={})
+    mat_lib.add_material("InAs", "semi", electronMass=0.026, relativePermittivity=15.15)
+    mat_lib.add_material("Al", "metal", workFunction=4280.0)
+
+    mass_map = MaterialPropertyMap(
+        str_map, part_materials, mat_lib, "electronMass", compiled=True
+    )
+    eps_map = MaterialPropertyMap(
+        str_map,
+        part_materials,
+        mat_lib,
+        "relativePermittivity",
+        fill_value=1.0,
+        part_indexer=mass_map.partIndexer,
+    )
+    x = np.array([[-1.0, 0.0, 0.0], [1.0, 0.0, 0.0], [-2.0, 0.0, 0.0]])
+    index = mass_map.part_index(x)
+    assert index.tolist() == [0, 1, 0]
+    assert index.dtype == np.uint8
+    assert eps_map.from_index(index).tolist() == [15.15, 1.0, 15.15]
+    assert np.all(eps_map(x, chunk_size=2) == eps_map.from_index(index))
+    assert mass_map.from_index(index).tolist() == [0.026, 1.0, 0.026]
+    strict_eps_map = MaterialPropertyMap(
+        str_map, part_materials, mat_lib, "relativePermittivity", compiled=True
+    )
+    assert strict_eps_map.from_index(index[[0, 2]]).tolist() == [15.15, 15.15]
+    with pytest.raises(KeyError):
+        strict_eps_map(x)
+
+    indexer = PartIndexer(str_map, ["part2"])
+    assert indexer.encode(np.array(["part1", "part2"])).tolist() == [1, 0]
+
+
+def test_multi_material_property_map():
+    str_map = DummyPartMap(["part1", "part2"])
+    part_materials = {"part1": "InAs", "part2": "Al"}
+    mat_lib = Materials(matDict={})
+    mat_lib.add_material("InAs", "semi", electronMass=0.026, relativePermittivity=15.15)
+    mat_lib.add_material("Al", "metal", workFunction=4280.0)
+
+    prop_map = MultiMaterialPropertyMap(
+        str_map,
+        part_materials,
+        mat_lib,
+        ["electronMass", "relativePermittivity"],
+        fill_value={"relativePermittivity": 1.0},
+    )
+    x = np.array([[-1.0, 0.0, 0.0], [1.0, 0.0, 0.0], [-2.0, 0.0, 0.0]])
+    props = prop_map(x, chunk_size=2)
+    assert props["electronMass"].tolist() == [0.026, 1.0, 0.026]
+    assert props["relativePermittivity"].tolist() == [15.15, 1.0, 15.15]
+    table = prop_map(x, structured=True)
+    assert table.shape == (3,)
+    assert table["relativePermittivity"].tolist() == [15.15, 1.0, 15.15]
+    assert prop_map(x[0])["electronMass"] == 0.026
+
+    strict_map = MultiMaterialPropertyMap(
+        str_map, part_materials, mat_lib, ["relativePermittivity"]
+    )
+    with pytest.raises(KeyError):
+        strict_map(x)
+
+
+def test_geo_2d_part_map():
+    geo = Geo2DData()
+    geo.add_part("gate", box(1.0, 1.0, 2.0, 2.0))
+    geo.add_part("substrate", box(0.0, 0.0, 4.0, 4.0))
+    geo.add_part("island", Polygon([(5, 0), (6, 0), (6, 1)]))
+    part_map = Geo2DPartMap(geo)
+    assert part_map.partIds == ["gate", "substrate", "island"]
+
+    x = np.array([[1.5, 1.5], [3.0, 3.0], [-1.0, 0.0], [5.9, 0.5], [2.0, 1.5]])
+    # Overlaps go to the first part in build order, boundaries belong to parts
+    assert part_map.locate(x).tolist() == [0, 1, 3, 2, 0]
+    assert part_map(x).tolist() == ["gate", "substrate", None, "island", "gate"]
+    assert part_map([3.0, 3.0, 7.0]) == "substrate"
+    assert part_map(x.reshape(5, 1, 2)).shape == (5, 1)
+    for grid_size in [None, 3]:
+        exact_map = Geo2DPartMap(geo, grid_size=grid_size)
+        assert exact_map.locate(x).tolist() == [0, 1, 3, 2, 0]
+
+    prop_map = PropertyMap(part_map, {"gate": 1.0, "substrate": 2.0}.get)
+    assert prop_map(x[:2]).tolist() == [1.0, 2.0]
+    assert prop_map(x[:2], chunk_size=1).tolist() == [1.0, 2.0]
+    assert prop_map([3.0, 3.0]) == 2.0
+
+    indexer = PartIndexer(part_map, ["substrate", "gate"])
+    assert indexer(x).tolist() == [1, 0, 2, 2, 1]
+    assert indexer(x[0]) == 1